@@ -0,0 +1,77 @@
+"""
+Compare query plans for date-filtered appointment lookups.
+
+Loads synthetic appointments inside a transaction that is rolled back at the
+end, then runs EXPLAIN ANALYZE for the old `start_time__date` filter (which
+casts the column) and the half-open range used by `Appointment.objects.on_date`.
+
+    $ docker compose run web python -m benchmarks.appointment_date_filter --rows 1000000
+"""
+import argparse
+import datetime
+
+from benchmarks.common import setup_django, timed
+
+setup_django()
+
+from django.db import connection, transaction  # noqa: E402
+from moxie_medspa.models import Medspa, Appointment  # noqa: E402
+
+FIRST_START_TIME = datetime.datetime(2022, 1, 1, 8, tzinfo=datetime.timezone.utc)
+
+
+def load_appointments(rows, medspa_count):
+    medspa_ids = [
+        str(Medspa.objects.create(name=f'Benchmark Medspa {i}', address='', phone_number='', email_address='bench@joinmoxie.com').id)
+        for i in range(medspa_count)
+    ]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            '''
+            INSERT INTO moxie_medspa_appointment (id, start_time, total_duration, total_price, status, medspa_id)
+            SELECT gen_random_uuid(),
+                   %s + i * interval '1 minute',
+                   60,
+                   100,
+                   (ARRAY['scheduled', 'completed', 'canceled'])[1 + i %% 3],
+                   (%s::uuid[])[1 + i %% %s]
+            FROM generate_series(0, %s - 1) AS i
+            ''',
+            [FIRST_START_TIME, medspa_ids, medspa_count, rows],
+        )
+        cursor.execute('ANALYZE moxie_medspa_appointment')
+    return medspa_ids
+
+def scan_nodes(plan):
+    return [line.strip().lstrip('-> ') for line in plan.splitlines() if 'Scan' in line]
+
+def report(label, queryset):
+    plan = queryset.explain(analyze=True)
+    elapsed, _ = timed(lambda: list(queryset.values_list('id', flat=True)))
+    print(f'{label}: {elapsed:.2f} ms')
+    for node in scan_nodes(plan):
+        print(f'    {node}')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--medspas', type=int, default=10)
+    args = parser.parse_args()
+
+    with transaction.atomic():
+        medspa_ids = load_appointments(args.rows, args.medspas)
+        day = (FIRST_START_TIME + datetime.timedelta(minutes=args.rows // 2)).date()
+        print(f'{args.rows} appointments across {args.medspas} medspas, filtering on {day}\n')
+
+        report('start_time__date (cast)', Appointment.objects.filter(start_time__date=day))
+        report('on_date (range)', Appointment.objects.on_date(day))
+        report('medspa + start_time__date (cast)', Appointment.objects.filter(medspa_id=medspa_ids[0], start_time__date=day))
+        report('medspa + on_date (range)', Appointment.objects.filter(medspa_id=medspa_ids[0]).on_date(day))
+        report('status + start_time__date (cast)', Appointment.objects.filter(status='scheduled', start_time__date=day))
+        report('status + on_date (range)', Appointment.objects.filter(status='scheduled').on_date(day))
+
+        transaction.set_rollback(True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+Time the availableSlots search for one busy medspa.
+
+Books `--appointments` random appointments into a `--days` window for a single
+medspa (inside a transaction that is rolled back at the end) and measures
+find_available_slots() over the whole window.
+
+    $ docker compose run web python -m benchmarks.availability --appointments 5000 --days 7
+"""
+import argparse
+import datetime
+import random
+
+from benchmarks.common import setup_django, timed
+
+setup_django()
+
+from django.db import connection, transaction  # noqa: E402
+from django.test.utils import CaptureQueriesContext  # noqa: E402
+from moxie_medspa.availability import find_available_slots  # noqa: E402
+from moxie_medspa.models import Medspa, Service, Appointment  # noqa: E402
+
+WINDOW_START = datetime.datetime(2024, 9, 2, tzinfo=datetime.timezone.utc)
+
+
+def book_appointments(medspa, count, days, seed):
+    rng = random.Random(seed)
+    minutes = days * 24 * 60
+    Appointment.objects.bulk_create(
+        [
+            Appointment(
+                start_time=WINDOW_START + datetime.timedelta(minutes=rng.randrange(minutes)),
+                total_duration=rng.choice([15, 30, 45, 60]),
+                total_price=100,
+                status=rng.choice(['scheduled', 'scheduled', 'scheduled', 'canceled']),
+                medspa=medspa,
+            )
+            for _ in range(count)
+        ],
+        batch_size=5000,
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--appointments', type=int, default=5000)
+    parser.add_argument('--days', type=int, default=7)
+    parser.add_argument('--granularity', type=int, default=15)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    with transaction.atomic():
+        medspa = Medspa.objects.create(name='Benchmark Medspa', address='', phone_number='', email_address='bench@joinmoxie.com')
+        services = [
+            Service.objects.create(name=f'Service {i}', description='', price=100, duration=duration, medspa=medspa)
+            for i, duration in enumerate([15, 30])
+        ]
+        book_appointments(medspa, args.appointments, args.days, args.seed)
+
+        window_end = WINDOW_START + datetime.timedelta(days=args.days)
+        search = lambda: find_available_slots(  # noqa: E731
+            medspa.id, [service.id for service in services], WINDOW_START, window_end,
+            datetime.timedelta(minutes=args.granularity),
+        )
+
+        with CaptureQueriesContext(connection) as queries:
+            search()
+        elapsed, slots = timed(search)
+
+        print(f'{args.appointments} appointments over {args.days} days, {args.granularity} minute granularity')
+        print(f'{len(slots)} free slots in {elapsed:.2f} ms ({len(queries)} SQL queries)')
+
+        transaction.set_rollback(True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,18 @@
+import os
+import time
+
+
+def setup_django():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'moxie_medspa.settings')
+    import django
+    django.setup()
+
+def timed(fn, repeat=5):
+    # Best-of-N wall time in milliseconds, plus the last result.
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        elapsed = (time.perf_counter() - started) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
@@ -0,0 +1,130 @@
+"""
+Per-request latency of allMedspas with and without connection pooling.
+
+Sends `--requests` allMedspas queries per mode through Django's WSGI handler
+from `--threads` threads, so every request ends the way it does under a real
+server: request_finished closes the connection, or hands it back to the pool.
+The response cache is cleared before every request so each one reads the
+database. Only the medspas already in the database are read; nothing is
+written.
+
+    none        a new connection per request (no pool, CONN_MAX_AGE = 0)
+    persistent  one connection per thread kept open (CONN_MAX_AGE = 600)
+    pool        the psycopg_pool pool configured in settings.DATABASES
+
+    $ docker compose run web python -m benchmarks.connection_pool --requests 2000 --threads 8
+"""
+import argparse
+import io
+import json
+import logging
+import math
+import threading
+import time
+
+from benchmarks.common import setup_django
+
+setup_django()
+
+from django.core.handlers.wsgi import WSGIHandler  # noqa: E402
+from django.db import connections  # noqa: E402
+from moxie_medspa.response_cache import response_cache  # noqa: E402
+from moxie_medspa.views import database_pool_stats  # noqa: E402
+
+MODES = ['none', 'persistent', 'pool']
+QUERY = json.dumps({'query': 'query { allMedspas(first: 20) { edges { node { id name } } } }'}).encode()
+POOL_OPTIONS = connections.settings['default']['OPTIONS'].get('pool') or {}
+
+
+def configure(mode):
+    connections['default'].close_pool()
+    settings_dict = connections.settings['default']
+    settings_dict['OPTIONS'] = {**settings_dict['OPTIONS'], 'pool': POOL_OPTIONS if mode == 'pool' else False}
+    settings_dict['CONN_MAX_AGE'] = 600 if mode == 'persistent' else 0
+
+def make_environ():
+    return {
+        'REQUEST_METHOD': 'POST',
+        'PATH_INFO': '/graphql/',
+        'SERVER_NAME': 'localhost',
+        'SERVER_PORT': '80',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'HTTP_HOST': 'localhost',
+        'CONTENT_TYPE': 'application/json',
+        'CONTENT_LENGTH': str(len(QUERY)),
+        'wsgi.input': io.BytesIO(QUERY),
+        'wsgi.url_scheme': 'http',
+        'wsgi.errors': io.StringIO(),
+    }
+
+def send_request(handler):
+    statuses = []
+    response = handler(make_environ(), lambda status, headers: statuses.append(status))
+    try:
+        body = b''.join(response)
+    finally:
+        response.close()  # sends request_finished
+    if not statuses[0].startswith('200') or b'"errors"' in body:
+        raise Exception(f'allMedspas failed: {statuses[0]} {body[:200]!r}')
+
+def run_thread(handler, count, latencies):
+    try:
+        for _ in range(count):
+            response_cache.clear()
+            started = time.perf_counter()
+            send_request(handler)
+            latencies.append((time.perf_counter() - started) * 1000)
+    finally:
+        connections.close_all()
+
+def percentile(values, percent):
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(percent / 100 * len(ordered)) - 1)]
+
+def run_mode(mode, requests, thread_count, warmup):
+    configure(mode)
+    handler = WSGIHandler()
+    for _ in range(warmup):
+        run_thread(handler, 1, [])
+
+    latencies = []
+    threads = [
+        threading.Thread(target=run_thread, args=(handler, requests // thread_count, latencies))
+        for _ in range(thread_count)
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    pool_stats = database_pool_stats()
+    configure('none')
+    return latencies, elapsed, pool_stats
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=2000, help='Requests per mode, split across the threads.')
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--warmup', type=int, default=20)
+    parser.add_argument('--mode', action='append', choices=MODES, help='Only run these modes.')
+    args = parser.parse_args()
+
+    logging.getLogger('moxie_medspa.tracing').setLevel(logging.ERROR)
+    print(f'{args.requests} allMedspas requests per mode from {args.threads} threads\n')
+    print(f'{"mode":<12}{"req/s":>9}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}')
+    for mode in args.mode or MODES:
+        latencies, elapsed, pool_stats = run_mode(mode, args.requests, args.threads, args.warmup)
+        print(
+            f'{mode:<12}{len(latencies) / elapsed:>9.0f}{percentile(latencies, 50):>9.2f}'
+            f'{percentile(latencies, 95):>9.2f}{percentile(latencies, 99):>9.2f}'
+        )
+        if pool_stats:
+            print(
+                f'{"":<12}pool: {pool_stats["pool_size"]} connections opened {pool_stats["connections_num"]} times, '
+                f'{pool_stats.get("requests_queued", 0)} requests waited, avg wait {pool_stats["avg_wait_ms"]:.2f} ms'
+            )
+
+
+if __name__ == '__main__':
+    main()
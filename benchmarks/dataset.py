@@ -0,0 +1,139 @@
+"""
+Seeded synthetic dataset at a named scale factor.
+
+The same `--scale` and `--seed` always produce the same medspas, services and
+appointments (ids included), so runs on different branches are comparable.
+Rows are written with COPY on PostgreSQL and bulk_create elsewhere.
+
+    $ docker compose run web python -m benchmarks.dataset --scale s
+"""
+import argparse
+import csv
+import datetime
+import io
+import random
+import time
+import uuid
+from dataclasses import dataclass, field
+
+from benchmarks.common import setup_django
+
+setup_django()
+
+from django.db import connection, transaction  # noqa: E402
+from moxie_medspa.models import Medspa, Service, Appointment, DailyMedspaRollup, DailyServiceRollup  # noqa: E402
+from moxie_medspa.partitions import ensure_partitions, months_between  # noqa: E402
+from moxie_medspa.reporting import rebuild_rollups  # noqa: E402
+
+# name: (medspas, services per medspa, appointments)
+SCALE_FACTORS = {
+    'xs': (10, 5, 1_000),
+    's': (100, 10, 100_000),
+    'm': (300, 10, 1_000_000),
+    'l': (1_000, 20, 10_000_000),
+}
+FIRST_START_TIME = datetime.datetime(2024, 1, 1, 8, tzinfo=datetime.timezone.utc)
+DAYS = 365
+STATUSES = ['scheduled'] * 6 + ['completed'] * 3 + ['canceled']
+CHUNK_SIZE = 50_000
+
+
+@dataclass
+class Dataset:
+    scale: str
+    seed: int
+    medspa_ids: list = field(default_factory=list)
+    service_ids: dict = field(default_factory=dict)  # medspa id -> [service ids]
+    appointment_ids: list = field(default_factory=list)
+    fresh_appointment_ids: list = field(default_factory=list)  # filled in by benchmarks that need them
+
+
+def make_uuid(rng):
+    return uuid.UUID(int=rng.getrandbits(128), version=4)
+
+def write_rows(model, columns, rows):
+    if connection.vendor != 'postgresql':
+        model.objects.bulk_create([model(**dict(zip(columns, row))) for row in rows], batch_size=5000)
+        return
+    buffer = io.StringIO()
+    csv.writer(buffer, quoting=csv.QUOTE_ALL).writerows(rows)
+    with connection.cursor() as cursor:
+        with cursor.copy(f'COPY {model._meta.db_table} ({", ".join(columns)}) FROM STDIN WITH (FORMAT csv)') as copy:
+            copy.write(buffer.getvalue())
+
+def generate_dataset(scale='xs', seed=42, keep_appointment_ids=10_000):
+    """Insert the dataset for `scale` and return the ids benchmarks need.
+
+    Only the first `keep_appointment_ids` appointment ids are kept in memory.
+    """
+    medspa_count, services_per_medspa, appointment_count = SCALE_FACTORS[scale]
+    rng = random.Random(seed)
+    dataset = Dataset(scale, seed)
+
+    medspas = []
+    services = []
+    for i in range(medspa_count):
+        medspa_id = make_uuid(rng)
+        dataset.medspa_ids.append(medspa_id)
+        medspas.append((medspa_id, f'Medspa {i}', f'{i} Main St', '555-0100', f'medspa{i}@joinmoxie.com'))
+        dataset.service_ids[medspa_id] = []
+        for j in range(services_per_medspa):
+            service_id = make_uuid(rng)
+            dataset.service_ids[medspa_id].append(service_id)
+            services.append((service_id, f'Service {j}', '', rng.choice([50, 100, 150, 300]), rng.choice([15, 30, 45, 60]), medspa_id))
+    write_rows(Medspa, ['id', 'name', 'address', 'phone_number', 'email_address'], medspas)
+    write_rows(Service, ['id', 'name', 'description', 'price', 'duration', 'medspa_id'], services)
+    service_rows = {row[0]: row for row in services}
+
+    minutes = DAYS * 24 * 60
+    ensure_partitions(months_between(FIRST_START_TIME, FIRST_START_TIME + datetime.timedelta(minutes=minutes)))
+    link_model = Appointment.services.through
+    for chunk_start in range(0, appointment_count, CHUNK_SIZE):
+        appointments = []
+        links = []
+        for _ in range(min(CHUNK_SIZE, appointment_count - chunk_start)):
+            appointment_id = make_uuid(rng)
+            medspa_id = rng.choice(dataset.medspa_ids)
+            chosen = rng.sample(dataset.service_ids[medspa_id], rng.randint(1, min(3, services_per_medspa)))
+            start_time = FIRST_START_TIME + datetime.timedelta(minutes=rng.randrange(0, minutes, 15))
+            appointments.append((
+                appointment_id,
+                start_time.isoformat(),
+                sum(service_rows[service_id][4] for service_id in chosen),
+                sum(service_rows[service_id][3] for service_id in chosen),
+                rng.choice(STATUSES),
+                medspa_id,
+            ))
+            links.extend((appointment_id, service_id) for service_id in chosen)
+            if len(dataset.appointment_ids) < keep_appointment_ids:
+                dataset.appointment_ids.append(appointment_id)
+        write_rows(Appointment, ['id', 'start_time', 'total_duration', 'total_price', 'status', 'medspa_id'], appointments)
+        write_rows(link_model, ['appointment_id', 'service_id'], links)
+
+    rebuild_rollups()
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            for model in [Medspa, Service, Appointment, link_model, DailyMedspaRollup, DailyServiceRollup]:
+                cursor.execute(f'ANALYZE {model._meta.db_table}')
+    return dataset
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', choices=SCALE_FACTORS, default='xs')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--commit', action='store_true', help='Keep the rows instead of rolling back.')
+    args = parser.parse_args()
+
+    with transaction.atomic():
+        started = time.perf_counter()
+        dataset = generate_dataset(args.scale, args.seed)
+        elapsed = time.perf_counter() - started
+        medspas, services, appointments = SCALE_FACTORS[args.scale]
+        print(f'scale {args.scale}: {medspas} medspas, {medspas * services} services, {appointments} appointments in {elapsed:.1f}s')
+        print(f'first medspa: {dataset.medspa_ids[0]}')
+        transaction.set_rollback(not args.commit)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,325 @@
+"""
+Closed-loop HTTP load generator for /graphql/.
+
+Each of `--concurrency` virtual users keeps one keep-alive connection open and
+sends its next request as soon as the previous response arrives; with `--rps`
+the users share a pacer so the whole run issues at most that many requests per
+second. Operations are drawn from a weighted mix of the README examples:
+
+    catalog                 allMedspas / allServices / medspa
+    appointments_by_medspa  appointmentsByMedspa for one day
+    create_appointment      createAppointment at a random future time
+    update_status           updateAppointmentStatus on an appointment created by this run
+
+Reports throughput, p50/p95/p99 latency and errors per operation and, when the
+database is reachable from here, the number of open/active connections to it.
+Point it at any running server (runserver, gunicorn, uvicorn...):
+
+    $ docker compose run web python -m benchmarks.load --url http://web:8000/graphql/ --concurrency 32 --duration 30
+    $ docker compose run web python -m benchmarks.load --rps 200 --mix catalog=80,create_appointment=20 --json
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import math
+import random
+import time
+from collections import defaultdict
+from urllib.parse import urlsplit
+
+from benchmarks.common import setup_django
+
+DEFAULT_MIX = 'catalog=60,appointments_by_medspa=25,create_appointment=10,update_status=5'
+
+CATALOG_QUERIES = [
+    'query { allMedspas(first: 20) { edges { node { id name services { id name price } } } } }',
+    'query ($medspaId: UUID) { allServices(medspaId: $medspaId) { edges { node { id name price duration } } } }',
+    'query ($medspaId: UUID) { medspa(id: $medspaId) { id name services { id name } } }',
+]
+APPOINTMENTS_BY_MEDSPA_QUERY = '''
+    query ($medspaId: UUID, $date: Date) {
+        appointmentsByMedspa(medspaId: $medspaId, date: $date, first: 50) {
+            edges { node { id startTime totalDuration status services { name } } }
+        }
+    }
+'''
+CREATE_APPOINTMENT_MUTATION = '''
+    mutation ($medspaId: UUID!, $serviceIds: [UUID]!, $startTime: DateTime!) {
+        createAppointment(medspaId: $medspaId, serviceIds: $serviceIds, startTime: $startTime) {
+            appointment { id status }
+        }
+    }
+'''
+UPDATE_STATUS_MUTATION = '''
+    mutation ($appointmentId: UUID!, $status: String!) {
+        updateAppointmentStatus(appointmentId: $appointmentId, status: $status) { appointment { id status } }
+    }
+'''
+SETUP_QUERY = 'query { allMedspas(first: 100) { edges { node { id services { id } } } } }'
+
+
+class HttpConnection:
+    """Minimal HTTP/1.1 client on asyncio streams, enough for JSON POSTs."""
+
+    def __init__(self, url):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.path = parts.path or '/'
+        self.reader = self.writer = None
+
+    async def post_json(self, body):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        payload = json.dumps(body).encode()
+        self.writer.write(
+            f'POST {self.path} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\nContent-Type: application/json\r\n'
+            f'Content-Length: {len(payload)}\r\nConnection: keep-alive\r\n\r\n'.encode() + payload
+        )
+        await self.writer.drain()
+
+        status = int((await self.reader.readline()).split()[1])
+        headers = {}
+        while (line := await self.reader.readline()) not in (b'\r\n', b''):
+            name, _, value = line.decode().partition(':')
+            headers[name.strip().lower()] = value.strip()
+        if headers.get('transfer-encoding') == 'chunked':
+            content = b''
+            while size := int((await self.reader.readline()).strip(), 16):
+                content += await self.reader.readexactly(size)
+                await self.reader.readline()
+            await self.reader.readline()
+        elif 'content-length' in headers:
+            content = await self.reader.readexactly(int(headers['content-length']))
+        else:
+            content = await self.reader.read()
+        if headers.get('connection', '').lower() == 'close' or 'content-length' not in headers and 'transfer-encoding' not in headers:
+            await self.close()
+        return status, content
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = self.reader = None
+
+
+class Pacer:
+    """Hands out request start times `1 / rps` apart to every user."""
+
+    def __init__(self, rps):
+        self.interval = 1 / rps
+        self.next_start = time.perf_counter()
+
+    async def wait(self):
+        start, self.next_start = self.next_start, max(self.next_start, time.perf_counter()) + self.interval
+        delay = start - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class Workload:
+    def __init__(self, catalog, rng):
+        self.catalog = catalog  # [(medspa id, [service ids])]
+        self.rng = rng
+        self.booked = []
+
+    def next_request(self, operation):
+        medspa_id, service_ids = self.rng.choice(self.catalog)
+        if operation == 'catalog':
+            return {'query': self.rng.choice(CATALOG_QUERIES), 'variables': {'medspaId': medspa_id}}
+        if operation == 'appointments_by_medspa':
+            day = datetime.date.today() + datetime.timedelta(days=self.rng.randrange(-30, 30))
+            return {'query': APPOINTMENTS_BY_MEDSPA_QUERY, 'variables': {'medspaId': medspa_id, 'date': day.isoformat()}}
+        if operation == 'create_appointment':
+            # Anywhere in the next ten years on a 15 minute grid, so bookings rarely collide.
+            start_time = datetime.datetime.now(datetime.timezone.utc).replace(second=0, microsecond=0) + datetime.timedelta(
+                minutes=15 * self.rng.randrange(1, 10 * 365 * 96)
+            )
+            return {'query': CREATE_APPOINTMENT_MUTATION, 'variables': {
+                'medspaId': medspa_id, 'serviceIds': self.rng.sample(service_ids, 1), 'startTime': start_time.isoformat(),
+            }}
+        if operation == 'update_status' and self.booked:
+            appointment_id = self.booked.pop(self.rng.randrange(len(self.booked)))
+            return {'query': UPDATE_STATUS_MUTATION, 'variables': {
+                'appointmentId': appointment_id, 'status': self.rng.choice(['completed', 'canceled']),
+            }}
+        return None
+
+    def record(self, operation, content):
+        if operation == 'create_appointment':
+            appointment = ((content.get('data') or {}).get('createAppointment') or {}).get('appointment')
+            if appointment:
+                self.booked.append(appointment['id'])
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(lambda: defaultdict(int))
+        self.connection_samples = []
+
+    def summary(self, elapsed):
+        operations = {}
+        for operation, latencies in sorted(self.latencies.items()):
+            operations[operation] = self.describe(latencies, self.errors[operation], elapsed)
+        every_latency = [latency for latencies in self.latencies.values() for latency in latencies]
+        every_error = defaultdict(int)
+        for errors in self.errors.values():
+            for kind, count in errors.items():
+                every_error[kind] += count
+        summary = {'elapsed_s': round(elapsed, 2), 'total': self.describe(every_latency, every_error, elapsed), 'operations': operations}
+        if self.connection_samples:
+            summary['db_connections'] = {
+                'max_open': max(open_ for open_, _ in self.connection_samples),
+                'max_active': max(active for _, active in self.connection_samples),
+                'avg_active': round(sum(active for _, active in self.connection_samples) / len(self.connection_samples), 2),
+            }
+        return summary
+
+    @staticmethod
+    def describe(latencies, errors, elapsed):
+        ordered = sorted(latencies)
+
+        def percentile(percent):
+            return round(ordered[max(0, math.ceil(percent / 100 * len(ordered)) - 1)], 2) if ordered else None
+
+        error_count = sum(errors.values())
+        return {
+            'requests': len(ordered),
+            'rps': round(len(ordered) / elapsed, 1) if elapsed else 0,
+            'p50_ms': percentile(50),
+            'p95_ms': percentile(95),
+            'p99_ms': percentile(99),
+            'error_rate': round(error_count / len(ordered), 4) if ordered else 0,
+            'errors': dict(errors),
+        }
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        if name not in ('catalog', 'appointments_by_medspa', 'create_appointment', 'update_status'):
+            raise argparse.ArgumentTypeError(f'Unknown operation in mix: {name}')
+        mix[name] = float(weight or 1)
+    return mix
+
+def error_kind(status, content):
+    if status != 200:
+        return f'http_{status}'
+    errors = content.get('errors')
+    if errors:
+        return (errors[0].get('extensions') or {}).get('code') or errors[0].get('message', 'error')[:60]
+    return None
+
+async def user(url, workload, mix, stats, deadline, measure_from, pacer):
+    connection = HttpConnection(url)
+    operations, weights = zip(*mix.items())
+    try:
+        while time.perf_counter() < deadline:
+            operation = workload.rng.choices(operations, weights)[0]
+            body = workload.next_request(operation)
+            if body is None:
+                operation, body = 'catalog', workload.next_request('catalog')
+            if pacer is not None:
+                await pacer.wait()
+            started = time.perf_counter()
+            try:
+                status, raw = await connection.post_json(body)
+                content = json.loads(raw) if raw else {}
+                kind = error_kind(status, content)
+            except (OSError, asyncio.IncompleteReadError, ValueError, IndexError) as error:
+                await connection.close()
+                content, kind = {}, type(error).__name__
+            finished = time.perf_counter()
+            workload.record(operation, content)
+            if started >= measure_from:
+                stats.latencies[operation].append((finished - started) * 1000)
+                if kind:
+                    stats.errors[operation][kind] += 1
+    finally:
+        await connection.close()
+
+async def sample_db_connections(stats, deadline, interval=0.5):
+    setup_django()
+    from django.db import connection
+
+    def sample():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT count(*), count(*) FILTER (WHERE state = 'active') FROM pg_stat_activity "
+                'WHERE datname = current_database() AND pid <> pg_backend_pid()'
+            )
+            return cursor.fetchone()
+
+    try:
+        while time.perf_counter() < deadline:
+            stats.connection_samples.append(await asyncio.to_thread(sample))
+            await asyncio.sleep(interval)
+    except Exception as error:
+        print(f'Not sampling database connections: {error}')
+
+async def load_catalog(url):
+    connection = HttpConnection(url)
+    try:
+        _, raw = await connection.post_json({'query': SETUP_QUERY})
+    finally:
+        await connection.close()
+    edges = json.loads(raw)['data']['allMedspas']['edges']
+    return [(edge['node']['id'], [service['id'] for service in edge['node']['services']]) for edge in edges if edge['node']['services']]
+
+async def run(args):
+    catalog = await load_catalog(args.url)
+    if not catalog:
+        raise SystemExit('No medspa with services found; load some data first.')
+
+    stats = Stats()
+    workload = Workload(catalog, random.Random(args.seed))
+    started = time.perf_counter()
+    measure_from = started + args.warmup
+    deadline = measure_from + args.duration
+    pacer = Pacer(args.rps) if args.rps else None
+    tasks = [user(args.url, workload, args.mix, stats, deadline, measure_from, pacer) for _ in range(args.concurrency)]
+    if args.db_stats:
+        tasks.append(sample_db_connections(stats, deadline))
+    await asyncio.gather(*tasks)
+    return stats.summary(time.perf_counter() - measure_from)
+
+def print_summary(summary, args):
+    print(f'{args.concurrency} users, {f"{args.rps:g} rps target" if args.rps else "closed loop"}, {summary["elapsed_s"]} s\n')
+    print(f'{"operation":<24}{"requests":>10}{"rps":>9}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}{"errors":>9}')
+    for name, row in [*summary['operations'].items(), ('total', summary['total'])]:
+        print(
+            f'{name:<24}{row["requests"]:>10}{row["rps"]:>9}{row["p50_ms"] or 0:>9}{row["p95_ms"] or 0:>9}'
+            f'{row["p99_ms"] or 0:>9}{row["error_rate"]:>9.2%}'
+        )
+    for name, row in summary['operations'].items():
+        for kind, count in row['errors'].items():
+            print(f'    {name}: {count} × {kind}')
+    if 'db_connections' in summary:
+        connections = summary['db_connections']
+        print(f'\nDB connections: max open {connections["max_open"]}, max active {connections["max_active"]}, avg active {connections["avg_active"]}')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://localhost:8000/graphql/')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--rps', type=float, help='Cap the request rate across all users.')
+    parser.add_argument('--duration', type=float, default=30, help='Measured seconds.')
+    parser.add_argument('--warmup', type=float, default=3, help='Seconds of traffic before measuring.')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix(DEFAULT_MIX))
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--no-db-stats', dest='db_stats', action='store_false', help="Don't sample pg_stat_activity.")
+    parser.add_argument('--json', action='store_true', help='Print the summary as JSON for side-by-side comparisons.')
+    args = parser.parse_args()
+
+    summary = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        print_summary(summary, args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""
+Partitioned versus unpartitioned appointments over several years of history.
+
+Loads `--rows` appointments spread evenly over `--years` years, the last of
+them still to come, into the partitioned appointment table and into an
+unpartitioned copy with the same indexes, inside a transaction that is rolled
+back at the end. Times the appointment queries the GraphQL resolvers issue
+against both and counts the partitions each one reads, then archives the two
+oldest months, detached and compressed.
+
+    $ docker compose run web python -m benchmarks.partitioning --years 5 --rows 2000000
+"""
+import argparse
+import datetime
+import re
+import time
+
+from benchmarks.common import setup_django, timed
+
+setup_django()
+
+from django.db import connection, transaction  # noqa: E402
+from django.utils import timezone  # noqa: E402
+from moxie_medspa.models import Appointment, Medspa, Service  # noqa: E402
+from moxie_medspa.partitions import (  # noqa: E402
+    LINK_TABLE, TABLE, archive_partition, ensure_partitions, is_partitioned, month_of, months_between, partition_months,
+)
+
+COPY_TABLE = 'benchmark_appointment_unpartitioned'
+PARTITION = re.compile(rf' on ({TABLE}_(?:p\d{{4}}_\d{{2}}|default))\b')
+
+
+def load_appointments(rows, medspa_count, first, last):
+    medspas = [
+        Medspa.objects.create(name=f'Benchmark Medspa {i}', address='', phone_number='', email_address='bench@joinmoxie.com')
+        for i in range(medspa_count)
+    ]
+    for medspa in medspas:
+        Service.objects.create(name='Benchmark Service', description='', price=100, duration=60, medspa=medspa)
+    ensure_partitions(months_between(first, last))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'''
+            INSERT INTO {TABLE} (id, start_time, total_duration, total_price, status, medspa_id)
+            SELECT gen_random_uuid(), start_time, 60, 100,
+                   CASE WHEN start_time > now() THEN 'scheduled'
+                        ELSE (ARRAY['completed', 'completed', 'completed', 'canceled'])[1 + i %% 4] END,
+                   (%s::uuid[])[1 + i %% %s]
+            FROM generate_series(0, %s - 1) AS i,
+                 LATERAL (SELECT %s + (%s - %s) * i / %s AS start_time) AS slot
+            ''',
+            [[medspa.id for medspa in medspas], medspa_count, rows, first, last, first, rows],
+        )
+        cursor.execute(
+            f'INSERT INTO {LINK_TABLE} (appointment_id, service_id) SELECT appointment.id, service.id '
+            f'FROM {TABLE} AS appointment JOIN {Service._meta.db_table} AS service USING (medspa_id) WHERE medspa_id = ANY(%s)',
+            [[medspa.id for medspa in medspas]],
+        )
+        # Check the deferred foreign keys now, as a commit would, so the partitions can be altered.
+        cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+        cursor.execute(f'CREATE TABLE {COPY_TABLE} (LIKE {TABLE} INCLUDING ALL)')
+        cursor.execute(f'INSERT INTO {COPY_TABLE} SELECT * FROM {TABLE}')
+        for table in [TABLE, COPY_TABLE, LINK_TABLE]:
+            cursor.execute(f'ANALYZE {table}')
+    return medspas
+
+def run(sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+def compare(label, queryset):
+    sql, params = queryset.query.sql_with_params()
+    copy_sql = sql.replace(f'"{TABLE}"', f'"{COPY_TABLE}"')
+    plan = '\n'.join(row for row, in run(f'EXPLAIN {sql}', params))
+    partitioned, rows = timed(lambda: run(sql, params))
+    unpartitioned, _ = timed(lambda: run(copy_sql, params))
+    partitions = len(set(PARTITION.findall(plan)))
+    print(f'{label:<34} {len(rows):>6} {unpartitioned:>14.2f} {partitioned:>12.2f} {partitions:>11}')
+
+def relation_size(table):
+    return run('SELECT pg_total_relation_size(%s)', [table])[0][0]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--years', type=int, default=5)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--medspas', type=int, default=20)
+    args = parser.parse_args()
+    if not is_partitioned():
+        parser.error('the appointment table is not partitioned; run the migrations on PostgreSQL')
+
+    now = timezone.now()
+    first, last = now - datetime.timedelta(days=365 * (args.years - 1)), now + datetime.timedelta(days=365)
+    with transaction.atomic():
+        started = time.perf_counter()
+        medspas = load_appointments(args.rows, args.medspas, first, last)
+        months = partition_months()
+        print(f'{args.rows} appointments over {args.years} years in {len(months)} monthly partitions, '
+              f'loaded in {time.perf_counter() - started:.1f}s\n')
+
+        medspa_id = medspas[0].id
+        week = now - datetime.timedelta(days=30)
+        appointment_id = Appointment.objects.filter(medspa_id=medspa_id).in_range(now).values_list('id', flat=True).first()
+        ordering = ('start_time', 'id')
+        print(f'{"query":<34} {"rows":>6} {"unpartitioned":>14} {"partitioned":>12} {"partitions":>11}')
+        compare('appointmentsByMedspa(date)', Appointment.objects.filter(medspa_id=medspa_id).on_date(now.date()).order_by(*ordering)[:21])
+        compare('allAppointments(start, end)', Appointment.objects.in_range(week, week + datetime.timedelta(days=7)).order_by(*ordering)[:21])
+        compare('allAppointments(start, end) all', Appointment.objects.in_range(week, week + datetime.timedelta(days=7)).order_by(*ordering))
+        compare('availableSlots overlap check', Appointment.objects.filter(medspa_id=medspa_id, status='scheduled').overlapping(
+            now, now + datetime.timedelta(days=7),
+        ).values_list('start_time', 'total_duration'))
+        compare('allAppointments first page', Appointment.objects.order_by(*ordering)[:21])
+        compare('allAppointments(status) first page', Appointment.objects.filter(status='scheduled').order_by(*ordering)[:21])
+        compare('appointment(id)', Appointment.objects.filter(id=appointment_id))
+
+        print(f'\nunpartitioned table with indexes: {relation_size(COPY_TABLE) / 2**20:.0f} MiB; '
+              f'partition for {month_of(now):%Y-%m}: {relation_size(f"{TABLE}_p{month_of(now):%Y_%m}") / 2**20:.1f} MiB')
+        for month, compress in [(months[0], False), (months[1], True)]:
+            size = relation_size(f'{TABLE}_p{month:%Y_%m}')
+            started = time.perf_counter()
+            count = archive_partition(month, compress=compress)
+            elapsed = (time.perf_counter() - started) * 1000
+            if compress:
+                archived = run('SELECT pg_column_size(appointments) FROM moxie_medspa_appointmentarchive WHERE month = %s', [month])[0][0]
+                print(f'compressed {month:%Y-%m} ({count} appointments) in {elapsed:.0f} ms: '
+                      f'{size / 2**20:.1f} MiB partition -> {archived / 2**20:.1f} MiB archive row')
+            else:
+                print(f'detached {month:%Y-%m} ({count} appointments) in {elapsed:.0f} ms')
+
+        transaction.set_rollback(True)
+
+
+if __name__ == '__main__':
+    main()
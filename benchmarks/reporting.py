@@ -0,0 +1,79 @@
+"""
+Compare the reporting queries against aggregating the appointments directly.
+
+Generates the seeded dataset for `--scale` (a year of appointments; rollups are
+rebuilt from it) inside a transaction that is rolled back at the end, then
+times each report over the whole year for every medspa and for one medspa,
+once as a GROUP BY over moxie_medspa_appointment and once from the daily
+rollup tables the GraphQL queries read.
+
+    $ docker compose run web python -m benchmarks.reporting --scale m
+"""
+import argparse
+import datetime
+
+from benchmarks.common import setup_django, timed
+from benchmarks.dataset import DAYS, FIRST_START_TIME, SCALE_FACTORS, generate_dataset
+
+setup_django()
+
+from django.db import transaction  # noqa: E402
+from django.db.models import Count, F, Sum  # noqa: E402
+from django.db.models.functions import TruncMonth  # noqa: E402
+from moxie_medspa import reporting  # noqa: E402
+from moxie_medspa.models import Appointment  # noqa: E402
+
+
+def live_revenue(start, end, medspa_id=None):
+    appointments = Appointment.objects.in_range(start, end).filter(status__in=reporting.BOOKED_STATUSES)
+    if medspa_id:
+        appointments = appointments.filter(medspa_id=medspa_id)
+    return appointments.values('medspa_id', period=TruncMonth('start_time')).annotate(count=Count('id'), revenue=Sum('total_price'))
+
+def live_utilization(start, end, medspa_id=None):
+    links = Appointment.services.through.objects.filter(
+        appointment__start_time__gte=start, appointment__start_time__lt=end, appointment__status__in=reporting.BOOKED_STATUSES,
+    )
+    if medspa_id:
+        links = links.filter(appointment__medspa_id=medspa_id)
+    return links.values('service_id', period=TruncMonth(F('appointment__start_time'))).annotate(count=Count('id'))
+
+def live_status_breakdown(start, end, medspa_id=None):
+    appointments = Appointment.objects.in_range(start, end)
+    if medspa_id:
+        appointments = appointments.filter(medspa_id=medspa_id)
+    return appointments.values('status', period=TruncMonth('start_time')).annotate(count=Count('id'), revenue=Sum('total_price'))
+
+REPORTS = {
+    'revenueByMedspa': (live_revenue, reporting.revenue_by_medspa),
+    'serviceUtilization': (live_utilization, reporting.service_utilization),
+    'statusBreakdown': (live_status_breakdown, reporting.status_breakdown),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', choices=SCALE_FACTORS, default='s')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with transaction.atomic():
+        dataset = generate_dataset(args.scale, args.seed)
+        start_time = FIRST_START_TIME.replace(hour=0)
+        end_time = start_time + datetime.timedelta(days=DAYS + 1)
+        start, end = start_time.date(), end_time.date()
+        print(f'scale {args.scale}: {SCALE_FACTORS[args.scale][2]} appointments, monthly reports over {start} .. {end}\n')
+        print(f'{"report":<22}{"scope":<12}{"appointments ms":>17}{"rollups ms":>12}{"rows":>7}')
+
+        for name, (live, rollup) in REPORTS.items():
+            for scope, medspa_id in [('all', None), ('one medspa', dataset.medspa_ids[0])]:
+                live_ms, _ = timed(lambda: list(live(start_time, end_time, medspa_id)), args.repeat)
+                rollup_ms, rows = timed(lambda: list(rollup(start, end, medspa_id, 'month')), args.repeat)
+                print(f'{name:<22}{scope:<12}{live_ms:>17.2f}{rollup_ms:>12.2f}{len(rows):>7}')
+
+        transaction.set_rollback(True)
+
+
+if __name__ == '__main__':
+    main()
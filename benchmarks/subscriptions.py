@@ -0,0 +1,111 @@
+"""
+Fan-out of appointmentCreated events to idle WebSocket subscriptions.
+
+Opens `--connections` graphql-transport-ws connections against the ASGI app
+in memory (no network), each subscribed to appointmentCreated for one of
+`--medspas` medspas, and reports the Python memory held per idle connection
+(including this script's two queues per connection). Then
+publishes `--events` appointments for the busiest medspa through the
+configured broker and times how long it takes until every subscriber of that
+medspa has its `next` message. Nothing is written to the database.
+
+    $ docker compose run web python -m benchmarks.subscriptions --connections 5000
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import statistics
+import time
+import tracemalloc
+import uuid
+
+from asgiref.sync import sync_to_async
+
+from benchmarks.common import setup_django
+
+setup_django()
+
+from moxie_medspa import pubsub  # noqa: E402
+from moxie_medspa.models import Appointment  # noqa: E402
+from moxie_medspa.subscriptions import graphql_websocket  # noqa: E402
+
+QUERY = 'subscription($medspaId: UUID!) { appointmentCreated(medspaId: $medspaId) { id startTime status totalPrice } }'
+
+
+class Connection:
+    def __init__(self, medspa_id):
+        self.medspa_id = medspa_id
+        self.incoming = asyncio.Queue()
+        self.received = asyncio.Queue()
+        scope = {'type': 'websocket', 'path': '/graphql/', 'subprotocols': ['graphql-transport-ws'], 'headers': []}
+        self.task = asyncio.create_task(graphql_websocket(scope, self.incoming.get, self.deliver))
+
+    async def deliver(self, event):
+        if event['type'] == 'websocket.send' and json.loads(event['text'])['type'] == 'next':
+            self.received.put_nowait(time.perf_counter())
+
+    async def open(self):
+        self.incoming.put_nowait({'type': 'websocket.connect'})
+        self.incoming.put_nowait({'type': 'websocket.receive', 'text': json.dumps({'type': 'connection_init'})})
+        self.incoming.put_nowait({'type': 'websocket.receive', 'text': json.dumps({
+            'type': 'subscribe', 'id': '1', 'payload': {'query': QUERY, 'variables': {'medspaId': str(self.medspa_id)}},
+        })})
+
+    async def close(self):
+        self.incoming.put_nowait({'type': 'websocket.disconnect', 'code': 1000})
+        await self.task
+
+
+async def wait_for_subscribers(count):
+    while pubsub.broker.subscriber_count() < count:
+        await asyncio.sleep(0.01)
+
+async def run(args):
+    medspa_ids = [uuid.uuid4() for _ in range(args.medspas)]
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    connections = [Connection(medspa_ids[index % args.medspas]) for index in range(args.connections)]
+    started = time.perf_counter()
+    for connection in connections:
+        await connection.open()
+    await wait_for_subscribers(args.connections)
+    opened = time.perf_counter() - started
+    memory = sum(stat.size_diff for stat in tracemalloc.take_snapshot().compare_to(before, 'filename'))
+    tracemalloc.stop()
+    print(f'{args.connections} connections over {args.medspas} medspas subscribed in {opened * 1000:.0f} ms')
+    print(f'{memory / args.connections / 1024:.1f} KiB of Python memory per idle connection\n')
+
+    medspa_id = medspa_ids[0]
+    subscribers = [connection for connection in connections if connection.medspa_id == medspa_id]
+    latencies = []
+    for event in range(args.events):
+        appointment = Appointment(
+            start_time=datetime.datetime(2031, 1, 1, tzinfo=datetime.timezone.utc) + datetime.timedelta(hours=event),
+            total_duration=60, total_price=100, status='scheduled', medspa_id=medspa_id,
+        )
+        published = time.perf_counter()
+        # From a thread, as mutations publish.
+        await sync_to_async(pubsub.publish_appointments)(pubsub.APPOINTMENT_CREATED, [appointment])
+        delivered = [await subscriber.received.get() for subscriber in subscribers]
+        latencies.append((max(delivered) - published) * 1000)
+
+    print(f'{args.events} events, each to {len(subscribers)} subscribers of one medspa')
+    print(f'all delivered after   median {statistics.median(latencies):.1f} ms   max {max(latencies):.1f} ms')
+    print(f'per subscriber        {statistics.median(latencies) / len(subscribers) * 1000:.1f} us')
+
+    await asyncio.gather(*(connection.close() for connection in connections))
+    await pubsub.broker.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--connections', type=int, default=5000)
+    parser.add_argument('--medspas', type=int, default=5)
+    parser.add_argument('--events', type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,288 @@
+"""
+Run every Query and Mutation field against a seeded dataset and compare with a baseline.
+
+Each operation is sent through the full /graphql/ stack (Django middleware,
+document cache, cost check) `--iterations` times after `--warmup` untimed
+runs. The response cache is cleared before every call so the resolvers
+always run. For each operation we report p50/p95/p99 latency, the most SQL
+queries any one call ran and peak Python memory (tracemalloc) of one call. Everything happens in a
+transaction that is rolled back at the end.
+
+    $ docker compose run web python -m benchmarks.suite --scale s
+    $ docker compose run web python -m benchmarks.suite --scale s --save-baseline
+
+Exits with status 1 when an operation runs more SQL queries than the baseline
+(beyond --max-sql-increase) or its p95 grew by more than --max-p95-regression
+(and by at least --min-p95-delta-ms, so noise on fast operations is ignored).
+Latency baselines are only meaningful on the machine that recorded them;
+re-record with --save-baseline when moving to another one.
+"""
+import argparse
+import datetime
+import json
+import logging
+import math
+import os
+import sys
+import time
+import tracemalloc
+
+from benchmarks.common import setup_django
+from benchmarks.dataset import FIRST_START_TIME, SCALE_FACTORS, generate_dataset
+
+setup_django()
+
+from django.db import connection, transaction  # noqa: E402
+from django.db.models import Count  # noqa: E402
+from django.db.models.functions import TruncDate  # noqa: E402
+from django.test import Client  # noqa: E402
+from moxie_medspa.models import Appointment  # noqa: E402
+from moxie_medspa.response_cache import response_cache  # noqa: E402
+
+BASELINE_DIR = os.path.join(os.path.dirname(__file__), 'baselines')
+# Mutations book appointments after the generated year so they never conflict.
+FREE_START_TIME = FIRST_START_TIME + datetime.timedelta(days=400)
+
+APPOINTMENT_FIELDS = 'id startTime totalDuration totalPrice status services { id name } medspa { id name }'
+
+
+def first_medspa(dataset):
+    return dataset.medspa_ids[0]
+
+def first_services(dataset, count=2):
+    return dataset.service_ids[first_medspa(dataset)][:count]
+
+def hours_after(start, hours):
+    return (start + datetime.timedelta(hours=hours)).isoformat()
+
+
+# name: (query, variables(dataset, iteration))
+STATUS_BATCH_SIZE = 50
+
+OPERATIONS = {
+    'medspa': (
+        'query ($id: UUID) { medspa(id: $id) { id name services { id name price } } }',
+        lambda dataset, i: {'id': str(dataset.medspa_ids[i % len(dataset.medspa_ids)])},
+    ),
+    'allMedspas': (
+        'query { allMedspas(first: 50) { totalCount edges { node { id name services { id name } } } } }',
+        lambda dataset, i: {},
+    ),
+    'service': (
+        'query ($id: UUID) { service(id: $id) { id name price duration medspa { id name } } }',
+        lambda dataset, i: {'id': str(first_services(dataset, 1)[0])},
+    ),
+    'allServices': (
+        'query ($medspaId: UUID) { allServices(medspaId: $medspaId, first: 50) { edges { node { id name price medspa { name } } } } }',
+        lambda dataset, i: {'medspaId': str(first_medspa(dataset))},
+    ),
+    'appointment': (
+        f'query ($id: UUID) {{ appointment(id: $id) {{ {APPOINTMENT_FIELDS} }} }}',
+        lambda dataset, i: {'id': str(dataset.appointment_ids[i % len(dataset.appointment_ids)])},
+    ),
+    'allAppointments': (
+        f'query ($status: String) {{ allAppointments(status: $status, first: 50) {{ edges {{ node {{ {APPOINTMENT_FIELDS} }} }} }} }}',
+        lambda dataset, i: {'status': 'scheduled'},
+    ),
+    'appointmentsByMedspa': (
+        f'query ($medspaId: UUID, $date: Date) {{ appointmentsByMedspa(medspaId: $medspaId, date: $date, first: 50) {{ edges {{ node {{ {APPOINTMENT_FIELDS} }} }} }} }}',
+        lambda dataset, i: {'medspaId': str(first_medspa(dataset)), 'date': dataset.busiest_date.isoformat()},
+    ),
+    'availableSlots': (
+        'query ($medspaId: UUID!, $serviceIds: [UUID!]!, $from: DateTime!, $to: DateTime!) '
+        '{ availableSlots(medspaId: $medspaId, serviceIds: $serviceIds, from: $from, to: $to) { startTime endTime } }',
+        lambda dataset, i: {
+            'medspaId': str(first_medspa(dataset)),
+            'serviceIds': [str(service_id) for service_id in first_services(dataset)],
+            'from': FIRST_START_TIME.isoformat(),
+            'to': hours_after(FIRST_START_TIME, 7 * 24),
+        },
+    ),
+    'revenueByMedspa': (
+        'query ($medspaId: UUID, $start: Date!, $end: Date!) '
+        '{ revenueByMedspa(medspaId: $medspaId, start: $start, end: $end, period: DAY) { medspaId period appointmentCount revenue } }',
+        lambda dataset, i: {'medspaId': str(first_medspa(dataset)), 'start': FIRST_START_TIME.date().isoformat(), 'end': hours_after(FIRST_START_TIME, 24 * 30)[:10]},
+    ),
+    'serviceUtilization': (
+        'query ($start: Date!, $end: Date!) { serviceUtilization(start: $start, end: $end) { serviceId bookingCount } }',
+        lambda dataset, i: {'start': FIRST_START_TIME.date().isoformat(), 'end': hours_after(FIRST_START_TIME, 24 * 365)[:10]},
+    ),
+    'statusBreakdown': (
+        'query ($start: Date!, $end: Date!) { statusBreakdown(start: $start, end: $end, period: MONTH) { status period appointmentCount revenue } }',
+        lambda dataset, i: {'start': FIRST_START_TIME.date().isoformat(), 'end': hours_after(FIRST_START_TIME, 24 * 365)[:10]},
+    ),
+    'createService': (
+        'mutation ($medspaId: UUID!, $name: String!) '
+        '{ createService(medspaId: $medspaId, name: $name, description: "", price: "100.00", duration: 30) { service { id } } }',
+        lambda dataset, i: {'medspaId': str(first_medspa(dataset)), 'name': f'Benchmark Service {i}'},
+    ),
+    'updateService': (
+        'mutation ($serviceId: UUID!, $price: Decimal) { updateService(serviceId: $serviceId, price: $price) { service { id price } } }',
+        lambda dataset, i: {'serviceId': str(first_services(dataset, 1)[0]), 'price': str(100 + i % 2)},
+    ),
+    'createAppointment': (
+        f'mutation ($medspaId: UUID!, $serviceIds: [UUID]!, $startTime: DateTime!) '
+        f'{{ createAppointment(medspaId: $medspaId, serviceIds: $serviceIds, startTime: $startTime) {{ appointment {{ {APPOINTMENT_FIELDS} }} }} }}',
+        lambda dataset, i: {
+            'medspaId': str(first_medspa(dataset)),
+            'serviceIds': [str(service_id) for service_id in first_services(dataset)],
+            'startTime': hours_after(FREE_START_TIME, 4 * i),
+        },
+    ),
+    'createAppointments': (
+        'mutation ($input: [AppointmentInput!]!) { createAppointments(input: $input) { results { index error appointment { id } } } }',
+        lambda dataset, i: {'input': [
+            {
+                'medspaId': str(medspa_id),
+                'serviceIds': [str(dataset.service_ids[medspa_id][0])],
+                'startTime': hours_after(FREE_START_TIME, 4 * i + 2),
+            }
+            for medspa_id in dataset.medspa_ids[:10]
+        ]},
+    ),
+    'updateAppointmentStatus': (
+        'mutation ($appointmentId: UUID!) { updateAppointmentStatus(appointmentId: $appointmentId, status: "canceled") { appointment { id status } } }',
+        lambda dataset, i: {'appointmentId': str(dataset.fresh_appointment_ids[i])},
+    ),
+    'updateAppointmentStatuses': (
+        'mutation ($ids: [UUID!]!) { updateAppointmentStatuses(ids: $ids, status: "completed") { appointments { id status } } }',
+        lambda dataset, i: {'ids': [str(appointment_id) for appointment_id in dataset.fresh_appointment_batches[i]]},
+    ),
+}
+
+
+def percentile(values, percent):
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(percent / 100 * len(ordered)) - 1)]
+
+def book_fresh_appointments(dataset, count):
+    # Scheduled appointments that updateAppointmentStatus can cancel, one per
+    # call, and batches of STATUS_BATCH_SIZE for updateAppointmentStatuses.
+    medspa_id = first_medspa(dataset)
+    appointments = Appointment.objects.bulk_create([
+        Appointment(
+            start_time=FREE_START_TIME - datetime.timedelta(days=30, minutes=i), total_duration=30, total_price=100,
+            status='scheduled', medspa_id=medspa_id,
+        )
+        for i in range(count * (1 + STATUS_BATCH_SIZE))
+    ])
+    ids = [appointment.id for appointment in appointments]
+    dataset.fresh_appointment_ids = ids[:count]
+    dataset.fresh_appointment_batches = [ids[start:start + STATUS_BATCH_SIZE] for start in range(count, len(ids), STATUS_BATCH_SIZE)]
+
+def find_busiest_date(dataset):
+    # A fixed day with bookings, so every call runs the same SQL whatever --iterations is.
+    days = (
+        Appointment.objects.filter(medspa_id=first_medspa(dataset))
+        .annotate(day=TruncDate('start_time')).values('day').annotate(count=Count('id')).order_by('-count', 'day')
+    )
+    dataset.busiest_date = days[0]['day']
+
+def run_operation(client, query, variables):
+    response_cache.clear()
+    response = client.post('/graphql/', {'query': query, 'variables': variables}, content_type='application/json')
+    content = response.json()
+    if content.get('errors'):
+        raise Exception(f'{content["errors"][0]["message"]}')
+
+def measure(client, dataset, name, iterations, warmup):
+    query, variables = OPERATIONS[name]
+    for i in range(warmup):
+        run_operation(client, query, variables(dataset, i))
+
+    latencies = []
+    sql_queries = []
+    queries = []
+    # Not CaptureQueriesContext: every request resets connection.queries.
+    with connection.execute_wrapper(lambda execute, sql, *args: queries.append(sql) or execute(sql, *args)):
+        for i in range(warmup, warmup + iterations):
+            queries.clear()
+            started = time.perf_counter()
+            run_operation(client, query, variables(dataset, i))
+            latencies.append((time.perf_counter() - started) * 1000)
+            sql_queries.append(len(queries))
+
+    tracemalloc.start()
+    run_operation(client, query, variables(dataset, warmup + iterations))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p95_ms': round(percentile(latencies, 95), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+        'sql_queries': max(sql_queries),
+        'peak_memory_kb': round(peak / 1024, 1),
+    }
+
+def find_regressions(results, baseline, max_sql_increase, max_p95_regression, min_p95_delta_ms):
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        if result['sql_queries'] > previous['sql_queries'] + max_sql_increase:
+            regressions.append(f'{name}: {result["sql_queries"]:g} SQL queries (baseline {previous["sql_queries"]:g})')
+        p95_delta = result['p95_ms'] - previous['p95_ms']
+        if p95_delta > previous['p95_ms'] * max_p95_regression and p95_delta >= min_p95_delta_ms:
+            regressions.append(f'{name}: p95 {result["p95_ms"]:.2f} ms (baseline {previous["p95_ms"]:.2f} ms)')
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', choices=SCALE_FACTORS, default='xs')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--operation', action='append', choices=OPERATIONS, help='Only run these operations.')
+    parser.add_argument('--baseline', help='Baseline file (default: benchmarks/baselines/<scale>.json).')
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--max-sql-increase', type=float, default=0)
+    parser.add_argument('--max-p95-regression', type=float, default=0.5, help='Allowed relative p95 growth.')
+    parser.add_argument('--min-p95-delta-ms', type=float, default=2.0)
+    args = parser.parse_args()
+    baseline_path = args.baseline or os.path.join(BASELINE_DIR, f'{args.scale}.json')
+
+    logging.getLogger('moxie_medspa.tracing').setLevel(logging.ERROR)
+    client = Client(HTTP_HOST='localhost')
+    results = {}
+    with transaction.atomic():
+        dataset = generate_dataset(args.scale, args.seed)
+        find_busiest_date(dataset)
+        book_fresh_appointments(dataset, args.warmup + args.iterations + 1)
+
+        print(f'{"operation":<26}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}{"SQL":>8}{"peak KiB":>11}')
+        for name in args.operation or OPERATIONS:
+            results[name] = result = measure(client, dataset, name, args.iterations, args.warmup)
+            print(
+                f'{name:<26}{result["p50_ms"]:>10.2f}{result["p95_ms"]:>10.2f}{result["p99_ms"]:>10.2f}'
+                f'{result["sql_queries"]:>8g}{result["peak_memory_kb"]:>11.1f}'
+            )
+
+        transaction.set_rollback(True)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(baseline_path), exist_ok=True)
+        with open(baseline_path, 'w') as file:
+            json.dump(results, file, indent=2, sort_keys=True)
+            file.write('\n')
+        print(f'\nBaseline saved to {baseline_path}')
+        return
+
+    if not os.path.exists(baseline_path):
+        print(f'\nNo baseline at {baseline_path}; run with --save-baseline to record one.')
+        return
+
+    with open(baseline_path) as file:
+        baseline = json.load(file)
+    regressions = find_regressions(results, baseline, args.max_sql_increase, args.max_p95_regression, args.min_p95_delta_ms)
+    if regressions:
+        print('\nRegressions against the baseline:')
+        for regression in regressions:
+            print(f'    {regression}')
+        sys.exit(1)
+    print('\nNo regressions against the baseline.')
+
+
+if __name__ == '__main__':
+    main()
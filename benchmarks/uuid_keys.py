@@ -0,0 +1,128 @@
+"""
+Compare random (uuid4) and time-ordered (uuid7) appointment keys.
+
+Creates two copies of the appointment table and its services link table (same
+columns and indexes, no foreign keys) inside a transaction that is rolled back
+at the end, and fills each with `--rows` appointments in batches of
+`--batch-size` rows. uuid7 keys are stamped one millisecond apart, as if the
+appointments had been booked over time. Reports insert throughput (overall and
+for the last tenth of the rows, when the indexes are largest) and the size of
+the tables and their indexes.
+
+    $ docker compose run web python -m benchmarks.uuid_keys --rows 2000000
+"""
+import argparse
+import csv
+import datetime
+import io
+import random
+import time
+import uuid
+
+from benchmarks.common import setup_django
+
+setup_django()
+
+from django.db import connection, transaction  # noqa: E402
+from moxie_medspa.models import Appointment, uuid7  # noqa: E402
+
+FIRST_START_TIME = datetime.datetime(2024, 1, 1, 8, tzinfo=datetime.timezone.utc)
+KEYS = {
+    'uuid4': lambda i, first_ms: uuid.uuid4(),
+    'uuid7': lambda i, first_ms: uuid7(first_ms + i),
+}
+
+
+def create_tables(name):
+    appointments = f'benchmark_{name}_appointment'
+    links = f'benchmark_{name}_appointment_services'
+    with connection.cursor() as cursor:
+        cursor.execute(f'CREATE TABLE {appointments} (LIKE {Appointment._meta.db_table} INCLUDING INDEXES)')
+        cursor.execute(f'CREATE TABLE {links} (LIKE {Appointment.services.through._meta.db_table} INCLUDING INDEXES)')
+    return appointments, links
+
+def copy_rows(table, columns, rows):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    with connection.cursor() as cursor:
+        with cursor.copy(f'COPY {table} ({", ".join(columns)}) FROM STDIN WITH (FORMAT csv)') as copy:
+            copy.write(buffer.getvalue())
+
+def make_batch(make_key, start, size, first_ms, medspa_ids, service_ids, rng):
+    appointments = []
+    links = []
+    for i in range(start, start + size):
+        appointment_id = make_key(i, first_ms)
+        appointments.append((appointment_id, (FIRST_START_TIME + datetime.timedelta(minutes=15 * i)).isoformat(), 60, 100, 'scheduled', rng.choice(medspa_ids)))
+        links.extend((2 * i + j, appointment_id, service_id) for j, service_id in enumerate(rng.sample(service_ids, 2)))
+    return appointments, links
+
+def load(name, rows, batch_size, seed):
+    appointments_table, links_table = create_tables(name)
+    rng = random.Random(seed)
+    medspa_ids = [uuid.UUID(int=rng.getrandbits(128), version=4) for _ in range(100)]
+    service_ids = [uuid.UUID(int=rng.getrandbits(128), version=4) for _ in range(1000)]
+    first_ms = int(FIRST_START_TIME.timestamp() * 1000)
+
+    elapsed = 0
+    tail_elapsed = 0
+    tail_rows = 0
+    tail_start = rows - rows // 10
+    for start in range(0, rows, batch_size):
+        size = min(batch_size, rows - start)
+        appointments, links = make_batch(KEYS[name], start, size, first_ms, medspa_ids, service_ids, rng)
+        started = time.perf_counter()
+        copy_rows(appointments_table, ['id', 'start_time', 'total_duration', 'total_price', 'status', 'medspa_id'], appointments)
+        copy_rows(links_table, ['id', 'appointment_id', 'service_id'], links)
+        batch_elapsed = time.perf_counter() - started
+        elapsed += batch_elapsed
+        if start >= tail_start:
+            tail_elapsed += batch_elapsed
+            tail_rows += size
+    return {
+        'rows_per_second': rows / elapsed,
+        'tail_rows_per_second': tail_rows / tail_elapsed if tail_elapsed else 0,
+        'sizes': relation_sizes([appointments_table, links_table]),
+    }
+
+def relation_sizes(tables):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            '''
+            SELECT c.relname, pg_relation_size(c.oid)
+            FROM pg_class c
+            WHERE c.relname = ANY(%s)
+               OR c.oid IN (SELECT indexrelid FROM pg_index WHERE indrelid = ANY(%s::regclass[]))
+            ORDER BY c.relname
+            ''',
+            [tables, tables],
+        )
+        return cursor.fetchall()
+
+def short_name(relname, name):
+    return relname.replace(f'benchmark_{name}_', '')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=2_000_000)
+    parser.add_argument('--batch-size', type=int, default=10_000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    if connection.vendor != 'postgresql':
+        raise Exception('benchmarks.uuid_keys needs PostgreSQL')
+
+    with transaction.atomic():
+        print(f'{args.rows} appointments, 2 services each, {args.batch_size} rows per COPY\n')
+        for name in KEYS:
+            result = load(name, args.rows, args.batch_size, args.seed)
+            print(f'{name}: {result["rows_per_second"]:,.0f} rows/s overall, {result["tail_rows_per_second"]:,.0f} rows/s for the last 10%')
+            for relname, size in result['sizes']:
+                print(f'    {short_name(relname, name):<50}{size / 1024 / 1024:>10.1f} MiB')
+            print()
+
+        transaction.set_rollback(True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,8 @@
+from django.apps import AppConfig
+
+
+class MoxieMedspaConfig(AppConfig):
+    name = 'moxie_medspa'
+
+    def ready(self):
+        from moxie_medspa import signals  # noqa: F401
@@ -13,4 +13,14 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'moxie_medspa.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported once the apps are loaded.
+from moxie_medspa.subscriptions import graphql_websocket  # noqa: E402
+
+
+async def application(scope, receive, send):
+    # GraphQL subscriptions arrive as WebSocket connections; everything else is Django.
+    if scope['type'] == 'websocket':
+        return await graphql_websocket(scope, receive, send)
+    return await django_application(scope, receive, send)
@@ -0,0 +1,82 @@
+import datetime
+
+from moxie_medspa.models import Service, Appointment
+
+MAX_WINDOW = datetime.timedelta(days=31)
+
+
+def merge_intervals(intervals):
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    return merged
+
+def free_slots(busy, window_start, window_end, duration, granularity):
+    """Yield (start, end) slots of `duration` that fit between merged `busy`
+    intervals, starting every `granularity` from `window_start`.
+
+    One pass over both the candidate starts and the busy intervals, so the
+    cost is O(slots + appointments) for a sorted, merged `busy` list.
+    """
+    index = 0
+    start = window_start
+    while start + duration <= window_end:
+        end = start + duration
+        while index < len(busy) and busy[index][1] <= start:
+            index += 1
+        if index < len(busy) and busy[index][0] < end:
+            # Jump to the first aligned start after the blocking interval.
+            steps = -((start - busy[index][1]) // granularity)
+            start += steps * granularity
+            continue
+        yield start, end
+        start += granularity
+
+def find_available_slots(medspa_id, service_ids, start, end, granularity):
+    check_window(start, end, granularity)
+    service_ids = set(service_ids)
+    duration = slot_duration(service_ids, list(service_durations(medspa_id, service_ids)))
+    appointments = busy_appointments(medspa_id, start, end)
+    return build_slots(appointments, start, end, duration, granularity)
+
+async def afind_available_slots(medspa_id, service_ids, start, end, granularity):
+    check_window(start, end, granularity)
+    service_ids = set(service_ids)
+    duration = slot_duration(service_ids, [duration async for duration in service_durations(medspa_id, service_ids)])
+    appointments = [appointment async for appointment in busy_appointments(medspa_id, start, end)]
+    return build_slots(appointments, start, end, duration, granularity)
+
+def check_window(start, end, granularity):
+    if end <= start:
+        raise Exception('"to" must be after "from"')
+    if end - start > MAX_WINDOW:
+        raise Exception(f'The search window must not exceed {MAX_WINDOW.days} days')
+    if granularity <= datetime.timedelta(0):
+        raise Exception('Granularity must be a positive number of minutes')
+
+def service_durations(medspa_id, service_ids):
+    return Service.objects.filter(id__in=service_ids, medspa_id=medspa_id).values_list('duration', flat=True)
+
+def busy_appointments(medspa_id, start, end):
+    return (
+        Appointment.objects
+        .filter(medspa_id=medspa_id, status='scheduled')
+        .overlapping(start, end)
+        .values_list('start_time', 'total_duration')
+    )
+
+def slot_duration(service_ids, durations):
+    if not service_ids or len(durations) != len(service_ids):
+        raise Exception('Service not found')
+    return datetime.timedelta(minutes=sum(durations))
+
+def build_slots(appointments, start, end, duration, granularity):
+    busy = merge_intervals(
+        (start_time, start_time + datetime.timedelta(minutes=total_duration))
+        for start_time, total_duration in appointments
+    )
+    return list(free_slots(busy, start, end, duration, granularity))
@@ -0,0 +1,104 @@
+import datetime
+from collections import defaultdict
+
+from django.db import connection
+from graphql import GraphQLError
+
+from moxie_medspa import pubsub
+from moxie_medspa.models import MAX_APPOINTMENT_DURATION, Medspa, Appointment
+from moxie_medspa.reporting import RollupDeltas
+
+
+CONFLICT_MESSAGE = 'The requested time overlaps an existing appointment'
+
+# The statuses an appointment may move to, and the statuses they may come from.
+STATUS_TRANSITIONS = {
+    'scheduled': ['completed', 'canceled'],
+    'completed': ['scheduled'],
+    'canceled': ['scheduled'],
+}
+# The ones set_statuses moves appointments to. Scheduling an appointment again
+# needs an overlap check per slot and is left to updateAppointmentStatus.
+BULK_STATUSES = ['completed', 'canceled']
+
+
+class AppointmentConflict(GraphQLError):
+    def __init__(self, conflicts):
+        super().__init__(
+            CONFLICT_MESSAGE,
+            extensions={
+                'code': 'APPOINTMENT_CONFLICT',
+                'conflictingAppointments': [
+                    {'id': str(appointment.id), 'startTime': appointment.start_time.isoformat(), 'endTime': appointment.end_time.isoformat()}
+                    for appointment in conflicts
+                ],
+            },
+        )
+
+
+def lock_medspas(medspa_ids):
+    """SELECT ... FOR UPDATE the medspas being booked, in id order so that
+    concurrent multi-medspa batches cannot deadlock. Bookings for the same
+    medspa are serialized until the surrounding transaction commits, which
+    makes the overlap check below race-free. Must run inside atomic()."""
+    return {medspa.id: medspa for medspa in Medspa.objects.select_for_update().filter(id__in=medspa_ids).order_by('id')}
+
+def validate_duration(total_duration):
+    if datetime.timedelta(minutes=total_duration) > MAX_APPOINTMENT_DURATION:
+        raise Exception(f'Appointments cannot be longer than {MAX_APPOINTMENT_DURATION}')
+
+def find_conflicts(medspa_id, start_time, total_duration, exclude_id=None):
+    end_time = start_time + datetime.timedelta(minutes=total_duration)
+    conflicts = Appointment.objects.filter(medspa_id=medspa_id, status='scheduled').overlapping(start_time, end_time)
+    if exclude_id:
+        conflicts = conflicts.exclude(id=exclude_id)
+    return list(conflicts.order_by('start_time'))
+
+def check_conflicts(medspa_id, start_time, total_duration, exclude_id=None):
+    conflicts = find_conflicts(medspa_id, start_time, total_duration, exclude_id)
+    if conflicts:
+        raise AppointmentConflict(conflicts)
+
+def set_statuses(appointment_ids, status):
+    """Move the given appointments that may transition to `status` with one
+    UPDATE and return them as updated. The rest (not found, already there,
+    or not allowed) are left alone. Rows are locked in id order, so
+    concurrent calls cannot deadlock. Keeps the reporting rollups and the
+    subscriptions in step. Must run inside atomic()."""
+    if not appointment_ids:
+        return []
+    table = Appointment._meta.db_table
+    fields = Appointment._meta.concrete_fields
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'''
+            UPDATE {table} AS appointment SET status = %s
+            FROM (
+                SELECT id, start_time, status FROM {table}
+                WHERE id = ANY(%s) AND status = ANY(%s)
+                ORDER BY id
+                FOR UPDATE
+            ) AS previous
+            -- The whole primary key, so each row is found in its own partition.
+            WHERE appointment.id = previous.id AND appointment.start_time = previous.start_time
+            RETURNING {", ".join(f"appointment.{field.column}" for field in fields)}, previous.status
+            ''',
+            [status, list(appointment_ids), STATUS_TRANSITIONS[status]],
+        )
+        rows = cursor.fetchall()
+
+    field_names = [field.attname for field in fields]
+    changed = [(Appointment.from_db(connection.alias, field_names, row[:-1]), row[-1]) for row in rows]
+    service_ids = defaultdict(list)
+    links = Appointment.services.through.objects.filter(appointment_id__in=[appointment.id for appointment, _ in changed])
+    for appointment_id, service_id in links.values_list('appointment_id', 'service_id'):
+        service_ids[appointment_id].append(service_id)
+
+    deltas = RollupDeltas()
+    for appointment, previous_status in changed:
+        deltas.add(appointment, service_ids[appointment.id], status=previous_status, sign=-1)
+        deltas.add(appointment, service_ids[appointment.id])
+    deltas.apply()
+    appointments = [appointment for appointment, _ in changed]
+    pubsub.publish_appointments(pubsub.APPOINTMENT_STATUS_CHANGED, appointments)
+    return appointments
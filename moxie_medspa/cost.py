@@ -0,0 +1,113 @@
+from django.conf import settings
+from graphene_django.settings import graphene_settings
+from graphql import (
+    FieldNode,
+    FragmentDefinitionNode,
+    GraphQLError,
+    InlineFragmentNode,
+    get_named_type,
+    get_nullable_type,
+    get_operation_ast,
+    is_composite_type,
+    is_list_type,
+)
+from graphql.execution.values import get_argument_values
+
+
+def is_connection_type(graphql_type):
+    fields = getattr(graphql_type, 'fields', None) or {}
+    return 'edges' in fields and 'pageInfo' in fields
+
+
+class QueryCostAnalyzer:
+    """Static depth and cost of an operation, computed before any resolver runs.
+
+    Every object field costs 1 and scalars are free. A field's cost is
+    multiplied by the number of items it can return: `first`/`last` for
+    connections (or the page size cap when omitted) and
+    GRAPHQL_DEFAULT_LIST_SIZE for plain lists such as `services`.
+    """
+
+    def __init__(self, schema, document, variables=None):
+        self.schema = schema
+        self.variables = variables or {}
+        self.fragments = {
+            definition.name.value: definition
+            for definition in document.definitions
+            if isinstance(definition, FragmentDefinitionNode)
+        }
+        self.default_list_size = getattr(settings, 'GRAPHQL_DEFAULT_LIST_SIZE', 10)
+        self.max_page_size = graphene_settings.RELAY_CONNECTION_MAX_LIMIT
+
+    def analyze(self, operation):
+        root_type = self.schema.get_root_type(operation.operation)
+        return self._analyze_selection_set(root_type, operation.selection_set, 0)
+
+    def _analyze_selection_set(self, parent_type, selection_set, depth):
+        max_depth = depth
+        total_cost = 0
+        for selection in selection_set.selections:
+            if isinstance(selection, FieldNode):
+                field_depth, field_cost = self._analyze_field(parent_type, selection, depth + 1)
+            else:
+                fragment = selection if isinstance(selection, InlineFragmentNode) else self.fragments[selection.name.value]
+                fragment_type = parent_type
+                if fragment.type_condition:
+                    fragment_type = self.schema.get_type(fragment.type_condition.name.value)
+                field_depth, field_cost = self._analyze_selection_set(fragment_type, fragment.selection_set, depth)
+            max_depth = max(max_depth, field_depth)
+            total_cost += field_cost
+        return max_depth, total_cost
+
+    def _analyze_field(self, parent_type, field_node, depth):
+        name = field_node.name.value
+        field_def = (getattr(parent_type, 'fields', None) or {}).get(name)
+        if name.startswith('__') or field_def is None:
+            return depth - 1, 0
+
+        field_type = get_named_type(field_def.type)
+        child_depth, child_cost = depth, 0
+        if field_node.selection_set:
+            child_depth, child_cost = self._analyze_selection_set(field_type, field_node.selection_set, depth)
+
+        own_cost = 1 if is_composite_type(field_type) else 0
+        return child_depth, self._multiplier(parent_type, field_def, field_node) * (own_cost + child_cost)
+
+    def _multiplier(self, parent_type, field_def, field_node):
+        if is_connection_type(get_named_type(field_def.type)):
+            try:
+                args = get_argument_values(field_def, field_node, self.variables)
+            except GraphQLError:
+                args = {}
+            size = args.get('first') if args.get('first') is not None else args.get('last')
+            # Sizes outside 0..max fail in the resolver, but only that field:
+            # a negative one must not cancel out the cost of its siblings.
+            return self.max_page_size if size is None else min(max(size, 0), self.max_page_size)
+        if is_list_type(get_nullable_type(field_def.type)):
+            # A connection's edges are already counted by the connection field.
+            return 1 if is_connection_type(parent_type) else self.default_list_size
+        return 1
+
+
+def check_query_cost(schema, document, operation_name, variables):
+    """Return (extensions, error); error is set when the operation is over budget."""
+    operation = get_operation_ast(document, operation_name)
+    if operation is None:
+        return None, None
+
+    max_depth = getattr(settings, 'GRAPHQL_MAX_QUERY_DEPTH', 10)
+    max_cost = getattr(settings, 'GRAPHQL_MAX_QUERY_COST', 25000)
+    depth, cost = QueryCostAnalyzer(schema, document, variables).analyze(operation)
+    extensions = {'cost': {'requestedQueryCost': cost, 'maximumAvailable': max_cost, 'depth': depth, 'maximumDepth': max_depth}}
+
+    if depth > max_depth:
+        return extensions, GraphQLError(
+            f'Query depth {depth} exceeds the maximum allowed depth of {max_depth}',
+            extensions={'code': 'QUERY_TOO_DEEP'},
+        )
+    if cost > max_cost:
+        return extensions, GraphQLError(
+            f'Query cost {cost} exceeds the maximum allowed cost of {max_cost}',
+            extensions={'code': 'QUERY_TOO_COMPLEX'},
+        )
+    return extensions, None
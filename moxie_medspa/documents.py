@@ -0,0 +1,96 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from graphene_django.settings import graphene_settings
+from graphql import GraphQLError, parse
+from graphql.validation import validate
+
+PERSISTED_QUERY_VERSION = 1
+
+
+def query_hash(query):
+    return hashlib.sha256(query.encode()).hexdigest()
+
+
+class DocumentCache:
+    """LRU of parsed and validated documents, keyed by the sha256 of the query.
+
+    Only documents that pass validation are stored, so a hit can skip both
+    parse() and validate().
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._documents = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_document(self, schema, query, validation_rules=None):
+        key = (schema, tuple(validation_rules or ()), query_hash(query))
+        with self._lock:
+            document = self._documents.get(key)
+            if document is not None:
+                self._documents.move_to_end(key)
+                self.hits += 1
+                return document, []
+            self.misses += 1
+
+        try:
+            document = parse(query)
+        except GraphQLError as error:
+            return None, [error]
+
+        errors = validate(schema, document, validation_rules, graphene_settings.MAX_VALIDATION_ERRORS)
+        if errors:
+            return None, errors
+
+        with self._lock:
+            self._documents[key] = document
+            while len(self._documents) > self.maxsize:
+                self._documents.popitem(last=False)
+        return document, []
+
+    def clear(self):
+        with self._lock:
+            self._documents.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._documents), 'maxsize': self.maxsize}
+
+
+document_cache = DocumentCache(getattr(settings, 'GRAPHQL_DOCUMENT_CACHE_SIZE', 512))
+
+
+def resolve_persisted_query(query, extensions):
+    """Automatic Persisted Queries: map `extensions.persistedQuery.sha256Hash` to a query.
+
+    A request with only the hash is served from the store; a request with both
+    registers the query under its hash once the hash has been verified.
+    """
+    persisted_query = (extensions or {}).get('persistedQuery')
+    if not persisted_query:
+        return query
+
+    if persisted_query.get('version') != PERSISTED_QUERY_VERSION:
+        raise GraphQLError('PersistedQueryNotSupported', extensions={'code': 'PERSISTED_QUERY_NOT_SUPPORTED'})
+
+    sha256_hash = persisted_query.get('sha256Hash')
+    store = caches[getattr(settings, 'GRAPHQL_PERSISTED_QUERIES_CACHE', 'default')]
+    key = f'graphql:apq:{sha256_hash}'
+
+    if query:
+        if query_hash(query) != sha256_hash:
+            raise GraphQLError('provided sha does not match query', extensions={'code': 'INVALID_SHA256_HASH'})
+        store.set(key, query, timeout=None)
+        return query
+
+    query = store.get(key)
+    if query is None:
+        raise GraphQLError('PersistedQueryNotFound', extensions={'code': 'PERSISTED_QUERY_NOT_FOUND'})
+    return query
@@ -0,0 +1,260 @@
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from moxie_medspa.routing import replica_aliases, replica_staleness
+
+
+def row_values(instance):
+    return tuple(getattr(instance, field.attname) for field in instance._meta.concrete_fields)
+
+
+class CatalogCache:
+    """Process-wide LRU of catalog rows (Medspa, Service) by primary key,
+    shared by every request's IdentityMap.
+
+    Entries hold field values, so each hit builds its own instance. Saving or
+    deleting a row invalidates it (see moxie_medspa.signals): its entry
+    becomes a tombstone carrying a new version, and a read that began before
+    that version is not stored. Versions are process-local, so other workers
+    see a change only when their entry's `ttl` runs out.
+    """
+
+    def __init__(self, maxsize=1024, ttl=60, enabled=True):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.enabled = enabled
+        self.version = 0
+        self._entries = OrderedDict()  # (label, pk) -> (values or None, version, expires_at)
+        self._evicted_version = 0  # newest tombstone pushed out by the LRU
+        self._invalidated = deque()  # (time.monotonic(), version) of recent invalidations
+        self._forgotten_at = -math.inf  # time of the newest one dropped from it
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.identity_map_hits = 0
+
+    def get_many(self, model, pks):
+        if not self.enabled:
+            return {}
+        now = time.monotonic()
+        found = {}
+        with self._lock:
+            for pk in pks:
+                key = (model._meta.label, pk)
+                values, _, expires_at = self._entries.get(key, (None, None, None))
+                if values is not None and expires_at > now:
+                    self._entries.move_to_end(key)
+                    found[pk] = values
+            self.hits += len(found)
+            self.misses += len(pks) - len(found)
+        field_names = [field.attname for field in model._meta.concrete_fields]
+        return {pk: model.from_db(None, field_names, values) for pk, values in found.items()}
+
+    def version_at(self, moment):
+        """The version that was current at `moment` (time.monotonic()), or None
+        if that is further back than the invalidations remembered."""
+        with self._lock:
+            version = self.version
+            if moment < self._forgotten_at:
+                return None
+            for invalidated_at, invalidated_version in reversed(self._invalidated):
+                if invalidated_at <= moment:
+                    break
+                version = invalidated_version - 1
+            return version
+
+    def set_many(self, instances, version):
+        """Store rows read from the database after `version` was current."""
+        if not self.enabled:
+            return
+        expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            if version is None or version < self._evicted_version:
+                return
+            for instance in instances:
+                key = (instance._meta.label, instance.pk)
+                _, entry_version, _ = self._entries.get(key, (None, 0, None))
+                if entry_version > version:
+                    continue  # invalidated while it was being read
+                self._entries[key] = (row_values(instance), version, expires_at)
+                self._entries.move_to_end(key)
+            self._evict()
+
+    def invalidate(self, model, pk):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.version += 1
+            self.invalidations += 1
+            self._remember_invalidation()
+            key = (model._meta.label, pk)
+            self._entries[key] = (None, self.version, math.inf)
+            self._entries.move_to_end(key)
+            self._evict()
+
+    def invalidate_all(self):
+        # For rows written without save signals, e.g. by import_medspa_data.
+        with self._lock:
+            self.version += 1
+            self.invalidations += 1
+            self._remember_invalidation()
+            self._entries.clear()
+            self._evicted_version = self.version
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._invalidated.clear()
+            self._forgotten_at = -math.inf
+            self._evicted_version = self.version
+            self.hits = 0
+            self.misses = 0
+            self.invalidations = 0
+            self.identity_map_hits = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'enabled': self.enabled,
+            'size': len(self._entries),
+            'identity_map_hits': self.identity_map_hits,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+            'invalidations': self.invalidations,
+        }
+
+    def _remember_invalidation(self):
+        self._invalidated.append((time.monotonic(), self.version))
+        if len(self._invalidated) > self.maxsize:
+            self._forgotten_at = self._invalidated.popleft()[0]
+
+    def _evict(self):
+        while len(self._entries) > self.maxsize:
+            _, (values, version, _) = self._entries.popitem(last=False)
+            if values is None:
+                self._evicted_version = max(self._evicted_version, version)
+
+
+class IdentityMap:
+    """Catalog rows loaded during one request, by primary key, so each row is
+    read at most once per request and every lookup gets the same instance.
+    Rows it has not seen come from the process-wide cache, then from one
+    `IN (...)` query per call.
+
+    `select_related` names foreign keys to join when the rows are read; the
+    joined rows are kept as well.
+
+    Mutations pass `shared=False`: they act on what they read, so they only
+    take rows this request read from the database itself, and what they read
+    inside their transaction is not shared.
+    """
+
+    def __init__(self, cache):
+        self.cache = cache
+        self.rows = {}
+        self.fresh = set()
+
+    def get(self, model, pk, shared=True, select_related=()):
+        rows = self.get_many(model, [pk], shared, select_related)
+        if not rows:
+            raise model.DoesNotExist(f'{model._meta.object_name} matching query does not exist.')
+        return next(iter(rows.values()))
+
+    async def aget(self, model, pk, shared=True, select_related=()):
+        rows = await self.aget_many(model, [pk], shared, select_related)
+        if not rows:
+            raise model.DoesNotExist(f'{model._meta.object_name} matching query does not exist.')
+        return next(iter(rows.values()))
+
+    def get_many(self, model, pks, shared=True, select_related=()):
+        """The rows among `pks` that exist, by primary key."""
+        rows, missing = self.lookup(model, pks, shared)
+        if missing:
+            found, version = self.read(model, missing, select_related)
+            rows.update(self.remember(found.values(), select_related, version, shared))
+        return rows
+
+    async def aget_many(self, model, pks, shared=True, select_related=()):
+        rows, missing = self.lookup(model, pks, shared)
+        if missing:
+            # Routing the read can measure replica lag, which runs SQL.
+            found, version = await sync_to_async(self.read)(model, missing, select_related)
+            rows.update(self.remember(found.values(), select_related, version, shared))
+        return rows
+
+    def read(self, model, pks, select_related):
+        queryset = self.queryset(model, select_related)
+        version = self.read_version(queryset)
+        return queryset.in_bulk(pks), version
+
+    def queryset(self, model, select_related):
+        # select_related() with no names would join every foreign key.
+        return model.objects.select_related(*select_related) if select_related else model.objects.all()
+
+    def read_version(self, queryset):
+        # A replica may not have replayed invalidations from the last
+        # replica_staleness() seconds yet, so its rows count as read before them.
+        if queryset.db in replica_aliases():
+            return self.cache.version_at(time.monotonic() - replica_staleness())
+        return self.cache.version
+
+    def add(self, instances):
+        # Rows the caller read itself, e.g. locked with select_for_update().
+        for instance in instances:
+            key = (type(instance), instance.pk)
+            self.rows[key] = instance
+            self.fresh.add(key)
+
+    def lookup(self, model, pks, shared):
+        rows = {}
+        missing = []
+        for pk in dict.fromkeys(model._meta.pk.to_python(pk) for pk in pks):
+            key = (model, pk)
+            if key in self.rows and (shared or key in self.fresh):
+                rows[pk] = self.rows[key]
+            else:
+                missing.append(pk)
+        self.cache.identity_map_hits += len(rows)
+        if shared and missing:
+            cached = self.cache.get_many(model, missing)
+            for pk, instance in cached.items():
+                self.rows[(model, pk)] = rows[pk] = instance
+            missing = [pk for pk in missing if pk not in cached]
+        return rows, missing
+
+    def remember(self, instances, select_related, version, shared):
+        instances = list(instances)
+        related = [
+            getattr(instance, name) for instance in instances for name in select_related if getattr(instance, name) is not None
+        ]
+        # Joined rows do not replace ones this request already holds.
+        related = [row for row in related if (type(row), row.pk) not in self.rows]
+        if shared:
+            self.cache.set_many(instances + related, version)
+        self.add(related)
+        self.add(instances)
+        return {instance.pk: instance for instance in instances}
+
+
+def create_catalog_cache():
+    config = getattr(settings, 'CATALOG_CACHE', {})
+    return CatalogCache(maxsize=config.get('MAXSIZE', 1024), ttl=config.get('TTL', 60), enabled=config.get('ENABLED', False))
+
+
+catalog_cache = create_catalog_cache()
+
+
+def get_identity_map(context):
+    # Lives on the request, like the DataLoaders, and is dropped with them.
+    identity_map = getattr(context, 'identity_map', None)
+    if identity_map is None:
+        identity_map = IdentityMap(catalog_cache)
+        context.identity_map = identity_map
+    return identity_map
@@ -0,0 +1,140 @@
+from collections import defaultdict
+from functools import partial
+
+from graphene.utils.dataloader import DataLoader
+from graphql import is_non_null_type
+from graphql.pyutils import Path
+from graphql_sync_dataloaders import DeferredExecutionContext as BaseDeferredExecutionContext, SyncDataLoader
+
+from moxie_medspa.identity import get_identity_map
+from moxie_medspa.models import Medspa, Service, Appointment
+
+# Batch functions receive every key requested during one execution tick and
+# must return one value per key, in the same order. Each one issues a single
+# `IN (...)` query no matter how many keys were queued. Medspas and services
+# by id go through the request's identity map, which skips rows it already has.
+
+def load_medspas(identity_map, medspa_ids):
+    medspas = identity_map.get_many(Medspa, medspa_ids)
+    return [medspas.get(medspa_id) for medspa_id in medspa_ids]
+
+def load_services(identity_map, service_ids):
+    services = identity_map.get_many(Service, service_ids)
+    return [services.get(service_id) for service_id in service_ids]
+
+def load_services_by_medspa(medspa_ids):
+    services = defaultdict(list)
+    for service in Service.objects.filter(medspa_id__in=medspa_ids):
+        services[service.medspa_id].append(service)
+    return [services[medspa_id] for medspa_id in medspa_ids]
+
+def load_appointments_by_medspa(medspa_ids):
+    appointments = defaultdict(list)
+    for appointment in Appointment.objects.filter(medspa_id__in=medspa_ids):
+        appointments[appointment.medspa_id].append(appointment)
+    return [appointments[medspa_id] for medspa_id in medspa_ids]
+
+def load_services_by_appointment(appointment_ids):
+    services = defaultdict(list)
+    links = Appointment.services.through.objects.filter(appointment_id__in=appointment_ids).select_related('service')
+    for link in links:
+        services[link.appointment_id].append(link.service)
+    return [services[appointment_id] for appointment_id in appointment_ids]
+
+def load_appointments_by_service(service_ids):
+    appointments = defaultdict(list)
+    links = Appointment.services.through.objects.filter(service_id__in=service_ids).select_related('appointment')
+    for link in links:
+        appointments[link.service_id].append(link.appointment)
+    return [appointments[service_id] for service_id in service_ids]
+
+# The same batches through the async ORM, for AsyncLoaders.
+
+async def aload_medspas(identity_map, medspa_ids):
+    medspas = await identity_map.aget_many(Medspa, medspa_ids)
+    return [medspas.get(medspa_id) for medspa_id in medspa_ids]
+
+async def aload_services(identity_map, service_ids):
+    services = await identity_map.aget_many(Service, service_ids)
+    return [services.get(service_id) for service_id in service_ids]
+
+async def aload_services_by_medspa(medspa_ids):
+    services = defaultdict(list)
+    async for service in Service.objects.filter(medspa_id__in=medspa_ids):
+        services[service.medspa_id].append(service)
+    return [services[medspa_id] for medspa_id in medspa_ids]
+
+async def aload_appointments_by_medspa(medspa_ids):
+    appointments = defaultdict(list)
+    async for appointment in Appointment.objects.filter(medspa_id__in=medspa_ids):
+        appointments[appointment.medspa_id].append(appointment)
+    return [appointments[medspa_id] for medspa_id in medspa_ids]
+
+async def aload_services_by_appointment(appointment_ids):
+    services = defaultdict(list)
+    links = Appointment.services.through.objects.filter(appointment_id__in=appointment_ids).select_related('service')
+    async for link in links:
+        services[link.appointment_id].append(link.service)
+    return [services[appointment_id] for appointment_id in appointment_ids]
+
+async def aload_appointments_by_service(service_ids):
+    appointments = defaultdict(list)
+    links = Appointment.services.through.objects.filter(service_id__in=service_ids).select_related('appointment')
+    async for link in links:
+        appointments[link.service_id].append(link.appointment)
+    return [appointments[service_id] for service_id in service_ids]
+
+
+class DeferredExecutionContext(BaseDeferredExecutionContext):
+    # graphql-sync-dataloaders still calls the pre-3.2.4 two-argument
+    # handle_field_error(); rebuild the path from the located error instead.
+    def handle_field_error(self, error, return_type, path=None):
+        if is_non_null_type(return_type):
+            raise error
+        if path is None:
+            for key in error.path or []:
+                path = Path(path, key, None)
+        self.collected_errors.add(error, path)
+
+
+class Loaders:
+    def __init__(self, identity_map):
+        self.medspa = SyncDataLoader(partial(load_medspas, identity_map))
+        self.service = SyncDataLoader(partial(load_services, identity_map))
+        self.services_by_medspa = SyncDataLoader(load_services_by_medspa)
+        self.appointments_by_medspa = SyncDataLoader(load_appointments_by_medspa)
+        self.services_by_appointment = SyncDataLoader(load_services_by_appointment)
+        self.appointments_by_service = SyncDataLoader(load_appointments_by_service)
+
+
+class AsyncLoaders:
+    # asyncio DataLoaders: loads queued in one event loop tick share a batch.
+    def __init__(self, identity_map):
+        self.medspa = DataLoader(partial(aload_medspas, identity_map))
+        self.service = DataLoader(partial(aload_services, identity_map))
+        self.services_by_medspa = DataLoader(aload_services_by_medspa)
+        self.appointments_by_medspa = DataLoader(aload_appointments_by_medspa)
+        self.services_by_appointment = DataLoader(aload_services_by_appointment)
+        self.appointments_by_service = DataLoader(aload_appointments_by_service)
+
+
+def is_async_execution(info):
+    # Set by AsyncMedspaGraphQLView while it executes a query on the event loop.
+    return getattr(info.context, 'async_execution', False)
+
+def get_loaders(info):
+    # Loaders live on the request so their caches never outlive it.
+    context = info.context
+    name, loaders_class = ('async_loaders', AsyncLoaders) if is_async_execution(info) else ('loaders', Loaders)
+    loaders = getattr(context, name, None)
+    if loaders is None:
+        loaders = loaders_class(get_identity_map(context))
+        setattr(context, name, loaders)
+    return loaders
+
+def clear_loaders(context):
+    # After a mutation, so later operations in a batch do not read rows
+    # cached before it.
+    context.loaders = None
+    context.async_loaders = None
+    context.identity_map = None
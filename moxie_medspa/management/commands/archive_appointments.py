@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from moxie_medspa.partitions import add_months, archive_partition, is_partitioned, partition_months
+
+
+class Command(BaseCommand):
+    help = (
+        'Take whole months of appointments before --before out of the appointment table, one month per '
+        'transaction. Each month\'s partition is detached and kept as a table of its own, or with --compress '
+        'stored as one compressed row of the appointment archive and dropped. Reporting rollups are kept.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--before', required=True, help='Archive the months that end by this ISO 8601 date.')
+        parser.add_argument('--compress', action='store_true', help='Fold each month into the archive table and drop its partition.')
+        parser.add_argument('--dry-run', action='store_true', help='List the months that would be archived.')
+
+    def handle(self, *args, **options):
+        if not is_partitioned():
+            raise CommandError('The appointment table is not partitioned (PostgreSQL only).')
+        before = parse_date(options['before'])
+        if before is None:
+            raise CommandError(f'Invalid --before: {options["before"]}')
+
+        months = [month for month in partition_months() if add_months(month, 1) <= before]
+        if options['dry_run']:
+            self.stdout.write(f'Would archive {len(months)} months: {", ".join(f"{month:%Y-%m}" for month in months)}')
+            return
+
+        started = time.perf_counter()
+        archived = 0
+        for month in months:
+            count = archive_partition(month, compress=options['compress'])
+            archived += count
+            self.stdout.write(f'Archived {month:%Y-%m}: {count} appointments')
+        self.stdout.write(self.style.SUCCESS(
+            f'Archived {archived} appointments from {len(months)} months in {time.perf_counter() - started:.2f}s'
+        ))
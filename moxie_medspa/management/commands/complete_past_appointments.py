@@ -0,0 +1,54 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from moxie_medspa.booking import set_statuses
+from moxie_medspa.models import Appointment
+
+
+class Command(BaseCommand):
+    help = (
+        'Mark scheduled appointments that have ended as completed. Works through them in batches of '
+        '--batch-size, each in its own short transaction, so no lock is held for the whole run.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--before', help='Complete appointments ended by this ISO 8601 time instead of now.')
+        parser.add_argument('--pause', type=float, default=0, help='Seconds to sleep between batches.')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+        cutoff = timezone.now()
+        if options['before']:
+            cutoff = parse_datetime(options['before'])
+            if cutoff is None:
+                raise CommandError(f'Invalid --before: {options["before"]}')
+            if timezone.is_naive(cutoff):
+                cutoff = timezone.make_aware(cutoff)
+
+        # The partial index on scheduled appointments' start_time serves this scan.
+        past_appointments = (
+            Appointment.objects.filter(status='scheduled').ended_by(cutoff).order_by('start_time').values_list('id', flat=True)
+        )
+        started = time.perf_counter()
+        completed = batches = 0
+        while True:
+            with transaction.atomic():
+                # set_statuses locks the rows and re-checks their status, so
+                # rows changed since this read are skipped, not overwritten.
+                appointment_ids = list(past_appointments[:options['batch_size']])
+                if not appointment_ids:
+                    break
+                completed += len(set_statuses(appointment_ids, 'completed'))
+            batches += 1
+            if options['pause']:
+                time.sleep(options['pause'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Completed {completed} appointments in {batches} batches in {time.perf_counter() - started:.2f}s'
+        ))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from moxie_medspa.partitions import ensure_partitions, is_partitioned
+
+
+class Command(BaseCommand):
+    help = (
+        'Create the monthly appointment partitions for the next APPOINTMENT_PARTITION_MONTHS_AHEAD months, and for '
+        'months with rows in the default partition, moving those rows over. Run it daily from cron.'
+    )
+
+    def handle(self, *args, **options):
+        if not is_partitioned():
+            raise CommandError('The appointment table is not partitioned (PostgreSQL only).')
+        created = ensure_partitions()
+        months = ', '.join(f'{month:%Y-%m}' for month in created) or 'none needed'
+        self.stdout.write(self.style.SUCCESS(f'Created {len(created)} appointment partitions ({months})'))
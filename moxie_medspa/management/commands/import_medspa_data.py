@@ -0,0 +1,372 @@
+import csv
+import datetime
+import decimal
+import io
+import json
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from moxie_medspa.identity import catalog_cache
+from moxie_medspa.models import MAX_APPOINTMENT_DURATION, Medspa, Service, Appointment, uuid7
+from moxie_medspa.partitions import ensure_partitions
+from moxie_medspa.reporting import rebuild_rollups
+from moxie_medspa.response_cache import response_cache
+
+SERVICE_COLUMNS = ['id', 'name', 'description', 'price', 'duration', 'medspa_id']
+APPOINTMENT_COLUMNS = ['id', 'start_time', 'total_duration', 'total_price', 'status', 'medspa_id']
+LINK_COLUMNS = ['appointment_id', 'service_id']
+STATUSES = {status for status, _ in Appointment.STATUS_CHOICES}
+
+
+class InvalidRow(Exception):
+    pass
+
+
+def read_records(path):
+    """Yield (line number, dict) from a CSV or NDJSON file without loading it whole."""
+    with open(path, newline='') as file:
+        if path.endswith(('.ndjson', '.jsonl')):
+            for line_number, line in enumerate(file, start=1):
+                if line.strip():
+                    try:
+                        yield line_number, json.loads(line)
+                    except ValueError:
+                        yield line_number, None
+        else:
+            reader = csv.DictReader(file)
+            for record in reader:
+                yield reader.line_num, record
+
+
+def parse_uuid(value, field):
+    try:
+        return uuid.UUID(str(value))
+    except (TypeError, ValueError):
+        raise InvalidRow(f'{field} must be a UUID')
+
+def parse_service(record, medspa):
+    if not isinstance(record, dict):
+        raise InvalidRow('invalid JSON')
+    try:
+        price = decimal.Decimal(str(record['price']))
+        duration = int(record['duration'])
+    except (KeyError, ValueError, decimal.InvalidOperation):
+        raise InvalidRow('price and duration are required numbers')
+    if not record.get('name'):
+        raise InvalidRow('name is required')
+    if duration <= 0:
+        raise InvalidRow('duration must be positive')
+    if record.get('medspa_id') and parse_uuid(record['medspa_id'], 'medspa_id') != medspa.id:
+        raise InvalidRow('medspa_id does not match --medspa')
+    return {
+        'id': parse_uuid(record['id'], 'id') if record.get('id') else uuid7(),
+        'name': record['name'],
+        'description': record.get('description') or '',
+        'price': price,
+        'duration': duration,
+        'medspa_id': medspa.id,
+    }
+
+def parse_appointment(record, medspa):
+    if not isinstance(record, dict):
+        raise InvalidRow('invalid JSON')
+    start_time = parse_datetime(str(record.get('start_time') or ''))
+    if start_time is None:
+        raise InvalidRow('start_time must be an ISO 8601 datetime')
+    if timezone.is_naive(start_time):
+        start_time = timezone.make_aware(start_time)
+    status = record.get('status') or 'scheduled'
+    if status not in STATUSES:
+        raise InvalidRow(f'status must be one of {sorted(STATUSES)}')
+    service_ids = record.get('service_ids') or []
+    if isinstance(service_ids, str):
+        service_ids = [service_id for service_id in service_ids.split('|') if service_id]
+    if not service_ids:
+        raise InvalidRow('service_ids is required')
+    if record.get('medspa_id') and parse_uuid(record['medspa_id'], 'medspa_id') != medspa.id:
+        raise InvalidRow('medspa_id does not match --medspa')
+    return {
+        'id': parse_uuid(record['id'], 'id') if record.get('id') else uuid7(),
+        'start_time': start_time,
+        'status': status,
+        'medspa_id': medspa.id,
+        'service_ids': list(dict.fromkeys(parse_uuid(service_id, 'service_ids') for service_id in service_ids)),
+    }
+
+
+class CopyLoader:
+    """Stages batches with COPY FROM STDIN into UNLOGGED tables and merges
+    them into the real tables in a single transaction at the end."""
+
+    def __init__(self, job):
+        self.tables = {
+            'service': f'import_{job}_service',
+            'appointment': f'import_{job}_appointment',
+            'link': f'import_{job}_appointment_services',
+        }
+        self.progress_table = f'import_{job}_progress'
+
+    def exists(self):
+        return self.progress_table in connection.introspection.table_names()
+
+    def create(self):
+        with connection.cursor() as cursor:
+            for name, model_table in [
+                ('service', Service._meta.db_table),
+                ('appointment', Appointment._meta.db_table),
+            ]:
+                cursor.execute(f'CREATE UNLOGGED TABLE {self.tables[name]} (LIKE {model_table} INCLUDING DEFAULTS)')
+            cursor.execute(f'CREATE UNLOGGED TABLE {self.tables["link"]} (appointment_id uuid NOT NULL, service_id uuid NOT NULL)')
+            cursor.execute(f'CREATE TABLE {self.progress_table} (kind varchar(20) PRIMARY KEY, rows bigint NOT NULL)')
+
+    def drop(self):
+        with connection.cursor() as cursor:
+            for table in [*self.tables.values(), self.progress_table]:
+                cursor.execute(f'DROP TABLE IF EXISTS {table}')
+
+    def get_progress(self, kind):
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT rows FROM {self.progress_table} WHERE kind = %s', [kind])
+            row = cursor.fetchone()
+        return row[0] if row else 0
+
+    def set_progress(self, kind, rows):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.progress_table} WHERE kind = %s', [kind])
+            cursor.execute(f'INSERT INTO {self.progress_table} (kind, rows) VALUES (%s, %s)', [kind, rows])
+
+    def lookup_services(self, medspa, service_ids):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'''
+                SELECT id, duration, price FROM {Service._meta.db_table} WHERE medspa_id = %s AND id = ANY(%s)
+                UNION ALL
+                SELECT id, duration, price FROM {self.tables['service']} WHERE id = ANY(%s)
+                ''',
+                [medspa.id, list(service_ids), list(service_ids)],
+            )
+            return {service_id: (duration, price) for service_id, duration, price in cursor.fetchall()}
+
+    def lookup_appointments(self, appointment_ids):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'''
+                SELECT id, start_time FROM {Appointment._meta.db_table} WHERE id = ANY(%s)
+                UNION ALL
+                SELECT id, start_time FROM {self.tables['appointment']} WHERE id = ANY(%s)
+                ''',
+                [list(appointment_ids), list(appointment_ids)],
+            )
+            return dict(cursor.fetchall())
+
+    def load(self, name, columns, rows):
+        buffer = io.StringIO()
+        # Quoted so COPY reads empty strings as '' rather than NULL.
+        writer = csv.writer(buffer, quoting=csv.QUOTE_ALL)
+        for row in rows:
+            writer.writerow([row[column] for column in columns])
+        with connection.cursor() as cursor:
+            with cursor.copy(f'COPY {self.tables[name]} ({", ".join(columns)}) FROM STDIN WITH (FORMAT csv)') as copy:
+                copy.write(buffer.getvalue())
+
+    def merge(self):
+        link_table = Appointment.services.through._meta.db_table
+        with connection.cursor() as cursor:
+            # Imported history gets monthly partitions rather than piling up in the default one.
+            cursor.execute(f"SELECT DISTINCT date_trunc('month', start_time AT TIME ZONE 'UTC')::date FROM {self.tables['appointment']}")
+            ensure_partitions([month for month, in cursor.fetchall()])
+            service_columns = ', '.join(SERVICE_COLUMNS)
+            cursor.execute(
+                f'INSERT INTO {Service._meta.db_table} ({service_columns}) '
+                f'SELECT {service_columns} FROM {self.tables["service"]} ON CONFLICT DO NOTHING'
+            )
+            # The appointment primary key includes start_time (see partitions),
+            # so ON CONFLICT alone would let an id in twice. Appointments whose
+            # id is taken are skipped, and links only go to the stored row
+            # with the staged start_time.
+            appointment_columns = ', '.join(APPOINTMENT_COLUMNS)
+            cursor.execute(
+                f'''
+                INSERT INTO {Appointment._meta.db_table} ({appointment_columns})
+                SELECT {appointment_columns} FROM {self.tables['appointment']} AS staged
+                WHERE NOT EXISTS (SELECT 1 FROM {Appointment._meta.db_table} AS existing WHERE existing.id = staged.id)
+                ON CONFLICT DO NOTHING
+                '''
+            )
+            cursor.execute(
+                f'''
+                INSERT INTO {link_table} (appointment_id, service_id)
+                SELECT link.appointment_id, link.service_id FROM {self.tables['link']} AS link
+                JOIN {self.tables['appointment']} AS staged ON staged.id = link.appointment_id
+                JOIN {Appointment._meta.db_table} AS appointment ON appointment.id = staged.id AND appointment.start_time = staged.start_time
+                ON CONFLICT DO NOTHING
+                '''
+            )
+
+
+class BulkCreateLoader:
+    """Fallback for databases without COPY (e.g. SQLite): every batch is
+    written to the real tables with bulk_create in its own transaction."""
+
+    def __init__(self, job):
+        self.progress_table = f'import_{job}_progress'
+
+    def exists(self):
+        return self.progress_table in connection.introspection.table_names()
+
+    def create(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'CREATE TABLE {self.progress_table} (kind varchar(20) PRIMARY KEY, rows bigint NOT NULL)')
+
+    def drop(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {self.progress_table}')
+
+    get_progress = CopyLoader.get_progress
+    set_progress = CopyLoader.set_progress
+
+    def lookup_services(self, medspa, service_ids):
+        services = Service.objects.filter(medspa=medspa, id__in=service_ids).values_list('id', 'duration', 'price')
+        return {service_id: (duration, price) for service_id, duration, price in services}
+
+    def lookup_appointments(self, appointment_ids):
+        return dict(Appointment.objects.filter(id__in=appointment_ids).values_list('id', 'start_time'))
+
+    def load(self, name, columns, rows):
+        model = {'service': Service, 'appointment': Appointment, 'link': Appointment.services.through}[name]
+        model.objects.bulk_create([model(**{column: row[column] for column in columns}) for row in rows], ignore_conflicts=True)
+
+    def merge(self):
+        pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Bulk load services and appointments for one medspa from CSV or NDJSON files. '
+        'Batches are validated and staged with COPY (PostgreSQL), then merged in one '
+        'transaction. Interrupted imports continue where they stopped with --resume.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--medspa', required=True, help='ID of the medspa the rows belong to.')
+        parser.add_argument('--services', help='CSV/NDJSON file: id, name, description, price, duration.')
+        parser.add_argument(
+            '--appointments',
+            help='CSV/NDJSON file: id, start_time, status, service_ids ("|" separated in CSV, a list in NDJSON).',
+        )
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--resume', action='store_true', help='Continue an interrupted import of this medspa.')
+        parser.add_argument('--restart', action='store_true', help='Discard an interrupted import and start over.')
+        parser.add_argument('--no-copy', action='store_true', help='Use bulk_create batches even on PostgreSQL.')
+
+    def handle(self, *args, **options):
+        try:
+            medspa = Medspa.objects.get(id=parse_uuid(options['medspa'], '--medspa'))
+        except (InvalidRow, Medspa.DoesNotExist):
+            raise CommandError(f'Medspa {options["medspa"]} not found')
+
+        use_copy = connection.vendor == 'postgresql' and not options['no_copy']
+        loader = (CopyLoader if use_copy else BulkCreateLoader)(medspa.id.hex)
+
+        if loader.exists():
+            if options['restart']:
+                loader.drop()
+            elif not options['resume']:
+                raise CommandError('An interrupted import exists for this medspa. Use --resume or --restart.')
+        if not loader.exists():
+            loader.create()
+
+        self.invalid_rows = 0
+        if options['services']:
+            self.import_file(loader, medspa, 'service', options['services'], options['batch_size'])
+        if options['appointments']:
+            self.import_file(loader, medspa, 'appointment', options['appointments'], options['batch_size'])
+
+        started = time.perf_counter()
+        with transaction.atomic():
+            loader.merge()
+            loader.drop()
+            # Merged rows bypass the mutations that maintain the reporting rollups.
+            rebuild_rollups(medspa.id)
+        # Nor do they fire the save signals that invalidate cached catalog reads.
+        response_cache.invalidate(f'medspa:{medspa.id}', f'medspa:{medspa.id}:services', 'medspas', 'services')
+        catalog_cache.invalidate_all()
+        if use_copy:
+            self.stdout.write(f'Merged staged rows in {time.perf_counter() - started:.2f}s')
+        self.stdout.write(self.style.SUCCESS(f'Import finished ({self.invalid_rows} invalid rows skipped)'))
+
+    def import_file(self, loader, medspa, kind, path, batch_size):
+        done = loader.get_progress(kind)
+        if done:
+            self.stdout.write(f'Resuming {kind}s after row {done}')
+
+        started = time.perf_counter()
+        loaded = 0
+        batch = []
+        position = done
+        for position, (line_number, record) in enumerate(read_records(path), start=1):
+            if position <= done:
+                continue
+            batch.append((line_number, record))
+            if len(batch) == batch_size:
+                loaded += self.load_batch(loader, medspa, kind, batch, position)
+                batch = []
+        if batch:
+            loaded += self.load_batch(loader, medspa, kind, batch, position)
+
+        elapsed = time.perf_counter() - started
+        rate = loaded / elapsed if elapsed else 0
+        self.stdout.write(f'Loaded {loaded} {kind}s in {elapsed:.2f}s ({rate:,.0f} rows/s)')
+
+    def load_batch(self, loader, medspa, kind, batch, position):
+        rows = []
+        for line_number, record in batch:
+            try:
+                row = parse_service(record, medspa) if kind == 'service' else parse_appointment(record, medspa)
+            except InvalidRow as error:
+                self.report_invalid(kind, line_number, error)
+                continue
+            row['line_number'] = line_number
+            rows.append(row)
+
+        links = []
+        if kind == 'appointment' and rows:
+            services = loader.lookup_services(medspa, {service_id for row in rows for service_id in row['service_ids']})
+            # Imported and staged appointments by id, so an id is never stored twice.
+            start_times = loader.lookup_appointments({row['id'] for row in rows})
+            valid_rows = []
+            for row in rows:
+                if start_times.get(row['id'], row['start_time']) != row['start_time']:
+                    self.report_invalid(kind, row['line_number'], f'appointment {row["id"]} already exists with another start_time')
+                    continue
+                missing = [service_id for service_id in row['service_ids'] if service_id not in services]
+                if missing:
+                    self.report_invalid(kind, row['line_number'], f'unknown service {missing[0]}')
+                    continue
+                row['total_duration'] = sum(services[service_id][0] for service_id in row['service_ids'])
+                row['total_price'] = sum(services[service_id][1] for service_id in row['service_ids'])
+                # The booking overlap check only looks this far back for appointments still running.
+                if datetime.timedelta(minutes=row['total_duration']) > MAX_APPOINTMENT_DURATION:
+                    self.report_invalid(kind, row['line_number'], f'appointments cannot be longer than {MAX_APPOINTMENT_DURATION}')
+                    continue
+                links.extend({'appointment_id': row['id'], 'service_id': service_id} for service_id in row['service_ids'])
+                start_times[row['id']] = row['start_time']
+                valid_rows.append(row)
+            rows = valid_rows
+
+        # The checkpoint is committed together with the rows it covers.
+        with transaction.atomic():
+            loader.load(kind, SERVICE_COLUMNS if kind == 'service' else APPOINTMENT_COLUMNS, rows)
+            if links:
+                loader.load('link', LINK_COLUMNS, links)
+            loader.set_progress(kind, position)
+        return len(rows)
+
+    def report_invalid(self, kind, line_number, error):
+        self.invalid_rows += 1
+        self.stderr.write(f'{kind} row {line_number}: {error}')
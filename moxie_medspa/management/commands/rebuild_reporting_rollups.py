@@ -0,0 +1,28 @@
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+
+from moxie_medspa.models import Medspa
+from moxie_medspa.reporting import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Recompute the daily reporting rollups from the appointments table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--medspa', help='Only rebuild the rollups of this medspa id.')
+
+    def handle(self, *args, **options):
+        medspa_id = None
+        if options['medspa']:
+            try:
+                medspa_id = uuid.UUID(options['medspa'])
+            except ValueError:
+                raise CommandError(f'Medspa {options["medspa"]} not found')
+            if not Medspa.objects.filter(id=medspa_id).exists():
+                raise CommandError(f'Medspa {medspa_id} not found')
+
+        started = time.perf_counter()
+        rebuild_rollups(medspa_id)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt reporting rollups in {time.perf_counter() - started:.2f}s'))
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:44
+
+import moxie_medspa.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('moxie_medspa', '0003_appointment_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='appointment',
+            name='id',
+            field=models.UUIDField(default=moxie_medspa.models.uuid7, editable=False, primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name='medspa',
+            name='id',
+            field=models.UUIDField(default=moxie_medspa.models.uuid7, editable=False, primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name='service',
+            name='id',
+            field=models.UUIDField(default=moxie_medspa.models.uuid7, editable=False, primary_key=True, serialize=False),
+        ),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+
+
+def backfill_rollups(apps, schema_editor):
+    Appointment = apps.get_model('moxie_medspa', 'Appointment')
+    DailyMedspaRollup = apps.get_model('moxie_medspa', 'DailyMedspaRollup')
+    DailyServiceRollup = apps.get_model('moxie_medspa', 'DailyServiceRollup')
+
+    medspa_rows = (
+        Appointment.objects.values('medspa_id', 'status', day=TruncDate('start_time'))
+        .annotate(appointment_count=Count('id'), revenue=Sum('total_price'))
+        .order_by()
+    )
+    DailyMedspaRollup.objects.bulk_create([DailyMedspaRollup(**row) for row in medspa_rows], batch_size=5000)
+
+    service_rows = (
+        Appointment.services.through.objects.values(
+            'service_id',
+            medspa_id=F('appointment__medspa_id'),
+            day=TruncDate('appointment__start_time'),
+            status=F('appointment__status'),
+        )
+        .annotate(booking_count=Count('id'))
+        .order_by()
+    )
+    DailyServiceRollup.objects.bulk_create([DailyServiceRollup(**row) for row in service_rows], batch_size=5000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('moxie_medspa', '0004_uuid7_primary_keys'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyMedspaRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('status', models.CharField(choices=[('scheduled', 'Scheduled'), ('completed', 'Completed'), ('canceled', 'Canceled')], max_length=50)),
+                ('appointment_count', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('medspa', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='moxie_medspa.medspa')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['day'], name='medspa_rollup_day_idx')],
+                'constraints': [models.UniqueConstraint(fields=('medspa', 'day', 'status'), name='daily_medspa_rollup_key')],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyServiceRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('status', models.CharField(choices=[('scheduled', 'Scheduled'), ('completed', 'Completed'), ('canceled', 'Canceled')], max_length=50)),
+                ('booking_count', models.IntegerField(default=0)),
+                ('medspa', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='moxie_medspa.medspa')),
+                ('service', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='moxie_medspa.service')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['medspa', 'day'], name='service_rollup_medspa_day_idx'), models.Index(fields=['day'], name='service_rollup_day_idx')],
+                'constraints': [models.UniqueConstraint(fields=('service', 'day', 'status'), name='daily_service_rollup_key')],
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,88 @@
+# Generated by Django 5.2.18 on 2026-10-17 13:18
+
+from django.db import migrations, models
+
+from moxie_medspa.partitions import DEFAULT_PARTITION, LINK_TABLE, TABLE, ensure_partitions
+
+
+def table_definitions(cursor, table):
+    """Statements recreating the indexes and foreign keys of `table`."""
+    cursor.execute(
+        'SELECT indexdef FROM pg_indexes WHERE schemaname = current_schema() AND tablename = %s AND indexname <> %s',
+        [table, f'{table}_pkey'],
+    )
+    statements = [indexdef.replace(' ON ONLY ', ' ON ') for indexdef, in cursor.fetchall()]
+    cursor.execute("SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'f'", [table])
+    statements.extend(f'ALTER TABLE {table} ADD CONSTRAINT {name} {definition}' for name, definition in cursor.fetchall())
+    return statements
+
+def partition_appointments(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        # A foreign key into a partitioned table has to include the partition
+        # key, which the through table does not have. Deleting an appointment
+        # through Django still deletes its links.
+        cursor.execute(
+            "SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass AND confrelid = %s::regclass AND contype = 'f'",
+            [LINK_TABLE, TABLE],
+        )
+        for name, in cursor.fetchall():
+            cursor.execute(f'ALTER TABLE {LINK_TABLE} DROP CONSTRAINT {name}')
+
+        definitions = table_definitions(cursor, TABLE)
+        cursor.execute(f'ALTER TABLE {TABLE} RENAME TO {TABLE}_unpartitioned')
+        cursor.execute(f'CREATE TABLE {TABLE} (LIKE {TABLE}_unpartitioned INCLUDING DEFAULTS) PARTITION BY RANGE (start_time)')
+        cursor.execute(f'CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {TABLE} DEFAULT')
+        cursor.execute(f"SELECT DISTINCT date_trunc('month', start_time AT TIME ZONE 'UTC')::date FROM {TABLE}_unpartitioned")
+        ensure_partitions([month for month, in cursor.fetchall()], using=schema_editor.connection.alias)
+        cursor.execute(f'INSERT INTO {TABLE} SELECT * FROM {TABLE}_unpartitioned')
+        cursor.execute(f'DROP TABLE {TABLE}_unpartitioned')
+
+        # Unique constraints on a partitioned table include the partition key,
+        # so the database no longer rejects an id stored with another
+        # start_time. Created appointments get fresh uuid7s; import_medspa_data,
+        # which keeps the ids from its files, checks for existing ones itself.
+        cursor.execute(f'ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_pkey PRIMARY KEY (id, start_time)')
+        for statement in definitions:
+            cursor.execute(statement)
+
+def unpartition_appointments(apps, schema_editor):
+    # Archived months stay where archive_appointments put them.
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        definitions = table_definitions(cursor, TABLE)
+        cursor.execute(f'ALTER TABLE {TABLE} RENAME TO {TABLE}_partitioned')
+        cursor.execute(f'CREATE TABLE {TABLE} (LIKE {TABLE}_partitioned INCLUDING DEFAULTS)')
+        cursor.execute(f'INSERT INTO {TABLE} SELECT * FROM {TABLE}_partitioned')
+        cursor.execute(f'DROP TABLE {TABLE}_partitioned')
+        cursor.execute(f'ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_pkey PRIMARY KEY (id)')
+        for statement in definitions:
+            cursor.execute(statement)
+        cursor.execute(
+            f'ALTER TABLE {LINK_TABLE} ADD CONSTRAINT {LINK_TABLE}_appointment_id_fk '
+            f'FOREIGN KEY (appointment_id) REFERENCES {TABLE} (id) DEFERRABLE INITIALLY DEFERRED'
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('moxie_medspa', '0005_reporting_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AppointmentArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(unique=True)),
+                ('appointment_count', models.IntegerField()),
+                ('table_name', models.CharField(blank=True, max_length=63)),
+                ('appointments', models.JSONField(null=True)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.RunPython(partition_appointments, unpartition_appointments),
+    ]
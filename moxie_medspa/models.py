@@ -1,8 +1,28 @@
 from django.db import models
+from django.utils import timezone
+import datetime
+import os
+import time
 import uuid
 
+# Longest booking we accept. Lets overlap checks bound their start_time range
+# scan instead of reading a medspa's whole history.
+MAX_APPOINTMENT_DURATION = datetime.timedelta(hours=24)
+
+def uuid7(timestamp_ms=None):
+    """Time-ordered UUID (RFC 9562 version 7): a 48-bit Unix millisecond
+    timestamp followed by 74 random bits. New keys land at the right edge of
+    the primary key B-tree instead of on random pages. Any UUID stays a valid
+    id, so rows created with uuid4 are unaffected."""
+    if timestamp_ms is None:
+        timestamp_ms = time.time_ns() // 1_000_000
+    random_bits = int.from_bytes(os.urandom(10), 'big')
+    rand_a = random_bits >> 68
+    rand_b = random_bits & ((1 << 62) - 1)
+    return uuid.UUID(int=(timestamp_ms & ((1 << 48) - 1)) << 80 | 0x7 << 76 | rand_a << 64 | 0b10 << 62 | rand_b)
+
 class Medspa(models.Model):
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    id = models.UUIDField(primary_key=True, default=uuid7, editable=False)
     name = models.CharField(max_length=255)
     address = models.TextField()
     phone_number = models.CharField(max_length=20)
@@ -12,7 +32,7 @@ class Medspa(models.Model):
         return self.name
 
 class Service(models.Model):
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    id = models.UUIDField(primary_key=True, default=uuid7, editable=False)
     name = models.CharField(max_length=255)
     description = models.TextField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
@@ -22,6 +42,33 @@ class Service(models.Model):
     def __str__(self):
         return self.name
 
+def end_time_expression():
+    return models.ExpressionWrapper(
+        models.F('start_time') + models.F('total_duration') * datetime.timedelta(minutes=1),
+        output_field=models.DateTimeField(),
+    )
+
+class AppointmentQuerySet(models.QuerySet):
+    # Plain comparisons on start_time so the (.., start_time) indexes apply;
+    # `start_time__date` would wrap the column in a cast and skip them.
+    def in_range(self, start=None, end=None):
+        query = self
+        if start:
+            query = query.filter(start_time__gte=start)
+        if end:
+            query = query.filter(start_time__lt=end)
+        return query
+
+    def on_date(self, date):
+        start = datetime.datetime.combine(date, datetime.time.min, tzinfo=timezone.get_current_timezone())
+        return self.in_range(start, start + datetime.timedelta(days=1))
+
+    def overlapping(self, start, end):
+        return self.in_range(start - MAX_APPOINTMENT_DURATION, end).alias(end_time=end_time_expression()).filter(end_time__gt=start)
+
+    def ended_by(self, moment):
+        return self.in_range(end=moment).alias(end_time=end_time_expression()).filter(end_time__lte=moment)
+
 class Appointment(models.Model):
     STATUS_CHOICES = [
         ('scheduled', 'Scheduled'),
@@ -29,7 +76,7 @@ class Appointment(models.Model):
         ('canceled', 'Canceled'),
     ]
 
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    id = models.UUIDField(primary_key=True, default=uuid7, editable=False)
     start_time = models.DateTimeField()
     total_duration = models.IntegerField()
     total_price = models.DecimalField(max_digits=10, decimal_places=2)
@@ -37,5 +84,66 @@ class Appointment(models.Model):
     medspa = models.ForeignKey(Medspa, related_name='appointments', on_delete=models.CASCADE)
     services = models.ManyToManyField(Service, related_name='appointments')
 
+    objects = AppointmentQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['start_time', 'id'], name='appointment_start_idx'),
+            models.Index(fields=['medspa', 'start_time'], name='appointment_medspa_start_idx'),
+            models.Index(fields=['status', 'start_time'], name='appointment_status_start_idx'),
+            models.Index(fields=['start_time'], condition=models.Q(status='scheduled'), name='appointment_scheduled_idx'),
+        ]
+
+    @property
+    def end_time(self):
+        return self.start_time + datetime.timedelta(minutes=self.total_duration)
+
     def __str__(self):
         return f'Appointment {self.id} - {self.status}'
+
+# Daily aggregates behind the reporting queries, maintained by
+# moxie_medspa.reporting as appointments are booked and change status.
+# `day` is the appointment's start date in the server time zone. Foreign keys
+# skip their own index: the unique keys and indexes below lead with them.
+
+class DailyMedspaRollup(models.Model):
+    medspa = models.ForeignKey(Medspa, related_name='+', on_delete=models.CASCADE, db_index=False)
+    day = models.DateField()
+    status = models.CharField(max_length=50, choices=Appointment.STATUS_CHOICES)
+    appointment_count = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['medspa', 'day', 'status'], name='daily_medspa_rollup_key'),
+        ]
+        indexes = [
+            models.Index(fields=['day'], name='medspa_rollup_day_idx'),
+        ]
+
+class DailyServiceRollup(models.Model):
+    service = models.ForeignKey(Service, related_name='+', on_delete=models.CASCADE, db_index=False)
+    medspa = models.ForeignKey(Medspa, related_name='+', on_delete=models.CASCADE, db_index=False)
+    day = models.DateField()
+    status = models.CharField(max_length=50, choices=Appointment.STATUS_CHOICES)
+    booking_count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['service', 'day', 'status'], name='daily_service_rollup_key'),
+        ]
+        indexes = [
+            models.Index(fields=['medspa', 'day'], name='service_rollup_medspa_day_idx'),
+            models.Index(fields=['day'], name='service_rollup_day_idx'),
+        ]
+
+# A month of appointments taken out of the appointment table by
+# `manage.py archive_appointments`: either its detached partition
+# (`table_name`) or, compressed, the appointments themselves as JSON.
+
+class AppointmentArchive(models.Model):
+    month = models.DateField(unique=True)
+    appointment_count = models.IntegerField()
+    table_name = models.CharField(max_length=63, blank=True)
+    appointments = models.JSONField(null=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
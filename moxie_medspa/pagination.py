@@ -0,0 +1,119 @@
+import base64
+import datetime
+import json
+
+import graphene
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.utils import timezone
+from graphene_django.settings import graphene_settings
+
+from moxie_medspa.loaders import is_async_execution
+
+
+class CountableConnection(graphene.relay.Connection):
+    class Meta:
+        abstract = True
+
+    total_count = graphene.Int()
+
+    def resolve_total_count(self, info):
+        # Only runs when the client selects `totalCount`.
+        if is_async_execution(info):
+            return self.queryset.acount()
+        return self.queryset.count()
+
+
+def encode_cursor(node, ordering):
+    values = []
+    for field in ordering:
+        value = getattr(node, field)
+        values.append(value.isoformat() if hasattr(value, 'isoformat') else str(value))
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+def decode_cursor(cursor, model, ordering):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise Exception('Invalid cursor')
+    if not isinstance(values, list) or len(values) != len(ordering):
+        raise Exception('Invalid cursor')
+    # Cursors come from clients, so each value is checked against its field.
+    decoded = []
+    for field, value in zip(ordering, values):
+        try:
+            value = model._meta.get_field(field).to_python(value) if isinstance(value, str) else None
+        except (ValidationError, ValueError, TypeError):
+            value = None
+        if value is None or (isinstance(value, datetime.datetime) and timezone.is_naive(value)):
+            raise Exception('Invalid cursor')
+        decoded.append(value)
+    return decoded
+
+def keyset_filter(ordering, values, lookup):
+    # (a, b) > (x, y)  ==  a > x OR (a = x AND b > y). The leading `a >= x`
+    # conjunct is redundant but lets Postgres use it as an index range bound.
+    condition = Q()
+    for i, field in enumerate(ordering):
+        term = Q(**{f'{field}__{lookup}': values[i]})
+        for previous_field, previous_value in zip(ordering[:i], values[:i]):
+            term &= Q(**{previous_field: previous_value})
+        condition |= term
+    bound = {'gt': 'gte', 'lt': 'lte'}[lookup]
+    return Q(**{f'{ordering[0]}__{bound}': values[0]}) & condition
+
+def paginate(connection_type, queryset, ordering, first=None, after=None, last=None, before=None):
+    page, finish = page_queryset(queryset, ordering, first, after, last, before)
+    return build_connection(connection_type, queryset, ordering, *finish(list(page)))
+
+async def apaginate(connection_type, queryset, ordering, first=None, after=None, last=None, before=None):
+    page, finish = page_queryset(queryset, ordering, first, after, last, before)
+    return build_connection(connection_type, queryset, ordering, *finish([node async for node in page]))
+
+def page_queryset(queryset, ordering, first, after, last, before):
+    """Return the sliced queryset for one page and a function turning its rows
+    into (nodes, has_previous_page, has_next_page)."""
+    max_limit = graphene_settings.RELAY_CONNECTION_MAX_LIMIT
+    for name, value in (('first', first), ('last', last)):
+        if value is not None and value < 0:
+            raise Exception(f'Argument "{name}" must be a non-negative integer')
+        if value is not None and value > max_limit:
+            raise Exception(f'Argument "{name}" must not exceed {max_limit}')
+
+    page = queryset
+    if after:
+        page = page.filter(keyset_filter(ordering, decode_cursor(after, queryset.model, ordering), 'gt'))
+    if before:
+        page = page.filter(keyset_filter(ordering, decode_cursor(before, queryset.model, ordering), 'lt'))
+
+    backwards = last is not None and first is None
+    limit = (last if backwards else first)
+    if limit is None:
+        limit = max_limit
+
+    if backwards:
+        def finish(nodes):
+            return nodes[:limit][::-1], len(nodes) > limit, bool(before)
+        return page.order_by(*[f'-{field}' for field in ordering])[:limit + 1], finish
+
+    def finish(nodes):
+        has_previous_page = bool(after)
+        has_next_page = len(nodes) > limit
+        nodes = nodes[:limit]
+        if last is not None and len(nodes) > last:
+            has_previous_page = True
+            nodes = nodes[len(nodes) - last:]
+        return nodes, has_previous_page, has_next_page
+    return page.order_by(*ordering)[:limit + 1], finish
+
+def build_connection(connection_type, queryset, ordering, nodes, has_previous_page, has_next_page):
+    edges = [connection_type.Edge(node=node, cursor=encode_cursor(node, ordering)) for node in nodes]
+    page_info = graphene.relay.PageInfo(
+        start_cursor=edges[0].cursor if edges else None,
+        end_cursor=edges[-1].cursor if edges else None,
+        has_previous_page=has_previous_page,
+        has_next_page=has_next_page,
+    )
+    connection = connection_type(edges=edges, page_info=page_info)
+    connection.queryset = queryset
+    return connection
@@ -0,0 +1,149 @@
+import datetime
+import re
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.utils import timezone
+
+from moxie_medspa.models import Appointment, AppointmentArchive
+
+# On PostgreSQL the appointment table is range partitioned by the UTC month of
+# start_time (migration 0006), so queries on a start_time range only read the
+# months they cover. Rows outside every monthly partition land in the default
+# partition until ensure_partitions gives their month a partition of its own.
+
+TABLE = Appointment._meta.db_table
+LINK_TABLE = Appointment.services.through._meta.db_table
+ARCHIVE_TABLE = AppointmentArchive._meta.db_table
+DEFAULT_PARTITION = f'{TABLE}_default'
+PARTITION_NAME = re.compile(rf'{TABLE}_p(\d{{4}})_(\d{{2}})')
+
+
+def month_of(moment):
+    if isinstance(moment, datetime.datetime):
+        moment = moment.astimezone(datetime.timezone.utc)
+    return datetime.date(moment.year, moment.month, 1)
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+def months_between(start, end):
+    """First days of the months overlapping [start, end)."""
+    month = month_of(start)
+    while month_start(month) < end:
+        yield month
+        month = add_months(month, 1)
+
+def month_start(month):
+    return datetime.datetime(month.year, month.month, 1, tzinfo=datetime.timezone.utc)
+
+def partition_name(month):
+    return f'{TABLE}_p{month:%Y_%m}'
+
+def is_partitioned(using=DEFAULT_DB_ALIAS):
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)', [TABLE])
+        row = cursor.fetchone()
+    return row is not None and row[0] == 'p'
+
+def partition_months(using=DEFAULT_DB_ALIAS):
+    """Months with a partition attached, oldest first."""
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            'SELECT child.relname FROM pg_inherits JOIN pg_class AS child ON child.oid = inhrelid WHERE inhparent = %s::regclass',
+            [TABLE],
+        )
+        names = [PARTITION_NAME.fullmatch(name) for name, in cursor.fetchall()]
+    return sorted(datetime.date(int(match[1]), int(match[2]), 1) for match in names if match)
+
+def create_partition(cursor, month):
+    name = partition_name(month)
+    lower, upper = month_start(month), month_start(add_months(month, 1))
+    cursor.execute(f'CREATE TABLE {name} (LIKE {TABLE} INCLUDING DEFAULTS)')
+    # The month's rows leave the default partition first; attaching checks
+    # that none are left behind. ATTACH, unlike CREATE TABLE ... PARTITION OF,
+    # lets reads and writes on the appointment table carry on meanwhile.
+    cursor.execute(
+        f'''
+        WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE start_time >= %s AND start_time < %s RETURNING *)
+        INSERT INTO {name} SELECT * FROM moved
+        ''',
+        [lower, upper],
+    )
+    cursor.execute(f"ALTER TABLE {TABLE} ATTACH PARTITION {name} FOR VALUES FROM ('{lower.isoformat()}') TO ('{upper.isoformat()}')")
+
+def ensure_partitions(months=(), using=DEFAULT_DB_ALIAS):
+    """Create the missing partitions for `months`, for this month and the next
+    APPOINTMENT_PARTITION_MONTHS_AHEAD, and for every month with rows in the
+    default partition. Returns the months created."""
+    if not is_partitioned(using):
+        return []
+    this_month = month_of(timezone.now())
+    months_ahead = getattr(settings, 'APPOINTMENT_PARTITION_MONTHS_AHEAD', 12)
+    months = set(months) | {add_months(this_month, offset) for offset in range(months_ahead + 1)}
+    with transaction.atomic(using=using), connections[using].cursor() as cursor:
+        # One run at a time, e.g. the cron job and a deploy's migrate.
+        cursor.execute('SELECT pg_advisory_xact_lock(%s::regclass::oid::bigint)', [TABLE])
+        cursor.execute(f"SELECT DISTINCT date_trunc('month', start_time AT TIME ZONE 'UTC')::date FROM {DEFAULT_PARTITION}")
+        months.update(month for month, in cursor.fetchall())
+        missing = sorted(months - set(partition_months(using)))
+        for month in missing:
+            create_partition(cursor, month)
+    return missing
+
+def archive_partition(month, compress=False, using=DEFAULT_DB_ALIAS):
+    """Take `month` out of the appointment table, with its service links, and
+    record it in AppointmentArchive. The partition is detached and kept as a
+    table of its own, renamed to `<partition>_archived` so the month can get a
+    partition again (its links go to `<table>_services`), or with `compress`
+    folded into one jsonb value, which PostgreSQL compresses, and dropped.
+    Returns the number of appointments archived."""
+    name = partition_name(month)
+    archived = f'{name}_archived'
+    with transaction.atomic(using=using), connections[using].cursor() as cursor:
+        if compress:
+            cursor.execute(
+                f'''
+                INSERT INTO {ARCHIVE_TABLE} (month, appointment_count, table_name, appointments, archived_at)
+                SELECT %s, count(*), '', coalesce(jsonb_agg(
+                    to_jsonb(appointment) || jsonb_build_object('service_ids', links.service_ids)
+                    ORDER BY appointment.start_time, appointment.id
+                ), '[]'), now()
+                FROM {name} AS appointment
+                CROSS JOIN LATERAL (
+                    SELECT coalesce(jsonb_agg(service_id ORDER BY service_id), '[]') AS service_ids
+                    FROM {LINK_TABLE} WHERE appointment_id = appointment.id
+                ) AS links
+                RETURNING appointment_count
+                ''',
+                [month],
+            )
+            count, = cursor.fetchone()
+            cursor.execute(f'DELETE FROM {LINK_TABLE} WHERE appointment_id IN (SELECT id FROM {name})')
+        else:
+            cursor.execute(f'CREATE TABLE {archived}_services (LIKE {LINK_TABLE})')
+            cursor.execute(
+                f'''
+                WITH moved AS (DELETE FROM {LINK_TABLE} WHERE appointment_id IN (SELECT id FROM {name}) RETURNING *)
+                INSERT INTO {archived}_services SELECT * FROM moved
+                ''',
+            )
+            cursor.execute(f'SELECT count(*) FROM {name}')
+            count, = cursor.fetchone()
+            AppointmentArchive.objects.using(using).create(month=month, appointment_count=count, table_name=archived)
+        # Detaching locks the appointment table until commit, so it goes last.
+        cursor.execute(f'ALTER TABLE {TABLE} DETACH PARTITION {name}')
+        if compress:
+            cursor.execute(f'DROP TABLE {name}')
+        else:
+            cursor.execute(f'ALTER TABLE {name} RENAME TO {archived}')
+    return count
+
+def archived_before(using=DEFAULT_DB_ALIAS):
+    """Start of the first month after the newest archived one, or None."""
+    newest = AppointmentArchive.objects.using(using).order_by('-month').values_list('month', flat=True).first()
+    return newest and month_start(add_months(newest, 1))
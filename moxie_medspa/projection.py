@@ -0,0 +1,78 @@
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from graphene.utils.str_converters import to_snake_case
+from graphql import FieldNode, FragmentSpreadNode
+
+
+def selection_tree(info, path=()):
+    """Fields requested below the field being resolved, as nested dicts keyed
+    by schema field name, with fragments merged in. `path` descends further,
+    e.g. ('edges', 'node') for the nodes of a connection."""
+    tree = {}
+    for field_node in info.field_nodes:
+        if field_node.selection_set:
+            collect_fields(info, field_node.selection_set, tree)
+    for name in path:
+        tree = tree.get(name, {})
+    return tree
+
+def collect_fields(info, selection_set, tree):
+    for selection in selection_set.selections:
+        if isinstance(selection, FieldNode):
+            subtree = tree.setdefault(selection.name.value, {})
+            if selection.selection_set:
+                collect_fields(info, selection.selection_set, subtree)
+        elif isinstance(selection, FragmentSpreadNode):
+            collect_fields(info, info.fragments[selection.name.value].selection_set, tree)
+        else:
+            collect_fields(info, selection.selection_set, tree)
+
+
+def project(queryset, tree, required=()):
+    """Load only the columns `tree` asks for (plus `required`), join selected
+    foreign keys with select_related and prefetch selected to-many relations
+    with their own projected querysets."""
+    only, select_related, prefetches = plan(queryset.model, tree)
+    queryset = queryset.only(*only, *required)
+    if select_related:
+        queryset = queryset.select_related(*select_related)
+    if prefetches:
+        queryset = queryset.prefetch_related(*prefetches)
+    return queryset
+
+def plan(model, tree, prefix=''):
+    only = [prefix + model._meta.pk.name]
+    select_related = []
+    prefetches = []
+    for name, subtree in tree.items():
+        try:
+            field = model._meta.get_field(to_snake_case(name))
+        except FieldDoesNotExist:
+            continue  # __typename, computed fields
+        path = prefix + field.name
+        if field.many_to_one:
+            only.append(path)
+            select_related.append(path)
+            related_only, related_select, related_prefetches = plan(field.related_model, subtree, f'{path}__')
+            only.extend(related_only)
+            select_related.extend(related_select)
+            prefetches.extend(related_prefetches)
+        elif field.one_to_many or field.many_to_many:
+            # The reverse foreign key column is what Django matches prefetched rows on.
+            required = [field.field.attname] if field.one_to_many else []
+            prefetches.append(Prefetch(path, queryset=project(field.related_model._default_manager.all(), subtree, required)))
+        elif field.concrete:
+            only.append(path)
+    return only, select_related, prefetches
+
+
+def load_related(instance, name, loader, key):
+    """The related objects of `instance` if project() joined or prefetched
+    them, otherwise a batched `loader.load(key)`."""
+    field = instance._meta.get_field(name)
+    if field.many_to_one:
+        if field.is_cached(instance):
+            return getattr(instance, name)
+    elif name in getattr(instance, '_prefetched_objects_cache', {}):
+        return getattr(instance, name).all()
+    return loader.load(key)
@@ -0,0 +1,201 @@
+import asyncio
+import json
+import logging
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections, transaction
+from django.utils.module_loading import import_string
+
+from moxie_medspa.models import Appointment
+
+logger = logging.getLogger('moxie_medspa.pubsub')
+
+APPOINTMENT_CREATED = 'appointment_created'
+APPOINTMENT_STATUS_CHANGED = 'appointment_status_changed'
+
+
+class SubscriberOverflow(Exception):
+    pass
+
+
+class Subscriber:
+    """One subscription's queue, owned by the event loop that awaits it."""
+
+    def __init__(self, queue_size):
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(queue_size)
+
+    def put(self, message):
+        # Runs on self.loop. A subscriber this far behind is dropped rather
+        # than slowing down everyone else; it resubscribes and refetches.
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+
+def put_all(subscribers, message):
+    for subscriber in subscribers:
+        subscriber.put(message)
+
+
+class InProcessBroker:
+    """Delivers messages to subscribers in this process once the publishing
+    transaction commits. Only enough for a single worker."""
+
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def publish(self, channel, message):
+        self.publish_many([(channel, message)])
+
+    def publish_many(self, messages):
+        # Subscribers get messages as JSON types, as from PostgresBroker.
+        messages = json.loads(json.dumps(messages, cls=DjangoJSONEncoder))
+        transaction.on_commit(lambda: [self.deliver(channel, message) for channel, message in messages])
+
+    def deliver(self, channel, message):
+        # Called from any thread. Every subscriber shares the message, so
+        # they must not modify it. Queues are filled on their own loop, with
+        # one wake-up per loop.
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        subscribers_by_loop = defaultdict(list)
+        for subscriber in subscribers:
+            subscribers_by_loop[subscriber.loop].append(subscriber)
+        for loop, loop_subscribers in subscribers_by_loop.items():
+            try:
+                loop.call_soon_threadsafe(put_all, loop_subscribers, message)
+            except RuntimeError:
+                pass  # loop closed; its subscribers are going away
+
+    async def subscribe(self, channel):
+        """Messages published to `channel` from now on, until the caller stops iterating."""
+        subscriber = Subscriber(self.queue_size)
+        with self._lock:
+            self._subscribers[channel].add(subscriber)
+        try:
+            await self.listen()
+            while True:
+                message = await subscriber.queue.get()
+                if message is None:
+                    raise SubscriberOverflow('Too many unread events; subscribe again to catch up.')
+                yield message
+        finally:
+            with self._lock:
+                self._subscribers[channel].discard(subscriber)
+                if not self._subscribers[channel]:
+                    del self._subscribers[channel]
+
+    async def listen(self):
+        pass
+
+    async def close(self):
+        pass
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+
+class PostgresBroker(InProcessBroker):
+    """Relays messages through PostgreSQL NOTIFY/LISTEN, so subscribers on
+    every worker and node sharing the database receive them. NOTIFY is sent
+    at commit, so rolled back writes publish nothing. Each event loop holds
+    one LISTEN connection and fans messages out to its own subscribers."""
+
+    CHANNEL = 'moxie_medspa_events'
+
+    def __init__(self, alias='default', queue_size=100, reconnect_delay=1):
+        super().__init__(queue_size)
+        self.alias = alias
+        self.reconnect_delay = reconnect_delay
+        self._listeners = {}
+
+    def publish_many(self, messages):
+        payloads = [json.dumps({'channel': channel, 'message': message}, cls=DjangoJSONEncoder) for channel, message in messages]
+        if payloads:
+            with connections[self.alias].cursor() as cursor:
+                cursor.execute('SELECT pg_notify(%s, payload) FROM unnest(%s::text[]) AS payload', [self.CHANNEL, payloads])
+
+    async def listen(self):
+        loop = asyncio.get_running_loop()
+        listener, ready = self._listeners.get(loop, (None, None))
+        if listener is None or listener.done():
+            ready = loop.create_future()
+            self._listeners[loop] = (loop.create_task(self.relay(ready)), ready)
+        # Subscribed once LISTEN has run; earlier notifications are not seen.
+        await ready
+
+    async def close(self):
+        # Stops this event loop's LISTEN connection, e.g. at shutdown.
+        listener, _ = self._listeners.pop(asyncio.get_running_loop(), (None, None))
+        if listener is not None:
+            listener.cancel()
+            await asyncio.gather(listener, return_exceptions=True)
+
+    async def relay(self, ready):
+        import psycopg
+
+        settings_dict = connections[self.alias].settings_dict
+        while True:
+            try:
+                async with await psycopg.AsyncConnection.connect(
+                    dbname=settings_dict['NAME'],
+                    user=settings_dict['USER'],
+                    password=settings_dict['PASSWORD'],
+                    host=settings_dict['HOST'],
+                    port=settings_dict['PORT'] or None,
+                    autocommit=True,
+                ) as connection:
+                    await connection.execute(f'LISTEN {self.CHANNEL}')
+                    if not ready.done():
+                        ready.set_result(None)
+                    async for notify in connection.notifies():
+                        event = json.loads(notify.payload)
+                        self.deliver(event['channel'], event['message'])
+            except psycopg.Error as error:
+                if not ready.done():
+                    # Never connected: fail the subscription; the next one retries.
+                    ready.set_exception(error)
+                    return
+                logger.warning('Lost the LISTEN connection: %s', error)
+                await asyncio.sleep(self.reconnect_delay)
+
+
+def create_broker():
+    config = getattr(settings, 'GRAPHQL_PUBSUB', {})
+    broker_class = import_string(config.get('BACKEND', 'moxie_medspa.pubsub.InProcessBroker'))
+    return broker_class(queue_size=config.get('QUEUE_SIZE', 100), **config.get('OPTIONS', {}))
+
+
+broker = create_broker()
+
+
+# Appointment events carry the row itself, so subscribers resolve its
+# columns without reading the database.
+
+def appointment_message(appointment):
+    return {field.attname: getattr(appointment, field.attname) for field in Appointment._meta.concrete_fields}
+
+def appointment_from_message(message):
+    appointment = Appointment(**{
+        field.attname: field.to_python(message[field.attname]) for field in Appointment._meta.concrete_fields
+    })
+    appointment._state.adding = False
+    return appointment
+
+def appointment_channel(event, medspa_id):
+    return f'{event}:{medspa_id}'
+
+def publish_appointments(event, appointments):
+    broker.publish_many([
+        (appointment_channel(event, appointment.medspa_id), appointment_message(appointment)) for appointment in appointments
+    ])
@@ -0,0 +1,170 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate, TruncMonth, TruncWeek
+from django.utils import timezone
+
+from moxie_medspa.models import Appointment, DailyMedspaRollup, DailyServiceRollup
+from moxie_medspa.partitions import archived_before
+
+# Statuses counted by revenue and utilization unless a query asks for others.
+BOOKED_STATUSES = ['scheduled', 'completed']
+
+PERIODS = {
+    'day': lambda field: F(field),
+    'week': TruncWeek,
+    'month': TruncMonth,
+}
+
+
+class RollupDeltas:
+    """Changes to the daily rollups, accumulated in memory and written with
+    one upsert per table. Rows are upserted in key order so concurrent
+    writers touching the same days cannot deadlock."""
+
+    def __init__(self):
+        self.medspas = defaultdict(lambda: [0, Decimal(0)])
+        self.services = defaultdict(int)
+
+    def add(self, appointment, service_ids, status=None, sign=1):
+        day = timezone.localdate(appointment.start_time)
+        status = status or appointment.status
+        medspa_row = self.medspas[(appointment.medspa_id, day, status)]
+        medspa_row[0] += sign
+        medspa_row[1] += sign * Decimal(appointment.total_price)
+        for service_id in service_ids:
+            self.services[(service_id, appointment.medspa_id, day, status)] += sign
+
+    def apply(self):
+        medspa_rows = sorted(
+            (medspa_id, day, status, count, revenue)
+            for (medspa_id, day, status), (count, revenue) in self.medspas.items()
+            if count or revenue
+        )
+        service_rows = sorted(
+            (service_id, medspa_id, day, status, count)
+            for (service_id, medspa_id, day, status), count in self.services.items()
+            if count
+        )
+        with connection.cursor() as cursor:
+            if medspa_rows:
+                table = DailyMedspaRollup._meta.db_table
+                cursor.execute(
+                    f'''
+                    INSERT INTO {table} (medspa_id, day, status, appointment_count, revenue)
+                    VALUES {", ".join(["(%s, %s, %s, %s, %s)"] * len(medspa_rows))}
+                    ON CONFLICT (medspa_id, day, status) DO UPDATE SET
+                        appointment_count = {table}.appointment_count + EXCLUDED.appointment_count,
+                        revenue = {table}.revenue + EXCLUDED.revenue
+                    ''',
+                    [value for row in medspa_rows for value in row],
+                )
+            if service_rows:
+                table = DailyServiceRollup._meta.db_table
+                cursor.execute(
+                    f'''
+                    INSERT INTO {table} (service_id, medspa_id, day, status, booking_count)
+                    VALUES {", ".join(["(%s, %s, %s, %s, %s)"] * len(service_rows))}
+                    ON CONFLICT (service_id, day, status) DO UPDATE SET
+                        booking_count = {table}.booking_count + EXCLUDED.booking_count
+                    ''',
+                    [value for row in service_rows for value in row],
+                )
+
+
+def record_created(appointments):
+    """Count newly booked appointments, given as (appointment, service_ids)
+    pairs. Call in the transaction that inserts them."""
+    deltas = RollupDeltas()
+    for appointment, service_ids in appointments:
+        deltas.add(appointment, service_ids)
+    deltas.apply()
+
+def record_status_change(appointment, service_ids, previous_status):
+    """Move an appointment from `previous_status` to its current status."""
+    if previous_status == appointment.status:
+        return
+    deltas = RollupDeltas()
+    deltas.add(appointment, service_ids, status=previous_status, sign=-1)
+    deltas.add(appointment, service_ids)
+    deltas.apply()
+
+def rebuild_rollups(medspa_id=None):
+    """Recompute the rollups (of one medspa, or all) from the appointments,
+    for backfills and for rows written behind the mutations' back. Rollups of
+    archived months are kept: their appointments are gone."""
+    appointments = Appointment.objects.all()
+    links = Appointment.services.through.objects.all()
+    existing_medspa_rows = DailyMedspaRollup.objects.all()
+    existing_service_rows = DailyServiceRollup.objects.all()
+    archive_end = archived_before()
+    if archive_end:
+        appointments = appointments.filter(start_time__gte=archive_end)
+        links = links.filter(appointment__start_time__gte=archive_end)
+        existing_medspa_rows = existing_medspa_rows.filter(day__gte=archive_end.date())
+        existing_service_rows = existing_service_rows.filter(day__gte=archive_end.date())
+    if medspa_id:
+        appointments = appointments.filter(medspa_id=medspa_id)
+        links = links.filter(appointment__medspa_id=medspa_id)
+
+    medspa_rows = (
+        appointments.values('medspa_id', 'status', day=TruncDate('start_time'))
+        .annotate(appointment_count=Count('id'), revenue=Sum('total_price'))
+        .order_by()
+    )
+    service_rows = (
+        links.values(
+            'service_id',
+            medspa_id=F('appointment__medspa_id'),
+            day=TruncDate('appointment__start_time'),
+            status=F('appointment__status'),
+        )
+        .annotate(booking_count=Count('id'))
+        .order_by()
+    )
+    with transaction.atomic():
+        if medspa_id:
+            existing_medspa_rows = existing_medspa_rows.filter(medspa_id=medspa_id)
+            existing_service_rows = existing_service_rows.filter(medspa_id=medspa_id)
+        existing_medspa_rows.delete()
+        existing_service_rows.delete()
+        DailyMedspaRollup.objects.bulk_create([DailyMedspaRollup(**row) for row in medspa_rows], batch_size=5000)
+        DailyServiceRollup.objects.bulk_create([DailyServiceRollup(**row) for row in service_rows], batch_size=5000)
+
+
+def in_range(rows, start, end, medspa_id=None, statuses=None):
+    rows = rows.filter(day__gte=start, day__lt=end)
+    if medspa_id:
+        rows = rows.filter(medspa_id=medspa_id)
+    if statuses:
+        rows = rows.filter(status__in=statuses)
+    return rows
+
+def group(rows, period, *fields):
+    # Without a period, rows are totals over the whole range.
+    if period is None:
+        return rows.values(*fields)
+    return rows.values(*fields, period=PERIODS[period]('day'))
+
+def ordering(period, *fields):
+    return (('period',) if period else ()) + fields
+
+def revenue_by_medspa(start, end, medspa_id=None, period=None, statuses=None):
+    """Appointments and revenue per medspa (and period) for days in [start, end)."""
+    rows = in_range(DailyMedspaRollup.objects, start, end, medspa_id, statuses or BOOKED_STATUSES)
+    rows = group(rows, period, 'medspa_id').annotate(appointments=Sum('appointment_count'), total_revenue=Sum('revenue'))
+    return rows.filter(appointments__gt=0).order_by(*ordering(period, 'medspa_id'))
+
+def service_utilization(start, end, medspa_id=None, period=None, statuses=None):
+    """Bookings per service (and period) for days in [start, end)."""
+    rows = in_range(DailyServiceRollup.objects, start, end, medspa_id, statuses or BOOKED_STATUSES)
+    rows = group(rows, period, 'service_id', 'medspa_id').annotate(bookings=Sum('booking_count'))
+    return rows.filter(bookings__gt=0).order_by(*ordering(period, '-bookings', 'service_id'))
+
+def status_breakdown(start, end, medspa_id=None, period=None):
+    """Appointments and their value per status (and period) for days in [start, end)."""
+    rows = in_range(DailyMedspaRollup.objects, start, end, medspa_id)
+    rows = group(rows, period, 'status').annotate(appointments=Sum('appointment_count'), total_revenue=Sum('revenue'))
+    return rows.filter(appointments__gt=0).order_by(*ordering(period, 'status'))
@@ -0,0 +1,254 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+from graphql import (
+    FieldNode,
+    FragmentDefinitionNode,
+    InlineFragmentNode,
+    OperationType,
+    get_named_type,
+    is_composite_type,
+    print_ast,
+)
+
+from moxie_medspa.models import Medspa, Service
+
+CACHEABLE_ROOT_FIELDS = {'medspa', 'allMedspas', 'service', 'allServices'}
+CACHEABLE_TYPES = {
+    'MedspaType', 'MedspaConnection', 'MedspaEdge',
+    'ServiceType', 'ServiceConnection', 'ServiceEdge',
+    'PageInfo',
+}
+
+
+class LocalMemoryBackend:
+    """Per-process LRU. Tag versions are process-local too, so use
+    DjangoCacheBackend when more than one worker serves traffic."""
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value, expires_at = self._entries.get(key, (None, None))
+            if value is None:
+                return None
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def get_many(self, keys):
+        values = {}
+        for key in keys:
+            value = self.get(key)
+            if value is not None:
+                values[key] = value
+        return values
+
+    def set(self, key, value, timeout=None):
+        with self._lock:
+            self._set(key, value, timeout)
+
+    def add(self, key, value, timeout=None):
+        with self._lock:
+            value_now, expires_at = self._entries.get(key, (None, None))
+            if value_now is not None and (expires_at is None or expires_at > time.monotonic()):
+                return False
+            self._set(key, value, timeout)
+            return True
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _set(self, key, value, timeout):
+        self._entries[key] = (value, None if timeout is None else time.monotonic() + timeout)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+
+class DjangoCacheBackend:
+    def __init__(self, alias='default'):
+        self.cache = caches[alias]
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def get_many(self, keys):
+        return self.cache.get_many(keys)
+
+    def set(self, key, value, timeout=None):
+        self.cache.set(key, value, timeout)
+
+    def add(self, key, value, timeout=None):
+        return self.cache.add(key, value, timeout)
+
+    def delete(self, key):
+        self.cache.delete(key)
+
+    def clear(self):
+        self.cache.clear()
+
+
+class ResponseCache:
+    """Caches `data` of catalog query operations, invalidated by tag.
+
+    Each entry remembers the version of every tag it was built from
+    (`medspa:<id>`, `service:<id>`, `medspa:<id>:services`, ...). Saving a
+    Medspa or Service bumps the versions of its tags, so entries built from
+    it stop matching and are never served again. Entries that merely expired
+    are served stale for up to `stale_ttl` seconds while a single request
+    rebuilds them.
+    """
+
+    def __init__(self, backend, ttl=300, stale_ttl=30):
+        self.backend = backend
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+
+    def make_key(self, document, operation, variables):
+        # print_ast() normalizes whitespace, comments and argument layout.
+        fragments = [definition for definition in document.definitions if isinstance(definition, FragmentDefinitionNode)]
+        normalized = '\n'.join(print_ast(definition) for definition in [operation, *fragments])
+        variables = json.dumps(variables or {}, sort_keys=True, default=str)
+        return 'graphql:response:' + hashlib.sha256(f'{normalized}\n{variables}'.encode()).hexdigest()
+
+    def get(self, key):
+        entry = self.backend.get(key)
+        if entry is not None and self._is_current(entry):
+            if time.time() < entry['fresh_until']:
+                self.hits += 1
+                return entry['data']
+            if not self.backend.add(f'{key}:refresh', 1, timeout=self.stale_ttl):
+                self.stale_hits += 1
+                return entry['data']
+        self.misses += 1
+        return None
+
+    def set(self, key, data, tags, started):
+        versions = self._tag_versions(tags)
+        if any(version > started for version in versions.values()):
+            return  # invalidated while the result was being computed
+        entry = {'data': data, 'tags': versions, 'fresh_until': time.time() + self.ttl}
+        self.backend.set(key, entry, timeout=self.ttl + self.stale_ttl)
+        self.backend.delete(f'{key}:refresh')
+
+    def invalidate(self, *tags):
+        version = time.time_ns()
+        for tag in tags:
+            self.backend.set(f'graphql:tag:{tag}', version)
+
+    def clear(self):
+        self.backend.clear()
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+
+    def stats(self):
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            'hits': self.hits,
+            'stale_hits': self.stale_hits,
+            'misses': self.misses,
+            'hit_ratio': (self.hits + self.stale_hits) / lookups if lookups else 0.0,
+        }
+
+    def _is_current(self, entry):
+        return self._tag_versions(entry['tags']) == entry['tags']
+
+    def _tag_versions(self, tags):
+        keys = {f'graphql:tag:{tag}': tag for tag in tags}
+        stored = self.backend.get_many(list(keys))
+        versions = {}
+        for key, tag in keys.items():
+            if key not in stored:
+                stored[key] = 0
+                self.backend.add(key, 0)
+            versions[tag] = stored[key]
+        return versions
+
+
+def is_cacheable(schema, document, operation):
+    """Only queries that read nothing but catalog types (medspas and services)."""
+    if operation is None or operation.operation != OperationType.QUERY:
+        return False
+    fragments = {
+        definition.name.value: definition
+        for definition in document.definitions
+        if isinstance(definition, FragmentDefinitionNode)
+    }
+    root_fields = [selection for selection in operation.selection_set.selections if isinstance(selection, FieldNode)]
+    if not root_fields or any(field.name.value not in CACHEABLE_ROOT_FIELDS for field in root_fields):
+        return False
+    selected_types = set(_selected_types(schema, schema.query_type, operation.selection_set, fragments))
+    return selected_types <= CACHEABLE_TYPES
+
+def _selected_types(schema, parent_type, selection_set, fragments):
+    for selection in selection_set.selections:
+        if isinstance(selection, FieldNode):
+            field_def = parent_type.fields.get(selection.name.value)
+            if field_def is None:
+                continue
+            field_type = get_named_type(field_def.type)
+            if is_composite_type(field_type):
+                yield field_type.name
+            if selection.selection_set:
+                yield from _selected_types(schema, field_type, selection.selection_set, fragments)
+        else:
+            fragment = selection if isinstance(selection, InlineFragmentNode) else fragments[selection.name.value]
+            fragment_type = schema.get_type(fragment.type_condition.name.value) if fragment.type_condition else parent_type
+            yield fragment_type.name
+            yield from _selected_types(schema, fragment_type, fragment.selection_set, fragments)
+
+
+class CacheTagMiddleware:
+    """Graphene middleware recording which catalog rows and lists a cacheable
+    operation read. Does nothing unless the view set `request.cache_tags`."""
+
+    def resolve(self, next, root, info, **args):
+        tags = getattr(info.context, 'cache_tags', None)
+        if tags is not None:
+            field_name = info.field_name
+            if isinstance(root, Medspa):
+                tags.add(f'medspa:{root.id}')
+                if field_name == 'services':
+                    tags.add(f'medspa:{root.id}:services')
+            elif isinstance(root, Service):
+                tags.add(f'service:{root.id}')
+            elif field_name == 'allMedspas':
+                tags.add('medspas')
+            elif field_name == 'allServices':
+                tags.add(f"medspa:{args['medspa_id']}:services" if args.get('medspa_id') else 'services')
+        return next(root, info, **args)
+
+
+def create_response_cache():
+    config = getattr(settings, 'GRAPHQL_RESPONSE_CACHE', {})
+    backend_class = import_string(config.get('BACKEND', 'moxie_medspa.response_cache.LocalMemoryBackend'))
+    return ResponseCache(
+        backend_class(**config.get('OPTIONS', {})),
+        ttl=config.get('TTL', 300),
+        stale_ttl=config.get('STALE_TTL', 30),
+    )
+
+
+response_cache = create_response_cache()
+
@@ -0,0 +1,200 @@
+import contextvars
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+logger = logging.getLogger('moxie_medspa.routing')
+
+# Set on responses to requests that wrote; while the browser keeps it, the
+# client's reads go to the primary and see their own writes.
+PIN_COOKIE = 'primary_pin'
+
+# Seconds the replica is behind. A replica that has replayed everything it
+# received is caught up even if the last replayed transaction is old.
+LAG_QUERY = '''
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+'''
+
+
+class RoutingState:
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.replica_reads = False
+        self.wrote = False
+        # One replica per request, so all of its reads see the same point in time.
+        self.replica = None
+        self.replica_chosen = False
+        self.read_from_replica = False
+
+
+routing_state = contextvars.ContextVar('routing_state', default=None)
+
+
+@contextmanager
+def replica_reads():
+    """Reads inside the block may go to a replica, unless the request is
+    pinned to the primary. Outside a request this does nothing."""
+    state = routing_state.get()
+    if state is None:
+        yield
+        return
+    previous = state.replica_reads
+    state.replica_reads = True
+    try:
+        yield
+    finally:
+        state.replica_reads = previous
+
+
+def read_from_replica():
+    """Whether the current request has read anything from a replica."""
+    state = routing_state.get()
+    return state is not None and state.read_from_replica
+
+def replica_aliases():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+def replica_staleness():
+    # Seconds a replica read can trail the primary: the allowed lag, plus the
+    # time until the next lag check notices it was exceeded.
+    return getattr(settings, 'REPLICA_MAX_LAG_SECONDS', 2) + getattr(settings, 'REPLICA_LAG_CHECK_INTERVAL', 1)
+
+def measure_lag(alias):
+    connection = connections[alias]
+    if connection.vendor != 'postgresql':
+        return 0.0
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(LAG_QUERY)
+            lag = cursor.fetchone()[0]
+    except DatabaseError as error:
+        logger.warning('Replica %s is unavailable: %s', alias, error)
+        return float('inf')
+    # No transaction replayed yet: the lag is unknown.
+    return float('inf') if lag is None else float(lag)
+
+
+class LagMonitor:
+    """Replica lag per alias, measured at most once per
+    REPLICA_LAG_CHECK_INTERVAL seconds, and counts of where reads went."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._checks = {}
+            self.replica_reads = 0
+            self.fallbacks = 0
+
+    def lag(self, alias):
+        interval = getattr(settings, 'REPLICA_LAG_CHECK_INTERVAL', 1)
+        now = time.monotonic()
+        with self._lock:
+            checked = self._checks.get(alias)
+        if checked is not None and now - checked[0] < interval:
+            return checked[1]
+        lag = measure_lag(alias)
+        with self._lock:
+            self._checks[alias] = (now, lag)
+        return lag
+
+    def choose_replica(self):
+        max_lag = getattr(settings, 'REPLICA_MAX_LAG_SECONDS', 2)
+        healthy = [alias for alias in replica_aliases() if self.lag(alias) <= max_lag]
+        with self._lock:
+            if healthy:
+                self.replica_reads += 1
+            else:
+                self.fallbacks += 1
+        return random.choice(healthy) if healthy else None
+
+    def stats(self):
+        with self._lock:
+            return {
+                'replica_reads': self.replica_reads,
+                'fallbacks': self.fallbacks,
+                'lag_seconds': {alias: lag for alias, (_, lag) in self._checks.items()},
+            }
+
+
+lag_monitor = LagMonitor()
+
+
+class ReplicaRouter:
+    """Sends reads made while a GraphQL query operation executes to a replica
+    within REPLICA_MAX_LAG_SECONDS, chosen once per request, and everything
+    else to the primary. A write pins the rest of the request to the primary."""
+
+    def db_for_read(self, model, **hints):
+        state = routing_state.get()
+        if state is None or state.pinned or not state.replica_reads or not replica_aliases():
+            return None
+        if not state.replica_chosen:
+            state.replica = lag_monitor.choose_replica()
+            state.replica_chosen = True
+        if state.replica is not None:
+            state.read_from_replica = True
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = routing_state.get()
+        if state is not None:
+            state.pinned = state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db not in replica_aliases()
+
+
+class ReplicaRoutingMiddleware:
+    """Scopes routing state to the request. Requests carrying PIN_COOKIE read
+    from the primary, and requests that wrote set it for REPLICA_PIN_SECONDS."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = RoutingState(pinned=PIN_COOKIE in request.COOKIES)
+        token = routing_state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            routing_state.reset(token)
+        return self.finish(state, response)
+
+    async def __acall__(self, request):
+        state = RoutingState(pinned=PIN_COOKIE in request.COOKIES)
+        token = routing_state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            routing_state.reset(token)
+        return self.finish(state, response)
+
+    def finish(self, state, response):
+        if state.wrote:
+            response.set_cookie(PIN_COOKIE, '1', max_age=getattr(settings, 'REPLICA_PIN_SECONDS', 5), httponly=True, samesite='Lax')
+        return response
@@ -1,64 +1,246 @@
+import datetime
+from collections import defaultdict
+
 import graphene
+from django.db import transaction
+from django.db.models import aprefetch_related_objects, prefetch_related_objects
 from graphene_django.types import DjangoObjectType
-from moxie_medspa.models import Medspa, Service, Appointment
+from moxie_medspa.models import MAX_APPOINTMENT_DURATION, Medspa, Service, Appointment
+from moxie_medspa.availability import afind_available_slots, find_available_slots
+from moxie_medspa.booking import BULK_STATUSES, CONFLICT_MESSAGE, STATUS_TRANSITIONS, check_conflicts, lock_medspas, set_statuses, validate_duration
+from moxie_medspa.identity import get_identity_map
+from moxie_medspa.loaders import clear_loaders, get_loaders, is_async_execution
+from moxie_medspa.pagination import CountableConnection, apaginate, paginate
+from moxie_medspa.projection import load_related, plan, project, selection_tree
+from moxie_medspa import pubsub, reporting
+
+APPOINTMENT_ORDERING = ('start_time', 'id')
+CATALOG_ORDERING = ('name', 'id')
+MAX_BULK_APPOINTMENTS = 1000
+
+# Query resolvers below return coroutines from the async ORM when the async
+# view is executing (see is_async_execution) and plain values otherwise.
+
+# Both also narrow the query to the selection (see projection.project).
+
+def get_object(info, queryset, **lookup):
+    queryset = project(queryset, selection_tree(info))
+    if is_async_execution(info):
+        return queryset.aget(**lookup)
+    return queryset.get(**lookup)
+
+def get_catalog_object(info, model, pk):
+    # Whole rows from the request's identity map (see moxie_medspa.identity),
+    # so a medspa or service read once is not read again. Selected foreign
+    # keys are joined when the row is read and selected to-many relations are
+    # prefetched, as project() would.
+    _, select_related, prefetches = plan(model, selection_tree(info))
+    select_related = [path for path in select_related if '__' not in path]
+    prefetches = [prefetch for prefetch in prefetches if '__' not in prefetch.prefetch_to]
+    identity_map = get_identity_map(info.context)
+    if is_async_execution(info):
+        return aget_catalog_object(identity_map, model, pk, select_related, prefetches)
+    instance = identity_map.get(model, pk, select_related=select_related)
+    prefetch_related_objects([instance], *prefetches)
+    return instance
+
+async def aget_catalog_object(identity_map, model, pk, select_related, prefetches):
+    instance = await identity_map.aget(model, pk, select_related=select_related)
+    await aprefetch_related_objects([instance], *prefetches)
+    return instance
+
+def get_page(info, connection_type, queryset, ordering, **page):
+    queryset = project(queryset, selection_tree(info, ('edges', 'node')), required=ordering)
+    if is_async_execution(info):
+        return apaginate(connection_type, queryset, ordering, **page)
+    return paginate(connection_type, queryset, ordering, **page)
+
+def get_rows(info, queryset):
+    if is_async_execution(info):
+        return alist(queryset)
+    return list(queryset)
+
+async def alist(queryset):
+    return [row async for row in queryset]
+
+def to_slots(slots):
+    return [SlotType(start_time=start_time, end_time=end_time) for start_time, end_time in slots]
+
+async def aresolve_available_slots(medspa_id, service_ids, start, end, granularity):
+    return to_slots(await afind_available_slots(medspa_id, service_ids, start, end, granularity))
 
 class MedspaType(DjangoObjectType):
     class Meta:
         model = Medspa
         fields = '__all__'
 
+    def resolve_services(self, info):
+        return load_related(self, 'services', get_loaders(info).services_by_medspa, self.id)
+
+    def resolve_appointments(self, info):
+        return load_related(self, 'appointments', get_loaders(info).appointments_by_medspa, self.id)
+
 class ServiceType(DjangoObjectType):
     class Meta:
         model = Service
         fields = '__all__'
 
+    def resolve_medspa(self, info):
+        return load_related(self, 'medspa', get_loaders(info).medspa, self.medspa_id)
+
+    def resolve_appointments(self, info):
+        return load_related(self, 'appointments', get_loaders(info).appointments_by_service, self.id)
+
 class AppointmentType(DjangoObjectType):
     class Meta:
         model = Appointment
         fields = '__all__'
 
+    def resolve_medspa(self, info):
+        return load_related(self, 'medspa', get_loaders(info).medspa, self.medspa_id)
+
+    def resolve_services(self, info):
+        return load_related(self, 'services', get_loaders(info).services_by_appointment, self.id)
+
+class MedspaConnection(CountableConnection):
+    class Meta:
+        node = MedspaType
+
+class ServiceConnection(CountableConnection):
+    class Meta:
+        node = ServiceType
+
+class AppointmentConnection(CountableConnection):
+    class Meta:
+        node = AppointmentType
+
+class SlotType(graphene.ObjectType):
+    start_time = graphene.DateTime(required=True)
+    end_time = graphene.DateTime(required=True)
+
+class ReportPeriod(graphene.Enum):
+    DAY = 'day'
+    WEEK = 'week'
+    MONTH = 'month'
+
+# Reporting rows are dicts from reporting.*; `period` is the first day of the
+# day/week/month and is null when the query asked for totals.
+
+class MedspaRevenueType(graphene.ObjectType):
+    medspa_id = graphene.UUID(required=True)
+    medspa = graphene.Field(MedspaType)
+    period = graphene.Date()
+    appointment_count = graphene.Int(required=True, source='appointments')
+    revenue = graphene.Decimal(required=True, source='total_revenue')
+
+    def resolve_medspa(self, info):
+        return get_loaders(info).medspa.load(self['medspa_id'])
+
+class ServiceUtilizationType(graphene.ObjectType):
+    service_id = graphene.UUID(required=True)
+    service = graphene.Field(ServiceType)
+    medspa_id = graphene.UUID(required=True)
+    period = graphene.Date()
+    booking_count = graphene.Int(required=True, source='bookings')
+
+    def resolve_service(self, info):
+        return get_loaders(info).service.load(self['service_id'])
+
+class StatusBreakdownType(graphene.ObjectType):
+    status = graphene.String(required=True)
+    period = graphene.Date()
+    appointment_count = graphene.Int(required=True, source='appointments')
+    revenue = graphene.Decimal(required=True, source='total_revenue')
+
+def report_arguments(**extra):
+    # Days in [start, end), in the server time zone.
+    return {
+        'start': graphene.Date(required=True),
+        'end': graphene.Date(required=True),
+        'medspa_id': graphene.UUID(),
+        'period': ReportPeriod(),
+        **extra,
+    }
+
 class Query(graphene.ObjectType):
     medspa = graphene.Field(MedspaType, id=graphene.UUID())
-    all_medspas = graphene.List(MedspaType)
+    all_medspas = graphene.relay.ConnectionField(MedspaConnection)
 
     service = graphene.Field(ServiceType, id=graphene.UUID())
-    all_services = graphene.List(ServiceType, medspa_id=graphene.UUID())
+    all_services = graphene.relay.ConnectionField(ServiceConnection, medspa_id=graphene.UUID())
 
     appointment = graphene.Field(AppointmentType, id=graphene.UUID())
-    all_appointments = graphene.List(AppointmentType, status=graphene.String(), start_date=graphene.Date())
-
-    appointments_by_medspa = graphene.List(AppointmentType, medspa_id=graphene.UUID(), date=graphene.Date())
+    all_appointments = graphene.relay.ConnectionField(
+        AppointmentConnection, status=graphene.String(), start_date=graphene.Date(), start=graphene.DateTime(), end=graphene.DateTime()
+    )
+
+    appointments_by_medspa = graphene.relay.ConnectionField(
+        AppointmentConnection, medspa_id=graphene.UUID(), date=graphene.Date(), start=graphene.DateTime(), end=graphene.DateTime()
+    )
+
+    available_slots = graphene.List(
+        graphene.NonNull(SlotType),
+        medspa_id=graphene.UUID(required=True),
+        service_ids=graphene.List(graphene.NonNull(graphene.UUID), required=True),
+        from_=graphene.DateTime(required=True, name='from'),
+        to=graphene.DateTime(required=True),
+        granularity=graphene.Int(default_value=15, description='Minutes between candidate start times.'),
+    )
+
+    revenue_by_medspa = graphene.List(
+        graphene.NonNull(MedspaRevenueType), **report_arguments(statuses=graphene.List(graphene.NonNull(graphene.String)))
+    )
+    service_utilization = graphene.List(
+        graphene.NonNull(ServiceUtilizationType), **report_arguments(statuses=graphene.List(graphene.NonNull(graphene.String)))
+    )
+    status_breakdown = graphene.List(graphene.NonNull(StatusBreakdownType), **report_arguments())
 
     def resolve_medspa(self, info, id):
-        return Medspa.objects.get(pk=id)
+        return get_catalog_object(info, Medspa, id)
 
-    def resolve_all_medspas(self, info):
-        return Medspa.objects.all()
+    def resolve_all_medspas(self, info, **page):
+        return get_page(info, MedspaConnection, Medspa.objects.all(), CATALOG_ORDERING, **page)
 
     def resolve_service(self, info, id):
-        return Service.objects.get(pk=id)
+        return get_catalog_object(info, Service, id)
 
-    def resolve_all_services(self, info, medspa_id=None):
+    def resolve_all_services(self, info, medspa_id=None, **page):
+        query = Service.objects.all()
         if medspa_id:
-            return Service.objects.filter(medspa__id=medspa_id)
-        return Service.objects.all()
+            query = query.filter(medspa__id=medspa_id)
+        return get_page(info, ServiceConnection, query, CATALOG_ORDERING, **page)
 
     def resolve_appointment(self, info, id):
-        return Appointment.objects.get(pk=id)
+        return get_object(info, Appointment.objects, pk=id)
 
-    def resolve_all_appointments(self, info, status=None, start_date=None):
-        query = Appointment.objects.all()
+    def resolve_all_appointments(self, info, status=None, start_date=None, start=None, end=None, **page):
+        query = Appointment.objects.in_range(start, end)
         if status:
             query = query.filter(status=status)
         if start_date:
-            query = query.filter(start_time__date=start_date)
-        return query
+            query = query.on_date(start_date)
+        return get_page(info, AppointmentConnection, query, APPOINTMENT_ORDERING, **page)
 
-    def resolve_appointments_by_medspa(self, info, medspa_id, date=None):
-        query = Appointment.objects.filter(medspa__id=medspa_id)
+    def resolve_appointments_by_medspa(self, info, medspa_id, date=None, start=None, end=None, **page):
+        query = Appointment.objects.filter(medspa__id=medspa_id).in_range(start, end)
         if date:
-            query = query.filter(start_time__date=date)
-        return query
+            query = query.on_date(date)
+        return get_page(info, AppointmentConnection, query, APPOINTMENT_ORDERING, **page)
+
+    def resolve_available_slots(self, info, medspa_id, service_ids, from_, to, granularity):
+        granularity = datetime.timedelta(minutes=granularity)
+        if is_async_execution(info):
+            return aresolve_available_slots(medspa_id, service_ids, from_, to, granularity)
+        return to_slots(find_available_slots(medspa_id, service_ids, from_, to, granularity))
+
+    def resolve_revenue_by_medspa(self, info, start, end, medspa_id=None, period=None, statuses=None):
+        return get_rows(info, reporting.revenue_by_medspa(start, end, medspa_id, period and period.value, statuses))
+
+    def resolve_service_utilization(self, info, start, end, medspa_id=None, period=None, statuses=None):
+        return get_rows(info, reporting.service_utilization(start, end, medspa_id, period and period.value, statuses))
+
+    def resolve_status_breakdown(self, info, start, end, medspa_id=None, period=None):
+        return get_rows(info, reporting.status_breakdown(start, end, medspa_id, period and period.value))
 
 class CreateService(graphene.Mutation):
     service = graphene.Field(ServiceType)
@@ -71,7 +253,7 @@ class CreateService(graphene.Mutation):
         medspa_id = graphene.UUID(required=True)
 
     def mutate(self, info, name, description, price, duration, medspa_id):
-        medspa = Medspa.objects.get(id=medspa_id)
+        medspa = get_identity_map(info.context).get(Medspa, medspa_id, shared=False)
         service = Service(name=name, description=description, price=price, duration=duration, medspa=medspa)
         service.save()
         return CreateService(service=service)
@@ -85,24 +267,127 @@ class CreateAppointment(graphene.Mutation):
         medspa_id = graphene.UUID(required=True)
 
     def mutate(self, info, start_time, service_ids, medspa_id):
-        medspa = Medspa.objects.get(id=medspa_id)
-        services = Service.objects.filter(id__in=service_ids)
-
-        total_duration = sum(service.duration for service in services)
-        total_price = sum(service.price for service in services)
-
-        appointment = Appointment(
-            start_time=start_time,
-            total_duration=total_duration,
-            total_price=total_price,
-            status='scheduled', # set the default status
-            medspa=medspa
-        )
-        appointment.save()
-        appointment.services.set(services)
+        with transaction.atomic():
+            # Locking the medspa serializes its bookings until commit.
+            medspa = Medspa.objects.select_for_update().get(id=medspa_id)
+            identity_map = get_identity_map(info.context)
+            identity_map.add([medspa])
+            services = list(identity_map.get_many(Service, service_ids, shared=False).values())
+
+            total_duration = sum(service.duration for service in services)
+            total_price = sum(service.price for service in services)
+            validate_duration(total_duration)
+            check_conflicts(medspa.id, start_time, total_duration)
+
+            appointment = Appointment(
+                start_time=start_time,
+                total_duration=total_duration,
+                total_price=total_price,
+                status='scheduled', # set the default status
+                medspa=medspa
+            )
+            appointment.save()
+            appointment.services.set(services)
+            reporting.record_created([(appointment, [service.id for service in services])])
+            pubsub.publish_appointments(pubsub.APPOINTMENT_CREATED, [appointment])
 
         return CreateAppointment(appointment=appointment)
 
+class AppointmentInput(graphene.InputObjectType):
+    start_time = graphene.DateTime(required=True)
+    service_ids = graphene.List(graphene.NonNull(graphene.UUID), required=True)
+    medspa_id = graphene.UUID(required=True)
+
+class CreateAppointmentResult(graphene.ObjectType):
+    index = graphene.Int(required=True)
+    appointment = graphene.Field(AppointmentType)
+    error = graphene.String()
+
+class CreateAppointments(graphene.Mutation):
+    results = graphene.List(graphene.NonNull(CreateAppointmentResult), required=True)
+
+    class Arguments:
+        input = graphene.List(graphene.NonNull(AppointmentInput), required=True)
+
+    def mutate(self, info, input):
+        if len(input) > MAX_BULK_APPOINTMENTS:
+            raise Exception(f"Too many appointments. Expected at most {MAX_BULK_APPOINTMENTS}")
+
+        with transaction.atomic():
+            # One query per model for the whole batch, however many items reference them.
+            medspas = lock_medspas({item.medspa_id for item in input})
+            identity_map = get_identity_map(info.context)
+            identity_map.add(medspas.values())
+            services = identity_map.get_many(Service, {service_id for item in input for service_id in item.service_ids}, shared=False)
+
+            results = [None] * len(input)
+            candidates = []
+            for index, item in enumerate(input):
+                medspa = medspas.get(item.medspa_id)
+                service_ids = list(dict.fromkeys(item.service_ids))
+                error = None
+                if medspa is None:
+                    error = 'Medspa not found'
+                elif not service_ids:
+                    error = 'At least one service is required'
+                elif any(service_id not in services for service_id in service_ids):
+                    error = 'Service not found'
+                elif any(services[service_id].medspa_id != medspa.id for service_id in service_ids):
+                    error = 'Service does not belong to the medspa'
+                if error:
+                    results[index] = CreateAppointmentResult(index=index, error=error)
+                    continue
+
+                appointment_services = [services[service_id] for service_id in service_ids]
+                appointment = Appointment(
+                    start_time=item.start_time,
+                    total_duration=sum(service.duration for service in appointment_services),
+                    total_price=sum(service.price for service in appointment_services),
+                    status='scheduled',
+                    medspa=medspa
+                )
+                candidates.append((index, appointment, appointment_services))
+
+            # Existing bookings that could collide with any item, in one range query.
+            booked = defaultdict(list)
+            if candidates:
+                existing = Appointment.objects.filter(medspa_id__in=medspas, status='scheduled').overlapping(
+                    min(appointment.start_time for _, appointment, _ in candidates),
+                    max(appointment.end_time for _, appointment, _ in candidates),
+                )
+                for appointment in existing:
+                    booked[appointment.medspa_id].append(appointment)
+
+            appointments = []
+            links = []
+            booked_services = {}
+            for index, appointment, appointment_services in candidates:
+                if datetime.timedelta(minutes=appointment.total_duration) > MAX_APPOINTMENT_DURATION:
+                    results[index] = CreateAppointmentResult(index=index, error='Appointment is too long')
+                    continue
+                if any(
+                    other.start_time < appointment.end_time and other.end_time > appointment.start_time
+                    for other in booked[appointment.medspa_id]
+                ):
+                    results[index] = CreateAppointmentResult(index=index, error=CONFLICT_MESSAGE)
+                    continue
+                booked[appointment.medspa_id].append(appointment)
+                appointments.append(appointment)
+                links.extend(
+                    Appointment.services.through(appointment_id=appointment.id, service_id=service.id)
+                    for service in appointment_services
+                )
+                booked_services[appointment.id] = [service.id for service in appointment_services]
+                results[index] = CreateAppointmentResult(index=index, appointment=appointment)
+
+            if appointments:
+                Appointment.objects.bulk_create(appointments)
+                Appointment.services.through.objects.bulk_create(links)
+                reporting.record_created([(appointment, booked_services[appointment.id]) for appointment in appointments])
+                pubsub.publish_appointments(pubsub.APPOINTMENT_CREATED, appointments)
+
+        return CreateAppointments(results=results)
+
 class UpdateService(graphene.Mutation):
     service = graphene.Field(ServiceType)
 
@@ -115,7 +400,7 @@ class UpdateService(graphene.Mutation):
 
     def mutate(self, info, service_id, name=None, description=None, price=None, duration=None):
         try:
-            service = Service.objects.get(id=service_id)
+            service = get_identity_map(info.context).get(Service, service_id, shared=False)
         except Service.DoesNotExist:
             raise Exception('Service not found')
 
@@ -139,25 +424,89 @@ class UpdateAppointmentStatus(graphene.Mutation):
         status = graphene.String(required=True)
 
     def mutate(self, info, appointment_id, status):
-        try:
-            appointment = Appointment.objects.get(id=appointment_id)
-        except Appointment.DoesNotExist:
-            raise Exception('Appointment not found')
+        if status not in STATUS_TRANSITIONS:
+            raise Exception(f"Invalid status. Expected one of {list(STATUS_TRANSITIONS)}")
+
+        with transaction.atomic():
+            try:
+                # Locked until commit, so concurrent changes to one appointment
+                # apply one at a time, each from the status the last one left.
+                appointment = Appointment.objects.select_for_update().get(id=appointment_id)
+            except Appointment.DoesNotExist:
+                raise Exception('Appointment not found')
+
+            previous_status = appointment.status
+            if status != previous_status:
+                if previous_status not in STATUS_TRANSITIONS[status]:
+                    raise Exception(f"Cannot change a {previous_status} appointment to {status}")
+                if status == 'scheduled':
+                    # Re-scheduling takes the slot back, so it must still be free.
+                    lock_medspas([appointment.medspa_id])
+                    check_conflicts(appointment.medspa_id, appointment.start_time, appointment.total_duration, exclude_id=appointment.id)
+
+                appointment.status = status
+                # By the whole primary key, so only the appointment's partition is read.
+                Appointment.objects.filter(id=appointment.id, start_time=appointment.start_time).update(status=status)
+                service_ids = appointment.services.values_list('id', flat=True)
+                reporting.record_status_change(appointment, list(service_ids), previous_status)
+                pubsub.publish_appointments(pubsub.APPOINTMENT_STATUS_CHANGED, [appointment])
 
-        valid_statuses = ['scheduled', 'completed', 'canceled']
-        if status not in valid_statuses:
-            raise Exception(f"Invalid status. Expected one of {valid_statuses}")
+        return UpdateAppointmentStatus(appointment=appointment)
 
-        appointment.status = status
-        appointment.save()
+class UpdateAppointmentStatuses(graphene.Mutation):
+    # Only the appointments whose status changed; the others were not found,
+    # already had the status or cannot move to it (see STATUS_TRANSITIONS).
+    appointments = graphene.List(graphene.NonNull(AppointmentType), required=True)
 
-        return UpdateAppointmentStatus(appointment=appointment)
+    class Arguments:
+        ids = graphene.List(graphene.NonNull(graphene.UUID), required=True)
+        status = graphene.String(required=True)
+
+    def mutate(self, info, ids, status):
+        if status not in BULK_STATUSES:
+            raise Exception(f"Invalid status. Expected one of {BULK_STATUSES}")
+        if len(ids) > MAX_BULK_APPOINTMENTS:
+            raise Exception(f"Too many appointments. Expected at most {MAX_BULK_APPOINTMENTS}")
+
+        with transaction.atomic():
+            appointments = set_statuses(list(dict.fromkeys(ids)), status)
+        return UpdateAppointmentStatuses(appointments=appointments)
 
 class Mutation(graphene.ObjectType):
     create_service = CreateService.Field()
     update_service = UpdateService.Field()
     create_appointment = CreateAppointment.Field()
+    create_appointments = CreateAppointments.Field()
     update_appointment_status = UpdateAppointmentStatus.Field()
+    update_appointment_statuses = UpdateAppointmentStatuses.Field()
+
+# Subscription events are published when the booking or status change
+# commits (see moxie_medspa.pubsub) and served over WebSockets by
+# moxie_medspa.subscriptions.
+
+def subscribe_appointments(event, medspa_id):
+    return pubsub.broker.subscribe(pubsub.appointment_channel(event, medspa_id))
+
+def resolve_appointment_event(message, info):
+    # Loaders start empty for every event so related rows are read fresh.
+    clear_loaders(info.context)
+    return pubsub.appointment_from_message(message)
+
+class Subscription(graphene.ObjectType):
+    appointment_created = graphene.Field(AppointmentType, medspa_id=graphene.UUID(required=True))
+    appointment_status_changed = graphene.Field(AppointmentType, medspa_id=graphene.UUID(required=True))
+
+    def subscribe_appointment_created(root, info, medspa_id):
+        return subscribe_appointments(pubsub.APPOINTMENT_CREATED, medspa_id)
+
+    def resolve_appointment_created(root, info, medspa_id):
+        return resolve_appointment_event(root, info)
+
+    def subscribe_appointment_status_changed(root, info, medspa_id):
+        return subscribe_appointments(pubsub.APPOINTMENT_STATUS_CHANGED, medspa_id)
+
+    def resolve_appointment_status_changed(root, info, medspa_id):
+        return resolve_appointment_event(root, info)
 
-schema = graphene.Schema(query=Query, mutation=Mutation)
+schema = graphene.Schema(query=Query, mutation=Mutation, subscription=Subscription)
 
@@ -41,10 +41,69 @@ INSTALLED_APPS = [
 ]
 
 GRAPHENE = {
-    'SCHEMA': 'moxie_medspa.schema.schema'
+    'SCHEMA': 'moxie_medspa.schema.schema',
+    'MIDDLEWARE': [
+        'moxie_medspa.response_cache.CacheTagMiddleware',
+        'moxie_medspa.tracing.ResolverTimingMiddleware',
+    ],
+}
+
+# Number of parsed and validated GraphQL documents kept in memory per process.
+GRAPHQL_DOCUMENT_CACHE_SIZE = 512
+
+# Cache alias (see CACHES) that stores Automatic Persisted Queries by hash.
+GRAPHQL_PERSISTED_QUERIES_CACHE = 'default'
+
+# Most operations accepted in one batched request (a JSON array body).
+GRAPHQL_MAX_BATCH_SIZE = 10
+
+# Operations deeper or more expensive than this are rejected before execution.
+# Plain list fields (e.g. `services`) are costed as GRAPHQL_DEFAULT_LIST_SIZE
+# items, connections as their `first`/`last` argument.
+GRAPHQL_MAX_QUERY_DEPTH = 10
+GRAPHQL_MAX_QUERY_COST = 25000
+GRAPHQL_DEFAULT_LIST_SIZE = 10
+
+# Result cache for catalog queries (medspa, allMedspas, service, allServices).
+# Entries are invalidated by tag when a Medspa or Service is saved; expired
+# entries are served for STALE_TTL more seconds while one request refreshes
+# them. Use 'moxie_medspa.response_cache.DjangoCacheBackend' (OPTIONS:
+# {'alias': ...}) to share the cache between workers.
+GRAPHQL_RESPONSE_CACHE = {
+    'BACKEND': 'moxie_medspa.response_cache.LocalMemoryBackend',
+    'OPTIONS': {'maxsize': 1024},
+    'TTL': 300,
+    'STALE_TTL': 30,
+}
+
+# Process-wide LRU of medspa and service rows by id (moxie_medspa.identity).
+# Saves invalidate it in their own process only; other workers serve the old
+# row for up to TTL seconds, so it is off unless that staleness is acceptable.
+CATALOG_CACHE = {
+    'ENABLED': False,
+    'MAXSIZE': 1024,
+    'TTL': 60,
+}
+
+# Operations slower than this are logged with their variables' shape and
+# slowest SQL statements (see moxie_medspa.tracing). None disables the check.
+GRAPHQL_SLOW_OPERATION_MS = 500
+
+# Pub/sub behind GraphQL subscriptions (see moxie_medspa.pubsub). The
+# in-process broker only reaches subscribers on the worker that handled the
+# mutation; with several workers or nodes use
+# 'moxie_medspa.pubsub.PostgresBroker' (OPTIONS: {'alias': ...}), which relays
+# events through NOTIFY/LISTEN. Subscribers more than QUEUE_SIZE events behind
+# are dropped.
+GRAPHQL_PUBSUB = {
+    'BACKEND': 'moxie_medspa.pubsub.InProcessBroker',
+    'OPTIONS': {},
+    'QUEUE_SIZE': 100,
 }
 
 MIDDLEWARE = [
+    'moxie_medspa.tracing.TracingMiddleware',
+    'moxie_medspa.routing.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -86,9 +145,55 @@ DATABASES = {
         'PASSWORD': 'supersecretpassword',
         'HOST': 'db',
         'PORT': '5432',
-    }
+        # Per-process psycopg_pool pool. Keeps min_size connections open,
+        # hands out at most max_size (size it to the worker's threads) and
+        # makes requests wait up to `timeout` seconds for a free one. With
+        # CONN_HEALTH_CHECKS each connection is checked before it is handed
+        # out. Pool usage and wait times are under `database_pool` in
+        # /graphql/metrics/.
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'pool': {
+                'min_size': 2,
+                'max_size': 10,
+                'timeout': 10,
+                'max_idle': 300,
+            },
+        },
+    },
+    # Streaming replica of 'default'. Development points it at the primary;
+    # tests read the primary's test database through it.
+    'replica': {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': 'medspa_db',
+        'USER': 'medspa_user',
+        'PASSWORD': 'supersecretpassword',
+        'HOST': 'db',
+        'PORT': '5432',
+        'TEST': {'MIRROR': 'default'},
+    },
 }
 
+DATABASE_ROUTERS = ['moxie_medspa.routing.ReplicaRouter']
+
+# Aliases in DATABASES that GraphQL query operations read from, e.g.
+# ['replica']. Mutations, and reads from a client within REPLICA_PIN_SECONDS
+# of its last write, use the primary. Replicas more than
+# REPLICA_MAX_LAG_SECONDS behind (checked every REPLICA_LAG_CHECK_INTERVAL
+# seconds) are skipped; with none left, reads fall back to the primary.
+DATABASE_REPLICAS = []
+REPLICA_PIN_SECONDS = 5
+REPLICA_MAX_LAG_SECONDS = 2
+REPLICA_LAG_CHECK_INTERVAL = 1
+
+
+# Months ahead of the current one that always have an appointment partition
+# (PostgreSQL). Kept topped up after every migrate and by
+# `manage.py create_appointment_partitions`, to run daily from cron.
+APPOINTMENT_PARTITION_MONTHS_AHEAD = 12
+
+# Rows fetched per server-side cursor round-trip by /export/appointments/.
+APPOINTMENT_EXPORT_CHUNK_SIZE = 2000
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -130,3 +235,22 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Logging
+# https://docs.djangoproject.com/en/5.1/topics/logging/
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        # One JSON line per GraphQL operation, plus warnings for slow ones.
+        'moxie_medspa.tracing': {'handlers': ['console'], 'level': 'INFO'},
+        # Unreachable replicas.
+        'moxie_medspa.routing': {'handlers': ['console'], 'level': 'WARNING'},
+        # Lost LISTEN connections.
+        'moxie_medspa.pubsub': {'handlers': ['console'], 'level': 'WARNING'},
+    },
+}
@@ -0,0 +1,32 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_migrate, post_save
+from django.dispatch import receiver
+
+from moxie_medspa.identity import catalog_cache
+from moxie_medspa.models import Medspa, Service
+from moxie_medspa.partitions import ensure_partitions
+from moxie_medspa.response_cache import response_cache
+
+
+@receiver([post_save, post_delete], sender=Medspa)
+def invalidate_medspa(sender, instance, **kwargs):
+    invalidate(sender, instance.pk, f'medspa:{instance.id}', 'medspas')
+
+@receiver([post_save, post_delete], sender=Service)
+def invalidate_service(sender, instance, **kwargs):
+    invalidate(sender, instance.pk, f'service:{instance.id}', f'medspa:{instance.medspa_id}:services', 'services')
+
+def invalidate(model, pk, *tags):
+    # Again on commit: a read from another connection before then still sees
+    # the old row and could cache it past the first invalidation.
+    def invalidate_caches():
+        response_cache.invalidate(*tags)
+        catalog_cache.invalidate(model, pk)
+    invalidate_caches()
+    transaction.on_commit(invalidate_caches)
+
+@receiver(post_migrate)
+def create_appointment_partitions(sender, using, **kwargs):
+    # Every deploy tops up the monthly partitions, as the cron job does.
+    if sender.name == 'moxie_medspa':
+        ensure_partitions(using=using)
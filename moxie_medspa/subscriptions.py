@@ -0,0 +1,158 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from graphql import ExecutionResult, GraphQLError, OperationType, get_operation_ast, subscribe
+
+from moxie_medspa.cost import check_query_cost
+from moxie_medspa.documents import document_cache
+from moxie_medspa.schema import schema
+
+# GraphQL over WebSocket, as spoken by graphql-ws clients (and GraphiQL).
+PROTOCOL = 'graphql-transport-ws'
+PATHS = ('/graphql/', '/graphql/async/')
+
+CONNECTION_INIT_TIMEOUT = 10
+MAX_OPERATIONS_PER_CONNECTION = 20
+
+# Close codes defined by the protocol.
+INVALID_MESSAGE = 4400
+UNAUTHORIZED = 4401
+CONNECTION_INIT_TIMED_OUT = 4408
+SUBSCRIBER_ALREADY_EXISTS = 4409
+TOO_MANY_INIT_REQUESTS = 4429
+
+
+class GraphQLWebSocket:
+    """One connection: waits for `connection_init`, then streams each
+    `subscribe` operation as `next` messages from its own task until the
+    client sends `complete` or disconnects. An idle subscription is a task
+    waiting on its pub/sub queue; nothing is polled."""
+
+    def __init__(self, send):
+        self.send = send
+        self.acknowledged = False
+        self.closed = False
+        self.operations = {}
+
+    async def run(self, receive):
+        self.init_timeout = asyncio.create_task(self.close_unless_acknowledged())
+        try:
+            while True:
+                event = await receive()
+                if event['type'] == 'websocket.disconnect':
+                    break
+                if event['type'] == 'websocket.receive' and not self.closed:
+                    await self.handle(event.get('text') or event.get('bytes'))
+        finally:
+            self.init_timeout.cancel()
+            for task in self.operations.values():
+                task.cancel()
+            await asyncio.gather(*self.operations.values(), return_exceptions=True)
+
+    async def close_unless_acknowledged(self):
+        await asyncio.sleep(CONNECTION_INIT_TIMEOUT)
+        if not self.acknowledged:
+            await self.close(CONNECTION_INIT_TIMED_OUT, 'Connection initialisation timeout')
+
+    async def send_message(self, message):
+        if not self.closed:
+            await self.send({'type': 'websocket.send', 'text': json.dumps(message)})
+
+    async def close(self, code, reason):
+        if not self.closed:
+            self.closed = True
+            await self.send({'type': 'websocket.close', 'code': code, 'reason': reason})
+
+    async def handle(self, text):
+        try:
+            message = json.loads(text)
+            message_type = message['type']
+        except (TypeError, ValueError, KeyError):
+            return await self.close(INVALID_MESSAGE, 'Invalid message')
+
+        if message_type == 'connection_init':
+            if self.acknowledged:
+                return await self.close(TOO_MANY_INIT_REQUESTS, 'Too many initialisation requests')
+            self.acknowledged = True
+            self.init_timeout.cancel()
+            await self.send_message({'type': 'connection_ack'})
+        elif message_type == 'ping':
+            await self.send_message({'type': 'pong'})
+        elif message_type == 'pong':
+            pass
+        elif message_type == 'subscribe':
+            if not self.acknowledged:
+                return await self.close(UNAUTHORIZED, 'Unauthorized')
+            id, payload = message.get('id'), message.get('payload')
+            if not isinstance(id, str) or not isinstance(payload, dict):
+                return await self.close(INVALID_MESSAGE, 'Invalid subscribe message')
+            if id in self.operations:
+                return await self.close(SUBSCRIBER_ALREADY_EXISTS, f'Subscriber for {id} already exists')
+            if len(self.operations) >= MAX_OPERATIONS_PER_CONNECTION:
+                return await self.send_error(id, f'At most {MAX_OPERATIONS_PER_CONNECTION} operations per connection.')
+            self.operations[id] = asyncio.create_task(self.run_operation(id, payload))
+        elif message_type == 'complete':
+            task = self.operations.pop(message.get('id'), None)
+            if task is not None:
+                task.cancel()
+        else:
+            await self.close(INVALID_MESSAGE, f'Unexpected message type {message_type}')
+
+    async def send_error(self, id, message):
+        await self.send_message({'type': 'error', 'id': id, 'payload': [{'message': message}]})
+
+    async def run_operation(self, id, payload):
+        context = SimpleNamespace(async_execution=True)
+        try:
+            stream = await self.subscribe(payload, context)
+            if isinstance(stream, ExecutionResult):
+                # Rejected before subscribing: invalid document, variables or cost.
+                await self.send_message({'type': 'error', 'id': id, 'payload': [error.formatted for error in stream.errors]})
+                return
+            try:
+                async for result in stream:
+                    await self.send_message({'type': 'next', 'id': id, 'payload': result.formatted})
+                    if getattr(context, 'async_loaders', None) is not None:
+                        # Hand the connection the loaders used back, as at the end of a request.
+                        await sync_to_async(close_old_connections)()
+            finally:
+                await stream.aclose()
+            await self.send_message({'type': 'complete', 'id': id})
+        except Exception as error:
+            await self.send_error(id, str(error))
+        finally:
+            if self.operations.get(id) is asyncio.current_task():
+                del self.operations[id]
+
+    async def subscribe(self, payload, context):
+        query, variables, operation_name = payload.get('query'), payload.get('variables'), payload.get('operationName')
+        if not isinstance(query, str):
+            return ExecutionResult(errors=[GraphQLError('Must provide query string.')])
+        graphql_schema = schema.graphql_schema
+        document, errors = document_cache.get_document(graphql_schema, query)
+        if errors:
+            return ExecutionResult(errors=errors)
+        operation = get_operation_ast(document, operation_name)
+        if operation is None or operation.operation != OperationType.SUBSCRIPTION:
+            return ExecutionResult(errors=[GraphQLError('Only subscriptions are served over WebSockets; POST queries and mutations.')])
+        _, cost_error = check_query_cost(graphql_schema, document, operation_name, variables)
+        if cost_error:
+            return ExecutionResult(errors=[cost_error])
+        return await subscribe(
+            graphql_schema, document, context_value=context, variable_values=variables, operation_name=operation_name,
+        )
+
+
+async def graphql_websocket(scope, receive, send):
+    """ASGI application for WebSocket connections (see moxie_medspa.asgi)."""
+    event = await receive()
+    if event['type'] != 'websocket.connect':
+        return
+    if scope['path'] not in PATHS or PROTOCOL not in scope.get('subprotocols', []):
+        await send({'type': 'websocket.close', 'code': 1002})
+        return
+    await send({'type': 'websocket.accept', 'subprotocol': PROTOCOL})
+    await GraphQLWebSocket(send).run(receive)
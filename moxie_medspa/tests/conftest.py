@@ -0,0 +1,14 @@
+import pytest
+from django.core.cache import cache
+from moxie_medspa.documents import document_cache
+from moxie_medspa.identity import catalog_cache
+from moxie_medspa.response_cache import response_cache
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    # Cached results outlive the per-test transaction rollback.
+    document_cache.clear()
+    response_cache.clear()
+    catalog_cache.clear()
+    cache.clear()
@@ -0,0 +1,118 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from moxie_medspa.models import Appointment
+from moxie_medspa.tests.test_helpers import create_medspa, create_service, create_appointment, execute_async_query, execute_graphql_query
+
+CATALOG_QUERY = '''
+    query {
+        allMedspas {
+            totalCount
+            edges {
+                node {
+                    name
+                    services {
+                        name
+                        medspa {
+                            name
+                        }
+                    }
+                }
+            }
+        }
+        allServices(first: 2) {
+            edges {
+                node {
+                    name
+                }
+            }
+        }
+    }
+'''
+
+@pytest.mark.django_db
+def test_async_view_matches_sync_view(client):
+    for i in range(3):
+        medspa = create_medspa(name=f"Medspa {i}")
+        create_service(medspa, name=f"Service {i}")
+
+    expected = execute_graphql_query(client, CATALOG_QUERY)
+    content = execute_async_query(CATALOG_QUERY)
+
+    assert 'errors' not in content, content['errors']
+    assert content['data'] == expected['data']
+
+@pytest.mark.django_db
+def test_async_loaders_batch_across_root_fields():
+    for i in range(5):
+        medspa = create_medspa(name=f"Medspa {i}")
+        create_service(medspa, name=f"Service {i}")
+
+    with CaptureQueriesContext(connection) as queries:
+        content = execute_async_query(CATALOG_QUERY)
+
+    assert 'errors' not in content, content['errors']
+    # allMedspas, totalCount, allServices, and the services of every medspa joined with their medspa
+    assert len(queries) == 4
+
+@pytest.mark.django_db
+def test_async_view_reports_missing_objects():
+    content = execute_async_query('query { medspa(id: "aec71f83-346d-4e73-9d27-72ca00c3ff78") { name } }')
+
+    assert content['errors'][0]['message'] == 'Medspa matching query does not exist.'
+
+@pytest.mark.django_db
+def test_async_available_slots():
+    medspa = create_medspa()
+    service = create_service(medspa, duration=60)
+    day = timezone.now().replace(hour=9, minute=0, second=0, microsecond=0) + timezone.timedelta(days=1)
+    create_appointment(medspa, [service], start_time=day)
+
+    content = execute_async_query(
+        '''
+        query($medspaId: UUID!, $serviceIds: [UUID!]!, $from: DateTime!, $to: DateTime!) {
+            availableSlots(medspaId: $medspaId, serviceIds: $serviceIds, from: $from, to: $to, granularity: 60) {
+                startTime
+            }
+        }
+        ''',
+        variables={
+            'medspaId': str(medspa.id),
+            'serviceIds': [str(service.id)],
+            'from': day.isoformat(),
+            'to': (day + timezone.timedelta(hours=3)).isoformat(),
+        }
+    )
+
+    assert 'errors' not in content, content['errors']
+    assert [slot['startTime'] for slot in content['data']['availableSlots']] == [
+        (day + timezone.timedelta(hours=1)).isoformat(),
+        (day + timezone.timedelta(hours=2)).isoformat(),
+    ]
+
+@pytest.mark.django_db
+def test_async_view_runs_mutations():
+    medspa = create_medspa()
+    service = create_service(medspa)
+    mutation = '''
+        mutation($medspaId: UUID!, $serviceIds: [UUID]!, $startTime: DateTime!) {
+            createAppointment(medspaId: $medspaId, serviceIds: $serviceIds, startTime: $startTime) {
+                appointment {
+                    status
+                    services {
+                        name
+                    }
+                }
+            }
+        }
+    '''
+    variables = {'medspaId': str(medspa.id), 'serviceIds': [str(service.id)], 'startTime': timezone.now().isoformat()}
+
+    content = execute_async_query(mutation, variables)
+    assert 'errors' not in content, content['errors']
+    assert content['data']['createAppointment']['appointment'] == {'status': 'SCHEDULED', 'services': [{'name': service.name}]}
+
+    content = execute_async_query(mutation, variables)
+    assert content['errors'][0]['extensions']['code'] == 'APPOINTMENT_CONFLICT'
+    assert Appointment.objects.count() == 1
@@ -0,0 +1,87 @@
+import datetime
+
+import pytest
+from moxie_medspa.availability import free_slots, merge_intervals
+from moxie_medspa.tests.test_helpers import create_medspa, create_service, create_appointment, execute_graphql_query
+
+DAY = datetime.datetime(2024, 8, 31, 9, tzinfo=datetime.timezone.utc)
+
+def at(hour, minute=0):
+    return DAY.replace(hour=hour, minute=minute)
+
+def test_merge_intervals_joins_overlapping_and_touching_intervals():
+    busy = merge_intervals([(at(11), at(12)), (at(9), at(10)), (at(9, 30), at(10, 30)), (at(10, 30), at(10, 45))])
+
+    assert busy == [[at(9), at(10, 45)], [at(11), at(12)]]
+
+def test_free_slots_skip_busy_intervals():
+    busy = [[at(9, 30), at(10, 10)], [at(11), at(12)]]
+
+    slots = list(free_slots(busy, at(9), at(12), datetime.timedelta(minutes=30), datetime.timedelta(minutes=15)))
+
+    assert slots == [
+        (at(9), at(9, 30)),
+        (at(10, 15), at(10, 45)),
+        (at(10, 30), at(11)),
+    ]
+
+@pytest.mark.django_db
+def test_query_available_slots(client):
+    medspa = create_medspa()
+    service1 = create_service(medspa, duration=30)
+    service2 = create_service(medspa, duration=15)
+    other_medspa = create_medspa(name="Other Medspa")
+    create_appointment(medspa, [service1], start_time=at(10))
+    create_appointment(medspa, [service1], start_time=at(11), status='canceled')
+    create_appointment(other_medspa, [create_service(other_medspa, duration=60)], start_time=at(11))
+    # started before the window but still running into it
+    create_appointment(medspa, [create_service(medspa, duration=90)], start_time=at(8))
+
+    content = execute_graphql_query(
+        client,
+        '''
+        query($medspaId: UUID!, $serviceIds: [UUID!]!, $from: DateTime!, $to: DateTime!) {
+            availableSlots(medspaId: $medspaId, serviceIds: $serviceIds, from: $from, to: $to, granularity: 30) {
+                startTime
+                endTime
+            }
+        }
+        ''',
+        variables={
+            'medspaId': str(medspa.id),
+            'serviceIds': [str(service1.id), str(service2.id)],
+            'from': at(9).isoformat(),
+            'to': at(12).isoformat(),
+        }
+    )
+
+    assert 'errors' not in content, content['errors']
+    assert [slot['startTime'] for slot in content['data']['availableSlots']] == [
+        at(10, 30).isoformat(),
+        at(11).isoformat(),
+    ]
+    assert content['data']['availableSlots'][0]['endTime'] == at(11, 15).isoformat()
+
+@pytest.mark.django_db
+def test_query_available_slots_rejects_services_of_another_medspa(client):
+    medspa = create_medspa()
+    other_service = create_service(create_medspa(name="Other Medspa"))
+
+    content = execute_graphql_query(
+        client,
+        '''
+        query($medspaId: UUID!, $serviceIds: [UUID!]!, $from: DateTime!, $to: DateTime!) {
+            availableSlots(medspaId: $medspaId, serviceIds: $serviceIds, from: $from, to: $to) {
+                startTime
+            }
+        }
+        ''',
+        variables={
+            'medspaId': str(medspa.id),
+            'serviceIds': [str(other_service.id)],
+            'from': at(9).isoformat(),
+            'to': at(12).isoformat(),
+        }
+    )
+
+    assert content['errors'][0]['message'] == 'Service not found'
@@ -0,0 +1,117 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from moxie_medspa.reporting import rebuild_rollups
+from moxie_medspa.tests.test_helpers import create_appointment, create_medspa, create_service, execute_graphql_query
+
+REVENUE = '''
+    query($period: ReportPeriod) {
+        revenueByMedspa(start: "2000-01-01", end: "2100-01-01", period: $period) {
+            medspa {
+                name
+            }
+            revenue
+        }
+    }
+'''
+UTILIZATION = '''
+    query {
+        serviceUtilization(start: "2000-01-01", end: "2100-01-01") {
+            service {
+                name
+                medspa {
+                    name
+                    services {
+                        name
+                    }
+                }
+            }
+            bookingCount
+        }
+    }
+'''
+CREATE_SERVICE = '''
+    mutation($medspaId: UUID!) {
+        createService(name: "New Service", description: "New", price: 10, duration: 15, medspaId: $medspaId) {
+            service {
+                id
+            }
+        }
+    }
+'''
+OPERATIONS = [
+    {'query': REVENUE, 'variables': {'period': 'MONTH'}},
+    {'query': UTILIZATION},
+    {'query': REVENUE},
+]
+
+
+def execute_batch(client, operations):
+    return client.post('/graphql/', operations, content_type='application/json')
+
+def create_bookings():
+    medspa = create_medspa()
+    service = create_service(medspa)
+    create_appointment(medspa, [service])
+    rebuild_rollups()
+    return medspa
+
+@pytest.mark.django_db
+def test_batch_returns_a_result_per_operation(client):
+    medspa = create_bookings()
+
+    response = execute_batch(client, OPERATIONS)
+
+    assert response.status_code == 200
+    results = response.json()
+    assert [result['data'] for result in results] == [
+        execute_graphql_query(client, operation['query'], operation.get('variables'))['data'] for operation in OPERATIONS
+    ]
+    assert [result['status'] for result in results] == [200, 200, 200]
+    assert results[0]['data']['revenueByMedspa'][0]['medspa']['name'] == medspa.name
+
+@pytest.mark.django_db
+def test_batch_runs_fewer_queries_than_separate_requests(client):
+    create_bookings()
+
+    with CaptureQueriesContext(connection) as separate_queries:
+        for operation in OPERATIONS:
+            execute_graphql_query(client, operation['query'], operation.get('variables'))
+    with CaptureQueriesContext(connection) as batch_queries:
+        execute_batch(client, OPERATIONS)
+
+    # The medspa is loaded once for the whole batch instead of once per operation.
+    assert len(separate_queries) == 8
+    assert len(batch_queries) == 6
+
+@pytest.mark.django_db
+def test_batch_reloads_after_a_mutation(client):
+    medspa = create_bookings()
+
+    results = execute_batch(client, [
+        {'query': UTILIZATION},
+        {'query': CREATE_SERVICE, 'variables': {'medspaId': str(medspa.id)}},
+        {'query': UTILIZATION},
+    ]).json()
+
+    def service_names(result):
+        return sorted(service['name'] for service in result['data']['serviceUtilization'][0]['service']['medspa']['services'])
+
+    assert service_names(results[0]) == ['Test Service']
+    assert service_names(results[2]) == ['New Service', 'Test Service']
+
+@pytest.mark.django_db
+@override_settings(GRAPHQL_MAX_BATCH_SIZE=2)
+def test_batch_size_is_limited(client):
+    response = execute_batch(client, OPERATIONS)
+
+    assert response.status_code == 400
+    assert response.json()['errors'][0]['message'] == 'Batches are limited to 2 operations.'
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('operations', [[1], [OPERATIONS[0], 'query { allMedspas { totalCount } }'], [[OPERATIONS[0]]]])
+def test_batch_entries_must_be_objects(client, operations):
+    response = execute_batch(client, operations)
+
+    assert response.status_code == 400
+    assert response.json()['errors'][0]['message'] == 'Batch entries must be objects.'
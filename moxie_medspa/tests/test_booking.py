@@ -0,0 +1,198 @@
+import io
+import threading
+
+import pytest
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.db.models import Sum
+from django.test import Client
+from django.utils import timezone
+from moxie_medspa import pubsub
+from moxie_medspa.models import Appointment, DailyMedspaRollup
+from moxie_medspa.reporting import rebuild_rollups
+from moxie_medspa.tests.test_helpers import create_medspa, create_service, create_appointment, execute_graphql_query
+
+CREATE_APPOINTMENT_MUTATION = '''
+    mutation createAppointment($startTime: DateTime!, $serviceIds: [UUID!]!, $medspaId: UUID!) {
+        createAppointment(startTime: $startTime, serviceIds: $serviceIds, medspaId: $medspaId) {
+            appointment {
+                id
+            }
+        }
+    }
+'''
+
+UPDATE_STATUS_MUTATION = '''
+    mutation updateAppointmentStatus($appointmentId: UUID!) {
+        updateAppointmentStatus(appointmentId: $appointmentId, status: "canceled") {
+            appointment {
+                status
+            }
+        }
+    }
+'''
+
+def book(client, medspa, services, start_time):
+    return execute_graphql_query(
+        client,
+        CREATE_APPOINTMENT_MUTATION,
+        variables={
+            'startTime': start_time.isoformat(),
+            'serviceIds': [str(service.id) for service in services],
+            'medspaId': str(medspa.id),
+        }
+    )
+
+@pytest.mark.django_db
+def test_overlapping_booking_returns_conflict_error(client):
+    medspa = create_medspa()
+    service = create_service(medspa, duration=60)
+    start_time = timezone.now().replace(microsecond=0)
+    existing = create_appointment(medspa, [service], start_time=start_time)
+
+    content = book(client, medspa, [service], start_time + timezone.timedelta(minutes=30))
+
+    error = content['errors'][0]
+    assert error['extensions']['code'] == 'APPOINTMENT_CONFLICT'
+    assert error['extensions']['conflictingAppointments'] == [{
+        'id': str(existing.id),
+        'startTime': existing.start_time.isoformat(),
+        'endTime': existing.end_time.isoformat(),
+    }]
+    assert Appointment.objects.count() == 1
+
+@pytest.mark.django_db
+def test_back_to_back_and_other_medspa_bookings_are_allowed(client):
+    medspa = create_medspa()
+    service = create_service(medspa, duration=60)
+    other_medspa = create_medspa(name="Other Medspa")
+    other_service = create_service(other_medspa, duration=60)
+    start_time = timezone.now()
+    create_appointment(medspa, [service], start_time=start_time)
+    create_appointment(medspa, [service], start_time=start_time + timezone.timedelta(hours=2), status='canceled')
+
+    for content in [
+        book(client, medspa, [service], start_time + timezone.timedelta(hours=1)),
+        book(client, medspa, [service], start_time - timezone.timedelta(hours=1)),
+        book(client, medspa, [service], start_time + timezone.timedelta(hours=2)),
+        book(client, other_medspa, [other_service], start_time),
+    ]:
+        assert 'errors' not in content, content['errors']
+
+@pytest.mark.django_db
+def test_rescheduling_a_canceled_appointment_into_a_taken_slot_is_rejected(client):
+    medspa = create_medspa()
+    service = create_service(medspa)
+    start_time = timezone.now()
+    canceled = create_appointment(medspa, [service], start_time=start_time, status='canceled')
+    create_appointment(medspa, [service], start_time=start_time)
+
+    content = execute_graphql_query(
+        client,
+        '''
+        mutation updateAppointmentStatus($appointmentId: UUID!) {
+            updateAppointmentStatus(appointmentId: $appointmentId, status: "scheduled") {
+                appointment {
+                    status
+                }
+            }
+        }
+        ''',
+        variables={'appointmentId': str(canceled.id)}
+    )
+
+    assert content['errors'][0]['extensions']['code'] == 'APPOINTMENT_CONFLICT'
+    canceled.refresh_from_db()
+    assert canceled.status == 'canceled'
+
+@pytest.mark.django_db(transaction=True)
+def test_concurrent_bookings_for_one_slot_only_book_once():
+    medspa = create_medspa()
+    service = create_service(medspa, duration=60)
+    start_time = timezone.now()
+    attempts = 8
+    barrier = threading.Barrier(attempts)
+    responses = []
+
+    def attempt():
+        try:
+            barrier.wait()
+            responses.append(book(Client(), medspa, [service], start_time))
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=attempt) for _ in range(attempts)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    booked = [content for content in responses if content['data']['createAppointment']]
+    conflicts = [content for content in responses if 'errors' in content]
+    assert len(booked) == 1
+    assert len(conflicts) == attempts - 1
+    assert all(content['errors'][0]['extensions']['code'] == 'APPOINTMENT_CONFLICT' for content in conflicts)
+    assert Appointment.objects.filter(medspa=medspa).count() == 1
+
+@pytest.mark.django_db(transaction=True)
+def test_concurrent_status_changes_apply_once(monkeypatch):
+    medspa = create_medspa()
+    appointment = create_appointment(medspa, [create_service(medspa)])
+    rebuild_rollups()
+    published = []
+    monkeypatch.setattr(pubsub, 'publish_appointments', lambda event, appointments: published.extend(appointments))
+    attempts = 6
+    barrier = threading.Barrier(attempts)
+    responses = []
+
+    def attempt():
+        try:
+            barrier.wait()
+            responses.append(execute_graphql_query(Client(), UPDATE_STATUS_MUTATION, variables={'appointmentId': str(appointment.id)}))
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=attempt) for _ in range(attempts)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert all(content['data']['updateAppointmentStatus']['appointment']['status'] == 'CANCELED' for content in responses)
+    assert len(published) == 1
+    counts = dict(DailyMedspaRollup.objects.values_list('status').annotate(Sum('appointment_count')))
+    assert counts == {'scheduled': 0, 'canceled': 1}
+
+@pytest.mark.django_db
+def test_complete_past_appointments_in_batches():
+    medspa = create_medspa()
+    service = create_service(medspa, duration=60)
+    now = timezone.now()
+    ended = [create_appointment(medspa, [service], start_time=now - timezone.timedelta(hours=hours)) for hours in range(2, 7)]
+    in_progress = create_appointment(medspa, [service], start_time=now - timezone.timedelta(minutes=30))
+    upcoming = create_appointment(medspa, [service], start_time=now + timezone.timedelta(hours=1))
+    canceled = create_appointment(medspa, [service], start_time=now - timezone.timedelta(days=1), status='canceled')
+    rebuild_rollups()
+    stdout = io.StringIO()
+
+    call_command('complete_past_appointments', '--batch-size', '2', stdout=stdout)
+
+    assert 'Completed 5 appointments in 3 batches' in stdout.getvalue()
+    statuses = dict(Appointment.objects.values_list('id', 'status'))
+    assert [statuses[appointment.id] for appointment in ended] == ['completed'] * 5
+    assert [statuses[appointment.id] for appointment in [in_progress, upcoming, canceled]] == ['scheduled', 'scheduled', 'canceled']
+    assert DailyMedspaRollup.objects.filter(status='completed').aggregate(total=Sum('appointment_count'))['total'] == 5
+    assert DailyMedspaRollup.objects.filter(status='scheduled').aggregate(total=Sum('appointment_count'))['total'] == 2
+
+@pytest.mark.django_db
+def test_complete_past_appointments_before():
+    medspa = create_medspa()
+    appointment = create_appointment(medspa, [create_service(medspa, duration=60)], start_time=timezone.now() - timezone.timedelta(days=2))
+    stdout = io.StringIO()
+
+    call_command('complete_past_appointments', '--before', (appointment.start_time - timezone.timedelta(days=1)).isoformat(), stdout=stdout)
+    assert 'Completed 0 appointments in 0 batches' in stdout.getvalue()
+
+    with pytest.raises(CommandError):
+        call_command('complete_past_appointments', '--before', 'yesterday')
@@ -0,0 +1,161 @@
+import pytest
+from django.test import override_settings
+from moxie_medspa.tests.test_helpers import execute_graphql_query
+
+
+@pytest.mark.django_db
+def test_query_cost_is_reported_in_extensions(client):
+    content = execute_graphql_query(
+        client,
+        '''
+        query {
+            allMedspas(first: 5) {
+                edges {
+                    node {
+                        name
+                        services {
+                            name
+                        }
+                    }
+                }
+            }
+        }
+        '''
+    )
+
+    assert 'errors' not in content
+    # 5 medspas * (connection + edges + node + 10 services)
+    assert content['extensions']['cost']['requestedQueryCost'] == 5 * (1 + 1 + 1 + 10)
+    assert content['extensions']['cost']['depth'] == 5
+
+@pytest.mark.django_db
+def test_page_size_from_variables_drives_cost(client):
+    query = '''
+        query($first: Int) {
+            allAppointments(first: $first) {
+                edges {
+                    node {
+                        id
+                    }
+                }
+            }
+        }
+    '''
+
+    small = execute_graphql_query(client, query, variables={'first': 2})
+    large = execute_graphql_query(client, query, variables={'first': 50})
+
+    assert small['extensions']['cost']['requestedQueryCost'] == 2 * 3
+    assert large['extensions']['cost']['requestedQueryCost'] == 50 * 3
+
+@pytest.mark.django_db
+def test_fragments_are_costed(client):
+    content = execute_graphql_query(
+        client,
+        '''
+        query {
+            allServices(first: 4) {
+                edges {
+                    node {
+                        ...ServiceFields
+                    }
+                }
+            }
+        }
+
+        fragment ServiceFields on ServiceType {
+            name
+            medspa {
+                name
+            }
+        }
+        '''
+    )
+
+    assert content['extensions']['cost']['requestedQueryCost'] == 4 * (1 + 1 + 1 + 1)
+
+@pytest.mark.django_db
+def test_fan_out_query_is_rejected_before_execution(client, django_assert_num_queries):
+    with django_assert_num_queries(0):
+        content = execute_graphql_query(
+            client,
+            '''
+            query {
+                allMedspas {
+                    edges {
+                        node {
+                            appointments {
+                                services {
+                                    appointments {
+                                        services {
+                                            name
+                                        }
+                                    }
+                                }
+                            }
+                        }
+                    }
+                }
+            }
+            '''
+        )
+
+    assert content['errors'][0]['extensions']['code'] == 'QUERY_TOO_COMPLEX'
+    assert 'data' not in content
+    assert content['extensions']['cost']['requestedQueryCost'] > content['extensions']['cost']['maximumAvailable']
+
+@pytest.mark.django_db
+def test_negative_page_size_does_not_offset_other_fields(client, django_assert_num_queries):
+    with django_assert_num_queries(0):
+        content = execute_graphql_query(
+            client,
+            '''
+            query {
+                a: allMedspas(first: -1000000) {
+                    edges {
+                        node {
+                            name
+                        }
+                    }
+                }
+                b: allMedspas {
+                    edges {
+                        node {
+                            appointments {
+                                services {
+                                    appointments {
+                                        id
+                                    }
+                                }
+                            }
+                        }
+                    }
+                }
+            }
+            '''
+        )
+
+    assert content['errors'][0]['extensions']['code'] == 'QUERY_TOO_COMPLEX'
+    assert 'data' not in content
+    assert content['extensions']['cost']['requestedQueryCost'] > content['extensions']['cost']['maximumAvailable']
+
+@pytest.mark.django_db
+@override_settings(GRAPHQL_MAX_QUERY_DEPTH=3)
+def test_deep_query_is_rejected(client):
+    content = execute_graphql_query(
+        client,
+        '''
+        query {
+            allMedspas(first: 1) {
+                edges {
+                    node {
+                        name
+                    }
+                }
+            }
+        }
+        '''
+    )
+
+    assert content['errors'][0]['extensions']['code'] == 'QUERY_TOO_DEEP'
+    assert content['extensions']['cost']['depth'] == 4
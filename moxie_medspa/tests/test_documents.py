@@ -0,0 +1,74 @@
+import pytest
+from moxie_medspa.documents import DocumentCache, document_cache, query_hash
+from moxie_medspa.schema import schema
+from moxie_medspa.tests.test_helpers import create_medspa, execute_graphql_query
+
+MEDSPA_QUERY = '''
+    query getMedspa($id: UUID!) {
+        medspa(id: $id) {
+            name
+        }
+    }
+'''
+
+def persisted_query_request(client, sha256_hash, query=None, variables=None):
+    body = {
+        'variables': variables,
+        'extensions': {'persistedQuery': {'version': 1, 'sha256Hash': sha256_hash}},
+    }
+    if query:
+        body['query'] = query
+    return client.post('/graphql/', body, content_type='application/json').json()
+
+@pytest.mark.django_db
+def test_repeated_queries_are_parsed_once(client):
+    medspa = create_medspa()
+
+    for _ in range(3):
+        content = execute_graphql_query(client, MEDSPA_QUERY, variables={'id': str(medspa.id)})
+        assert content['data']['medspa']['name'] == medspa.name
+
+    assert document_cache.stats()['misses'] == 1
+    assert document_cache.stats()['hits'] == 2
+
+@pytest.mark.django_db
+def test_invalid_documents_are_not_cached(client):
+    for _ in range(2):
+        content = execute_graphql_query(client, 'query { allMedspas { unknownField } }')
+        assert 'unknownField' in content['errors'][0]['message']
+
+    assert document_cache.stats()['size'] == 0
+
+def test_document_cache_evicts_least_recently_used():
+    documents = DocumentCache(maxsize=2)
+    graphql_schema = schema.graphql_schema
+
+    documents.get_document(graphql_schema, 'query { allMedspas { totalCount } }')
+    documents.get_document(graphql_schema, 'query { allServices { totalCount } }')
+    documents.get_document(graphql_schema, 'query { allMedspas { totalCount } }')
+    documents.get_document(graphql_schema, 'query { allAppointments { totalCount } }')
+    documents.get_document(graphql_schema, 'query { allMedspas { totalCount } }')
+
+    assert documents.stats() == {'hits': 2, 'misses': 3, 'size': 2, 'maxsize': 2}
+
+@pytest.mark.django_db
+def test_automatic_persisted_query(client):
+    medspa = create_medspa()
+    sha256_hash = query_hash(MEDSPA_QUERY)
+    variables = {'id': str(medspa.id)}
+
+    content = persisted_query_request(client, sha256_hash, variables=variables)
+    assert content['errors'][0]['message'] == 'PersistedQueryNotFound'
+    assert content['errors'][0]['extensions']['code'] == 'PERSISTED_QUERY_NOT_FOUND'
+
+    content = persisted_query_request(client, sha256_hash, query=MEDSPA_QUERY, variables=variables)
+    assert content['data']['medspa']['name'] == medspa.name
+
+    content = persisted_query_request(client, sha256_hash, variables=variables)
+    assert content['data']['medspa']['name'] == medspa.name
+
+@pytest.mark.django_db
+def test_automatic_persisted_query_rejects_wrong_hash(client):
+    content = persisted_query_request(client, query_hash('query { __typename }'), query=MEDSPA_QUERY)
+
+    assert content['errors'][0]['extensions']['code'] == 'INVALID_SHA256_HASH'
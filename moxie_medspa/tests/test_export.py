@@ -0,0 +1,97 @@
+import csv
+import io
+import json
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.db import connection
+from django.test import AsyncClient, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from moxie_medspa.tests.test_helpers import create_medspa, create_service, create_appointment
+
+
+def create_appointments(medspa, services, count, status='scheduled'):
+    start_time = timezone.now().replace(microsecond=0)
+    return [
+        create_appointment(medspa, services, start_time=start_time + timezone.timedelta(hours=i), status=status)
+        for i in range(count)
+    ]
+
+def read_ndjson(response):
+    return [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+
+@pytest.mark.django_db
+def test_export_appointments_as_ndjson(client):
+    medspa = create_medspa()
+    service1 = create_service(medspa, name="Botox")
+    service2 = create_service(medspa, name="Filler")
+    appointments = create_appointments(medspa, [service1, service2], 3)
+    create_appointments(create_medspa(name="Other Medspa"), [], 2)
+
+    response = client.get('/export/appointments/', {'medspa_id': str(medspa.id)})
+
+    assert response.status_code == 200
+    assert response['Content-Type'] == 'application/x-ndjson'
+    rows = read_ndjson(response)
+    assert [row['id'] for row in rows] == [str(appointment.id) for appointment in appointments]
+    assert rows[0]['start_time'] == appointments[0].start_time.isoformat()
+    assert sorted(rows[0]['service_names']) == ["Botox", "Filler"]
+
+@pytest.mark.django_db
+def test_export_appointments_as_csv_with_filters(client):
+    medspa = create_medspa()
+    service = create_service(medspa, name="Botox")
+    scheduled = create_appointments(medspa, [service], 3)
+    create_appointments(medspa, [service], 2, status='canceled')
+
+    response = client.get('/export/appointments/', {
+        'format': 'csv',
+        'status': 'scheduled',
+        'start': scheduled[1].start_time.isoformat(),
+    })
+
+    assert response.status_code == 200
+    rows = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode())))
+    assert [row['id'] for row in rows] == [str(appointment.id) for appointment in scheduled[1:]]
+    assert rows[0]['service_names'] == "Botox"
+    assert rows[0]['status'] == 'scheduled'
+
+@pytest.mark.django_db
+@override_settings(APPOINTMENT_EXPORT_CHUNK_SIZE=2)
+def test_export_reads_and_prefetches_in_chunks(client):
+    medspa = create_medspa()
+    service = create_service(medspa)
+    create_appointments(medspa, [service], 5)
+
+    with CaptureQueriesContext(connection) as queries:
+        rows = read_ndjson(client.get('/export/appointments/', {'medspa_id': str(medspa.id)}))
+
+    assert len(rows) == 5
+    # one cursor over the appointments, one services prefetch per chunk of 2
+    assert len([query for query in queries if 'moxie_medspa_service' in query['sql']]) == 3
+
+@pytest.mark.django_db
+@override_settings(APPOINTMENT_EXPORT_CHUNK_SIZE=2)
+def test_export_streams_chunks_under_asgi(recwarn):
+    medspa = create_medspa()
+    service = create_service(medspa)
+    appointments = create_appointments(medspa, [service], 5)
+
+    async def export():
+        response = await AsyncClient().get('/export/appointments/')
+        assert response.is_async
+        return [chunk async for chunk in response.streaming_content]
+
+    chunks = async_to_sync(export)()
+
+    assert len(chunks) == 3
+    rows = [json.loads(line) for line in b''.join(chunks).decode().splitlines()]
+    assert [row['id'] for row in rows] == [str(appointment.id) for appointment in appointments]
+    assert not [warning for warning in recwarn if 'synchronous iterators' in str(warning.message)]
+
+@pytest.mark.django_db
+def test_export_rejects_invalid_parameters(client):
+    assert client.get('/export/appointments/', {'format': 'xml'}).status_code == 400
+    assert client.get('/export/appointments/', {'start': 'yesterday'}).status_code == 400
+    assert client.get('/export/appointments/', {'medspa_id': 'nope'}).status_code == 400
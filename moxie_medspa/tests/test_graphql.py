@@ -13,15 +13,19 @@ def test_query_all_medspas(client):
         '''
         query {
             allMedspas {
-                id
-                name
-                address
+                edges {
+                    node {
+                        id
+                        name
+                        address
+                    }
+                }
             }
         }
         '''
     )
 
-    data = content['data']['allMedspas']
+    data = [edge['node'] for edge in content['data']['allMedspas']['edges']]
     assert len(data) == Medspa.objects.count()
     assert data[-1]['name'] == test_medspa.name
     assert data[-1]['address'] == test_medspa.address
@@ -37,17 +41,21 @@ def test_query_service_by_medspa(client):
         '''
         query($medspaId: UUID!) {
             allServices(medspaId: $medspaId) {
-                id
-                name
-                description
-                price
+                edges {
+                    node {
+                        id
+                        name
+                        description
+                        price
+                    }
+                }
             }
         }
         ''',
         variables={'medspaId': str(medspa.id)}
     )
 
-    data = content['data']['allServices']
+    data = [edge['node'] for edge in content['data']['allServices']['edges']]
     assert len(data) == 1
     assert data[0]['name'] == service.name
     assert data[0]['description'] == service.description
@@ -168,12 +176,16 @@ def test_query_appointments_by_medspa(client):
         '''
         query getAppointmentsByMedspa($medspaId: UUID!) {
             appointmentsByMedspa(medspaId: $medspaId) {
-                id
-                startTime
-                status
-                medspa {
-                    id
-                    name
+                edges {
+                    node {
+                        id
+                        startTime
+                        status
+                        medspa {
+                            id
+                            name
+                        }
+                    }
                 }
             }
         }
@@ -181,7 +193,7 @@ def test_query_appointments_by_medspa(client):
         variables={'medspaId': str(medspa.id)}
     )
 
-    data = content['data']['appointmentsByMedspa']
+    data = [edge['node'] for edge in content['data']['appointmentsByMedspa']['edges']]
     assert len(data) == 2
     assert data[0]['medspa']['id'] == str(medspa.id)
     assert data[0]['medspa']['name'] == medspa.name
@@ -191,12 +203,16 @@ def test_query_appointments_by_medspa(client):
         '''
         query getAppointmentsByMedspa($medspaId: UUID!, $date: Date) {
             appointmentsByMedspa(medspaId: $medspaId, date: $date) {
-                id
-                startTime
-                status
-                medspa {
-                    id
-                    name
+                edges {
+                    node {
+                        id
+                        startTime
+                        status
+                        medspa {
+                            id
+                            name
+                        }
+                    }
                 }
             }
         }
@@ -207,8 +223,48 @@ def test_query_appointments_by_medspa(client):
         }
     )
 
-    data = content['data']['appointmentsByMedspa']
+    data = [edge['node'] for edge in content['data']['appointmentsByMedspa']['edges']]
     assert len(data) == 1
     assert data[0]['medspa']['id'] == str(medspa.id)
     assert data[0]['medspa']['name'] == medspa.name
     assert data[0]['status'] == 'SCHEDULED'
+
+@pytest.mark.django_db
+def test_query_appointments_by_medspa_time_range(client):
+    medspa = create_medspa()
+    service = create_service(medspa)
+    start_time = timezone.now().replace(microsecond=0)
+
+    create_appointment(medspa, [service], start_time=start_time - timezone.timedelta(hours=1))
+    inside = create_appointment(medspa, [service], start_time=start_time)
+    create_appointment(medspa, [service], start_time=start_time + timezone.timedelta(hours=1))
+
+    content = execute_graphql_query(
+        client,
+        '''
+        query getAppointmentsByMedspa($medspaId: UUID!, $start: DateTime, $end: DateTime) {
+            appointmentsByMedspa(medspaId: $medspaId, start: $start, end: $end) {
+                edges {
+                    node {
+                        id
+                    }
+                }
+            }
+        }
+        ''',
+        variables={
+            'medspaId': str(medspa.id),
+            'start': start_time.isoformat(),
+            'end': (start_time + timezone.timedelta(hours=1)).isoformat()
+        }
+    )
+
+    data = [edge['node'] for edge in content['data']['appointmentsByMedspa']['edges']]
+    assert [appointment['id'] for appointment in data] == [str(inside.id)]
+
+@pytest.mark.django_db
+def test_appointments_on_date_filters_without_casting_start_time():
+    query = str(Appointment.objects.on_date(timezone.now().date()).query)
+
+    assert '::date' not in query
+    assert 'AT TIME ZONE' not in query
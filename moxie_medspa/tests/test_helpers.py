@@ -1,4 +1,6 @@
+from asgiref.sync import async_to_sync
 from moxie_medspa.models import Medspa, Service, Appointment
+from django.test import AsyncClient
 from django.utils import timezone
 
 def create_medspa(name="Test Medspa", address="123 Test St", phone_number="555-1234", email_address="test@joinmoxie.com"):
@@ -31,3 +33,8 @@ def create_appointment(medspa, services, start_time=None, status='scheduled'):
 
 def execute_graphql_query(client, query, variables=None):
     return client.post('/graphql/', {'query': query, 'variables': variables}, content_type='application/json').json()
+
+def execute_async_query(query, variables=None):
+    # async_to_sync runs the async ORM's queries on this thread, inside the test transaction.
+    post = async_to_sync(AsyncClient().post)
+    return post('/graphql/async/', {'query': query, 'variables': variables}, content_type='application/json').json()
@@ -0,0 +1,119 @@
+import time
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from moxie_medspa.identity import CatalogCache, catalog_cache
+from moxie_medspa.models import Medspa
+from moxie_medspa.tests.test_helpers import create_medspa, create_service, execute_graphql_query
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def shared_cache():
+    catalog_cache.enabled = True
+    yield catalog_cache
+    catalog_cache.enabled = False
+
+def run_query(client, query, variables):
+    with CaptureQueriesContext(connection) as queries:
+        content = execute_graphql_query(client, query, variables)
+    assert 'errors' not in content, content['errors']
+    return len(queries), content['data']
+
+def test_each_row_is_loaded_once_per_request(client):
+    medspa = create_medspa(name="Elite MedSpa")
+    service = create_service(medspa)
+
+    count, data = run_query(
+        client,
+        '''
+        query($medspaId: UUID, $serviceId: UUID) {
+            first: medspa(id: $medspaId) { name }
+            second: medspa(id: $medspaId) { name }
+            service(id: $serviceId) {
+                medspa { name }
+            }
+        }
+        ''',
+        {'medspaId': str(medspa.id), 'serviceId': str(service.id)},
+    )
+
+    # the medspa, the service; the service's medspa is the one already loaded
+    assert count == 2
+    assert data['first'] == data['second'] == data['service']['medspa'] == {'name': "Elite MedSpa"}
+
+def test_shared_cache_serves_rows_until_they_are_saved(client, shared_cache):
+    medspa = create_medspa(name="Elite MedSpa")
+    variables = {'id': str(medspa.id)}
+
+    assert run_query(client, 'query($id: UUID) { medspa(id: $id) { name } }', variables) == (1, {'medspa': {'name': "Elite MedSpa"}})
+    # A different document, so the response cache has nothing for it.
+    assert run_query(client, 'query($id: UUID) { medspa(id: $id) { name emailAddress } }', variables) == (
+        0, {'medspa': {'name': "Elite MedSpa", 'emailAddress': "test@joinmoxie.com"}},
+    )
+
+    medspa.name = "Elite MedSpa & Spa"
+    medspa.save()
+    assert run_query(client, 'query($id: UUID) { medspa(id: $id) { emailAddress name } }', variables) == (
+        1, {'medspa': {'emailAddress': "test@joinmoxie.com", 'name': "Elite MedSpa & Spa"}},
+    )
+    assert shared_cache.stats() == {
+        'enabled': True, 'size': 1, 'identity_map_hits': 0, 'hits': 1, 'misses': 2, 'hit_ratio': 1 / 3, 'invalidations': 2,
+    }
+
+def test_mutations_read_their_rows_from_the_database(client, shared_cache):
+    service = create_service(create_medspa(), price=100)
+    shared_cache.set_many([service], shared_cache.version)
+    type(service).objects.filter(id=service.id).update(price=120)
+
+    content = execute_graphql_query(
+        client,
+        '''
+        mutation($serviceId: UUID!) {
+            updateService(serviceId: $serviceId, duration: 45) {
+                service { price duration }
+            }
+        }
+        ''',
+        {'serviceId': str(service.id)},
+    )
+
+    assert content['data']['updateService']['service'] == {'price': '120.00', 'duration': 45}
+
+def test_reads_that_started_before_an_invalidation_are_not_cached():
+    medspa = create_medspa()
+    cache = CatalogCache(maxsize=2)
+
+    version = cache.version
+    cache.invalidate(Medspa, medspa.pk)
+    cache.set_many([medspa], version)
+    assert cache.get_many(Medspa, [medspa.pk]) == {}
+
+    # Still true once the LRU has pushed the invalidation out.
+    version = cache.version
+    cache.invalidate(Medspa, medspa.pk)
+    cache.set_many([create_medspa(), create_medspa()], cache.version)
+    cache.set_many([medspa], version)
+    assert cache.get_many(Medspa, [medspa.pk]) == {}
+    assert cache.stats()['size'] == 2
+
+    cache.set_many([medspa], cache.version)
+    assert cache.get_many(Medspa, [medspa.pk])[medspa.pk].name == medspa.name
+
+def test_replica_reads_count_as_read_before_recent_invalidations():
+    medspa = create_medspa()
+    cache = CatalogCache(maxsize=1)
+    before = time.monotonic()
+
+    cache.invalidate(Medspa, medspa.pk)
+
+    assert cache.version_at(time.monotonic()) == 1
+    assert cache.version_at(before) == 0
+    cache.set_many([medspa], cache.version_at(before))
+    assert cache.get_many(Medspa, [medspa.pk]) == {}
+
+    # Further back than the invalidations it remembers, nothing is stored.
+    cache.invalidate(Medspa, medspa.pk)
+    assert cache.version_at(before) is None
@@ -0,0 +1,166 @@
+import io
+import json
+import uuid
+from decimal import Decimal
+
+import pytest
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from moxie_medspa.management.commands.import_medspa_data import Command
+from moxie_medspa.models import Service, Appointment
+from moxie_medspa.tests.test_helpers import create_medspa, create_service, execute_graphql_query
+
+
+def write_services_csv(path, rows):
+    lines = ['id,name,description,price,duration']
+    lines += [f'{service_id},{name},,{price},{duration}' for service_id, name, price, duration in rows]
+    path.write_text('\n'.join(lines) + '\n')
+    return str(path)
+
+def write_appointments_ndjson(path, rows):
+    path.write_text(''.join(json.dumps(row) + '\n' for row in rows))
+    return str(path)
+
+def run_import(medspa, *args):
+    stdout, stderr = io.StringIO(), io.StringIO()
+    call_command('import_medspa_data', '--medspa', str(medspa.id), *args, stdout=stdout, stderr=stderr)
+    return stdout.getvalue(), stderr.getvalue()
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('copy_args', [[], ['--no-copy']])
+def test_import_services_and_appointments(tmp_path, copy_args):
+    medspa = create_medspa()
+    existing = create_service(medspa, name="Botox", price=100, duration=30)
+    new_service_id = uuid.uuid4()
+    services = write_services_csv(tmp_path / 'services.csv', [(new_service_id, 'Filler', '250.00', 45)])
+    appointments = write_appointments_ndjson(tmp_path / 'appointments.ndjson', [
+        {'start_time': f'2024-09-02T{9 + i:02}:00:00Z', 'service_ids': [str(existing.id), str(new_service_id)]}
+        for i in range(5)
+    ])
+
+    stdout, stderr = run_import(medspa, '--services', services, '--appointments', appointments, '--batch-size', '2', *copy_args)
+
+    assert stderr == ''
+    assert 'Loaded 5 appointments' in stdout
+    assert 'rows/s' in stdout
+    assert Service.objects.get(id=new_service_id).description == ''
+    imported = Appointment.objects.filter(medspa=medspa).order_by('start_time')
+    assert imported.count() == 5
+    assert imported[0].status == 'scheduled'
+    assert imported[0].total_duration == 75
+    assert imported[0].total_price == Decimal('350.00')
+    assert set(imported[0].services.values_list('id', flat=True)) == {existing.id, new_service_id}
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('copy_args', [[], ['--no-copy']])
+def test_import_skips_invalid_rows(tmp_path, copy_args):
+    medspa = create_medspa()
+    other_service = create_service(create_medspa(name="Other Medspa"))
+    service = create_service(medspa)
+    day_long_service = create_service(medspa, duration=24 * 60 + 1)
+    appointments = write_appointments_ndjson(tmp_path / 'appointments.ndjson', [
+        {'start_time': '2024-09-02T09:00:00Z', 'service_ids': [str(service.id)]},
+        {'start_time': 'tomorrow', 'service_ids': [str(service.id)]},
+        {'start_time': '2024-09-02T11:00:00Z', 'service_ids': [str(other_service.id)]},
+        {'start_time': '2024-09-02T12:00:00Z', 'service_ids': [str(service.id)], 'status': 'pending'},
+        {'start_time': '2024-09-02T13:00:00Z', 'service_ids': [str(day_long_service.id)]},
+    ])
+
+    _, stderr = run_import(medspa, '--appointments', appointments, *copy_args)
+
+    assert sorted(stderr.splitlines()) == [
+        'appointment row 2: start_time must be an ISO 8601 datetime',
+        f'appointment row 3: unknown service {other_service.id}',
+        "appointment row 4: status must be one of ['canceled', 'completed', 'scheduled']",
+        'appointment row 5: appointments cannot be longer than 1 day, 0:00:00',
+    ]
+    assert Appointment.objects.filter(medspa=medspa).count() == 1
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('copy_args', [[], ['--no-copy']])
+def test_import_rejects_ids_stored_with_another_start_time(tmp_path, copy_args):
+    medspa = create_medspa()
+    service = create_service(medspa)
+    other_service = create_service(medspa)
+    appointment_id, other_id = uuid.uuid4(), uuid.uuid4()
+    run_import(medspa, '--appointments', write_appointments_ndjson(tmp_path / 'first.ndjson', [
+        {'id': str(appointment_id), 'start_time': '2024-09-02T09:00:00Z', 'service_ids': [str(service.id)]},
+    ]), *copy_args)
+
+    # The primary key includes start_time, so only the import keeps these out.
+    _, stderr = run_import(medspa, '--appointments', write_appointments_ndjson(tmp_path / 'second.ndjson', [
+        {'id': str(appointment_id), 'start_time': '2024-10-02T09:00:00Z', 'service_ids': [str(other_service.id)]},
+        {'id': str(appointment_id), 'start_time': '2024-09-02T09:00:00Z', 'service_ids': [str(service.id)]},
+        {'id': str(other_id), 'start_time': '2024-09-02T10:00:00Z', 'service_ids': [str(service.id)]},
+        {'id': str(other_id), 'start_time': '2024-10-02T10:00:00Z', 'service_ids': [str(service.id)]},
+    ]), '--batch-size', '3', *copy_args)
+
+    assert stderr.splitlines() == [
+        f'appointment row 1: appointment {appointment_id} already exists with another start_time',
+        f'appointment row 4: appointment {other_id} already exists with another start_time',
+    ]
+    assert Appointment.objects.filter(medspa=medspa).count() == 2
+    appointment = Appointment.objects.get(id=appointment_id)
+    assert appointment.start_time.month == 9
+    assert list(appointment.services.all()) == [service]
+    assert Appointment.objects.get(id=other_id).start_time.hour == 10
+
+@pytest.mark.django_db
+def test_import_invalidates_cached_catalog_reads(tmp_path, client):
+    medspa = create_medspa()
+    create_service(medspa, name="Botox")
+    query = '''
+        query($id: UUID) {
+            medspa(id: $id) {
+                services {
+                    name
+                }
+            }
+        }
+    '''
+
+    def service_names():
+        content = execute_graphql_query(client, query, {'id': str(medspa.id)})
+        return sorted(service['name'] for service in content['data']['medspa']['services'])
+
+    assert service_names() == ["Botox"]
+    run_import(medspa, '--services', write_services_csv(tmp_path / 'services.csv', [(uuid.uuid4(), 'Filler', '250.00', 45)]))
+
+    assert service_names() == ["Botox", "Filler"]
+
+@pytest.mark.django_db
+def test_import_unknown_medspa():
+    with pytest.raises(CommandError, match='not found'):
+        call_command('import_medspa_data', '--medspa', str(uuid.uuid4()))
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('copy_args', [[], ['--no-copy']])
+def test_import_resumes_after_failure(tmp_path, monkeypatch, copy_args):
+    medspa = create_medspa()
+    service = create_service(medspa)
+    appointments = write_appointments_ndjson(tmp_path / 'appointments.ndjson', [
+        {'start_time': f'2024-09-02T{9 + i:02}:00:00Z', 'service_ids': [str(service.id)]}
+        for i in range(6)
+    ])
+    load_batch = Command.load_batch
+    batches = []
+
+    def failing_load_batch(self, *args):
+        if len(batches) == 2:
+            raise RuntimeError('connection lost')
+        batches.append(args)
+        return load_batch(self, *args)
+
+    monkeypatch.setattr(Command, 'load_batch', failing_load_batch)
+    with pytest.raises(RuntimeError):
+        run_import(medspa, '--appointments', appointments, '--batch-size', '2', *copy_args)
+    monkeypatch.undo()
+
+    with pytest.raises(CommandError, match='--resume'):
+        run_import(medspa, '--appointments', appointments, *copy_args)
+
+    stdout, _ = run_import(medspa, '--appointments', appointments, '--batch-size', '2', '--resume', *copy_args)
+
+    assert 'Resuming appointments after row 4' in stdout
+    assert 'Loaded 2 appointments' in stdout
+    assert Appointment.objects.filter(medspa=medspa).count() == 6
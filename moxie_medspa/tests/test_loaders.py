@@ -0,0 +1,97 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from moxie_medspa.models import Medspa
+from moxie_medspa.tests.test_helpers import create_medspa, create_service, create_appointment, execute_graphql_query
+
+
+def create_appointments(count):
+    medspa = create_medspa()
+    service1 = create_service(medspa, name="Service A", price=100.0, duration=30)
+    service2 = create_service(medspa, name="Service B", price=150.0, duration=45)
+    for i in range(count):
+        create_appointment(medspa, [service1, service2], start_time=timezone.now() + timezone.timedelta(hours=i))
+    return medspa
+
+def count_queries(client, query, variables=None):
+    with CaptureQueriesContext(connection) as queries:
+        content = execute_graphql_query(client, query, variables=variables)
+    assert 'errors' not in content, content['errors']
+    return len(queries), content['data']
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('count', [1, 5, 25])
+def test_all_appointments_relations_are_batched(client, count):
+    medspa = create_appointments(count)
+
+    num_queries, data = count_queries(
+        client,
+        '''
+        query {
+            allAppointments {
+                edges {
+                    node {
+                        id
+                        medspa {
+                            name
+                        }
+                        services {
+                            name
+                            medspa {
+                                name
+                            }
+                        }
+                    }
+                }
+            }
+        }
+        '''
+    )
+
+    # appointments joined with their medspa, then their services joined with theirs
+    assert num_queries == 2
+    appointments = [edge['node'] for edge in data['allAppointments']['edges']]
+    assert len(appointments) == count
+    for appointment in appointments:
+        assert appointment['medspa']['name'] == medspa.name
+        assert sorted(service['name'] for service in appointment['services']) == ["Service A", "Service B"]
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('count', [1, 5, 25])
+def test_all_medspas_relations_are_batched(client, count):
+    for _ in range(count):
+        create_appointments(2)
+
+    num_queries, data = count_queries(
+        client,
+        '''
+        query {
+            allMedspas {
+                edges {
+                    node {
+                        name
+                        services {
+                            name
+                            appointments {
+                                id
+                            }
+                        }
+                        appointments {
+                            id
+                        }
+                    }
+                }
+            }
+        }
+        '''
+    )
+
+    # medspas, medspa services, medspa appointments, service appointments
+    assert num_queries == 4
+    medspas = [edge['node'] for edge in data['allMedspas']['edges']]
+    assert len(medspas) == Medspa.objects.count()
+    for medspa in [medspa for medspa in medspas if medspa['name'] == "Test Medspa"]:
+        assert len(medspa['services']) == 2
+        assert len(medspa['appointments']) == 2
+        assert all(len(service['appointments']) == 2 for service in medspa['services'])
@@ -0,0 +1,30 @@
+import time
+import uuid
+
+import pytest
+from moxie_medspa.models import Medspa, uuid7
+from moxie_medspa.tests.test_helpers import create_medspa, execute_graphql_query
+
+def test_uuid7_layout():
+    timestamp_ms = int(time.time() * 1000)
+    value = uuid7(timestamp_ms)
+
+    assert value.version == 7
+    assert value.variant == uuid.RFC_4122
+    assert value.int >> 80 == timestamp_ms
+
+def test_uuid7_sorts_by_time():
+    values = [uuid7(timestamp_ms) for timestamp_ms in range(1_700_000_000_000, 1_700_000_000_100)]
+
+    assert sorted(values) == values
+    assert len(set(uuid7(1_700_000_000_000) for _ in range(1000))) == 1000
+
+@pytest.mark.django_db
+def test_new_rows_get_uuid7_and_uuid4_rows_stay_valid(client):
+    old = Medspa.objects.create(id=uuid.uuid4(), name='Old Medspa', address='', phone_number='', email_address='old@joinmoxie.com')
+    new = create_medspa(name='New Medspa')
+
+    assert new.id.version == 7
+    for medspa in [old, new]:
+        content = execute_graphql_query(client, 'query ($id: UUID) { medspa(id: $id) { name } }', variables={'id': str(medspa.id)})
+        assert content['data']['medspa']['name'] == medspa.name
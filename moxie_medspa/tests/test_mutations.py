@@ -1,4 +1,7 @@
 import pytest
+import uuid
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from graphene_django.utils.testing import graphql_query
 from moxie_medspa.models import Medspa, Service, Appointment
 from django.utils import timezone
@@ -202,3 +205,189 @@ def test_update_appointment_status_mutation(client):
 
     appointment.refresh_from_db()
     assert appointment.status == "completed"
+
+@pytest.mark.django_db
+def test_update_appointment_status_follows_status_transitions(client):
+    appointment = create_appointment(create_medspa(), [], status='completed')
+    mutation = '''
+        mutation($appointmentId: UUID!, $status: String!) {
+            updateAppointmentStatus(appointmentId: $appointmentId, status: $status) {
+                appointment { status }
+            }
+        }
+    '''
+
+    with CaptureQueriesContext(connection) as queries:
+        content = execute_graphql_query(client, mutation, variables={'appointmentId': str(appointment.id), 'status': 'pending'})
+    assert content['errors'][0]['message'] == "Invalid status. Expected one of ['scheduled', 'completed', 'canceled']"
+    assert len(queries) == 0
+
+    # The same transitions as updateAppointmentStatuses: only scheduled appointments are canceled.
+    content = execute_graphql_query(client, mutation, variables={'appointmentId': str(appointment.id), 'status': 'canceled'})
+    assert content['errors'][0]['message'] == 'Cannot change a completed appointment to canceled'
+    appointment.refresh_from_db()
+    assert appointment.status == 'completed'
+
+CREATE_APPOINTMENTS_MUTATION = '''
+    mutation createAppointments($input: [AppointmentInput!]!) {
+        createAppointments(input: $input) {
+            results {
+                index
+                error
+                appointment {
+                    id
+                    totalDuration
+                    totalPrice
+                    status
+                    services {
+                        id
+                    }
+                }
+            }
+        }
+    }
+'''
+
+@pytest.mark.django_db
+def test_create_appointments_mutation(client):
+    medspa = create_medspa()
+    other_medspa = create_medspa(name="Other Medspa")
+    service1 = create_service(medspa, name="Service A", price=100.0, duration=30)
+    service2 = create_service(medspa, name="Service B", price=150.0, duration=45)
+    other_service = create_service(other_medspa)
+    start_time = timezone.now()
+    later = start_time + timezone.timedelta(hours=2)
+
+    response = graphql_query(
+        CREATE_APPOINTMENTS_MUTATION,
+        client=client,
+        graphql_url="/graphql/",
+        variables={
+            'input': [
+                {'startTime': start_time.isoformat(), 'serviceIds': [str(service1.id), str(service2.id)], 'medspaId': str(medspa.id)},
+                {'startTime': start_time.isoformat(), 'serviceIds': [str(service1.id)], 'medspaId': str(uuid.uuid4())},
+                {'startTime': start_time.isoformat(), 'serviceIds': [str(other_service.id)], 'medspaId': str(medspa.id)},
+                {'startTime': later.isoformat(), 'serviceIds': [str(service2.id), str(service2.id)], 'medspaId': str(medspa.id)},
+                {'startTime': (later + timezone.timedelta(minutes=30)).isoformat(), 'serviceIds': [str(service1.id)], 'medspaId': str(medspa.id)},
+            ]
+        }
+    )
+
+    content = response.json()
+    assert 'errors' not in content, content['errors']
+    results = content['data']['createAppointments']['results']
+
+    assert [result['index'] for result in results] == [0, 1, 2, 3, 4]
+    assert results[0]['error'] is None
+    assert results[0]['appointment']['totalDuration'] == service1.duration + service2.duration
+    assert float(results[0]['appointment']['totalPrice']) == service1.price + service2.price
+    assert results[0]['appointment']['status'] == 'SCHEDULED'
+    assert len(results[0]['appointment']['services']) == 2
+    assert results[1] == {'index': 1, 'error': 'Medspa not found', 'appointment': None}
+    assert results[2] == {'index': 2, 'error': 'Service does not belong to the medspa', 'appointment': None}
+    assert results[3]['appointment']['totalDuration'] == service2.duration
+    assert results[4] == {'index': 4, 'error': 'The requested time overlaps an existing appointment', 'appointment': None}
+
+    assert Appointment.objects.count() == 2
+    appointment = Appointment.objects.get(id=results[0]['appointment']['id'])
+    assert set(appointment.services.all()) == {service1, service2}
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('count', [1, 10, 50])
+def test_create_appointments_uses_fixed_number_of_queries(client, count):
+    medspa = create_medspa()
+    service1 = create_service(medspa, name="Service A")
+    service2 = create_service(medspa, name="Service B")
+    start_time = timezone.now()
+    items = [
+        {'startTime': (start_time + timezone.timedelta(hours=3 * i)).isoformat(), 'serviceIds': [str(service1.id), str(service2.id)], 'medspaId': str(medspa.id)}
+        for i in range(count)
+    ]
+
+    with CaptureQueriesContext(connection) as queries:
+        response = graphql_query(
+            '''
+            mutation createAppointments($input: [AppointmentInput!]!) {
+                createAppointments(input: $input) {
+                    results {
+                        error
+                    }
+                }
+            }
+            ''',
+            client=client,
+            graphql_url="/graphql/",
+            variables={'input': items}
+        )
+
+    assert 'errors' not in response.json()
+    # savepoint, locked medspas, services, overlapping appointments, appointments, appointment services,
+    # medspa and service rollups, release savepoint
+    assert len(queries) == 9
+    assert Appointment.objects.count() == count
+    assert Appointment.services.through.objects.count() == count * 2
+
+UPDATE_APPOINTMENT_STATUSES_MUTATION = '''
+    mutation updateAppointmentStatuses($ids: [UUID!]!, $status: String!) {
+        updateAppointmentStatuses(ids: $ids, status: $status) {
+            appointments {
+                id
+                status
+                medspa {
+                    name
+                }
+            }
+        }
+    }
+'''
+
+@pytest.mark.django_db
+def test_update_appointment_statuses_mutation(client):
+    medspa = create_medspa()
+    service = create_service(medspa)
+    scheduled = [create_appointment(medspa, [service]) for _ in range(3)]
+    completed = create_appointment(medspa, [service], status='completed')
+    canceled = create_appointment(medspa, [service], status='canceled')
+
+    content = execute_graphql_query(
+        client,
+        UPDATE_APPOINTMENT_STATUSES_MUTATION,
+        variables={'ids': [str(appointment.id) for appointment in [*scheduled, completed, canceled]] + [str(uuid.uuid4())], 'status': 'canceled'},
+    )
+
+    assert 'errors' not in content, content['errors']
+    # Only the scheduled ones changed; completed appointments cannot be canceled.
+    appointments = content['data']['updateAppointmentStatuses']['appointments']
+    assert sorted(appointment['id'] for appointment in appointments) == sorted(str(appointment.id) for appointment in scheduled)
+    assert all(appointment['status'] == 'CANCELED' and appointment['medspa']['name'] == medspa.name for appointment in appointments)
+    completed.refresh_from_db()
+    assert completed.status == 'completed'
+    assert Appointment.objects.filter(status='canceled').count() == 4
+
+@pytest.mark.django_db
+def test_update_appointment_statuses_rejects_other_statuses(client):
+    appointment = create_appointment(create_medspa(), [], status='canceled')
+
+    content = execute_graphql_query(
+        client, UPDATE_APPOINTMENT_STATUSES_MUTATION, variables={'ids': [str(appointment.id)], 'status': 'scheduled'}
+    )
+
+    assert content['errors'][0]['message'] == "Invalid status. Expected one of ['completed', 'canceled']"
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('count', [1, 10, 50])
+def test_update_appointment_statuses_uses_fixed_number_of_queries(client, count):
+    medspa = create_medspa()
+    service = create_service(medspa)
+    appointments = [create_appointment(medspa, [service]) for _ in range(count)]
+
+    with CaptureQueriesContext(connection) as queries:
+        content = execute_graphql_query(
+            client,
+            UPDATE_APPOINTMENT_STATUSES_MUTATION,
+            variables={'ids': [str(appointment.id) for appointment in appointments], 'status': 'completed'},
+        )
+
+    assert len(content['data']['updateAppointmentStatuses']['appointments']) == count
+    # savepoint, UPDATE ... RETURNING, appointment services, medspa and service rollups, release savepoint, medspas
+    assert len(queries) == 7
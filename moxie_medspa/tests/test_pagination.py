@@ -0,0 +1,169 @@
+import base64
+import json
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from moxie_medspa.tests.test_helpers import create_medspa, create_service, create_appointment, execute_graphql_query
+
+APPOINTMENTS_PAGE_QUERY = '''
+    query getAppointmentsByMedspa($medspaId: UUID!, $first: Int, $after: String, $last: Int, $before: String) {
+        appointmentsByMedspa(medspaId: $medspaId, first: $first, after: $after, last: $last, before: $before) {
+            edges {
+                cursor
+                node {
+                    id
+                }
+            }
+            pageInfo {
+                hasNextPage
+                hasPreviousPage
+                startCursor
+                endCursor
+            }
+        }
+    }
+'''
+
+def create_appointments(count):
+    medspa = create_medspa()
+    service = create_service(medspa)
+    start_time = timezone.now()
+    appointments = [
+        create_appointment(medspa, [service], start_time=start_time + timezone.timedelta(hours=i))
+        for i in range(count)
+    ]
+    return medspa, appointments
+
+def get_page(client, medspa, **arguments):
+    content = execute_graphql_query(client, APPOINTMENTS_PAGE_QUERY, variables={'medspaId': str(medspa.id), **arguments})
+    assert 'errors' not in content, content['errors']
+    return content['data']['appointmentsByMedspa']
+
+def node_ids(page):
+    return [edge['node']['id'] for edge in page['edges']]
+
+@pytest.mark.django_db
+def test_paginate_forward(client):
+    medspa, appointments = create_appointments(5)
+    expected_ids = [str(appointment.id) for appointment in appointments]
+
+    page = get_page(client, medspa, first=2)
+    assert node_ids(page) == expected_ids[:2]
+    assert page['pageInfo']['hasNextPage'] is True
+    assert page['pageInfo']['hasPreviousPage'] is False
+
+    page = get_page(client, medspa, first=2, after=page['pageInfo']['endCursor'])
+    assert node_ids(page) == expected_ids[2:4]
+
+    page = get_page(client, medspa, first=2, after=page['pageInfo']['endCursor'])
+    assert node_ids(page) == expected_ids[4:]
+    assert page['pageInfo']['hasNextPage'] is False
+    assert page['pageInfo']['hasPreviousPage'] is True
+
+@pytest.mark.django_db
+def test_paginate_backward(client):
+    medspa, appointments = create_appointments(5)
+    expected_ids = [str(appointment.id) for appointment in appointments]
+
+    page = get_page(client, medspa, last=2)
+    assert node_ids(page) == expected_ids[3:]
+    assert page['pageInfo']['hasPreviousPage'] is True
+
+    page = get_page(client, medspa, last=2, before=page['pageInfo']['startCursor'])
+    assert node_ids(page) == expected_ids[1:3]
+
+    page = get_page(client, medspa, last=2, before=page['pageInfo']['startCursor'])
+    assert node_ids(page) == expected_ids[:1]
+    assert page['pageInfo']['hasPreviousPage'] is False
+
+@pytest.mark.django_db
+def test_paginate_ties_on_start_time_are_broken_by_id(client):
+    medspa = create_medspa()
+    service = create_service(medspa)
+    start_time = timezone.now()
+    appointments = [create_appointment(medspa, [service], start_time=start_time) for _ in range(4)]
+    expected_ids = sorted(str(appointment.id) for appointment in appointments)
+
+    first_page = get_page(client, medspa, first=2)
+    second_page = get_page(client, medspa, first=2, after=first_page['pageInfo']['endCursor'])
+    assert node_ids(first_page) + node_ids(second_page) == expected_ids
+
+@pytest.mark.django_db
+def test_total_count_is_only_computed_when_requested(client):
+    medspa, _ = create_appointments(3)
+
+    with CaptureQueriesContext(connection) as queries:
+        get_page(client, medspa, first=1)
+    assert not any('COUNT(' in query['sql'] for query in queries)
+
+    content = execute_graphql_query(
+        client,
+        '''
+        query($medspaId: UUID!) {
+            appointmentsByMedspa(medspaId: $medspaId, first: 1) {
+                totalCount
+            }
+        }
+        ''',
+        variables={'medspaId': str(medspa.id)}
+    )
+    assert content['data']['appointmentsByMedspa']['totalCount'] == 3
+
+@pytest.mark.django_db
+def test_paginate_never_uses_offset(client):
+    medspa, _ = create_appointments(5)
+    cursor = get_page(client, medspa, first=3)['pageInfo']['endCursor']
+
+    with CaptureQueriesContext(connection) as queries:
+        get_page(client, medspa, first=1, after=cursor)
+    assert not any('OFFSET' in query['sql'] for query in queries)
+
+@pytest.mark.django_db
+def test_paginate_rejects_invalid_cursor(client):
+    medspa, _ = create_appointments(1)
+
+    content = execute_graphql_query(client, APPOINTMENTS_PAGE_QUERY, variables={'medspaId': str(medspa.id), 'after': 'not-a-cursor'})
+    assert content['errors'][0]['message'] == 'Invalid cursor'
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('values', [
+    ['x', 'y'],
+    ['2024-09-02T09:00:00', '00000000-0000-0000-0000-000000000000'],
+    ['2024-09-02T09:00:00+00:00', 1],
+    [None, None],
+])
+def test_paginate_rejects_tampered_cursor(client, values):
+    medspa, _ = create_appointments(1)
+    cursor = base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    content = execute_graphql_query(client, APPOINTMENTS_PAGE_QUERY, variables={'medspaId': str(medspa.id), 'after': cursor})
+    assert content['errors'][0]['message'] == 'Invalid cursor'
+
+@pytest.mark.django_db
+def test_all_services_ordered_by_name(client):
+    medspa = create_medspa()
+    for name in ["Microneedling", "Botox", "Chemical Peel"]:
+        create_service(medspa, name=name)
+
+    content = execute_graphql_query(
+        client,
+        '''
+        query($medspaId: UUID!) {
+            allServices(medspaId: $medspaId, first: 2) {
+                totalCount
+                edges {
+                    node {
+                        name
+                    }
+                }
+            }
+        }
+        ''',
+        variables={'medspaId': str(medspa.id)}
+    )
+
+    data = content['data']['allServices']
+    assert data['totalCount'] == 3
+    assert [edge['node']['name'] for edge in data['edges']] == ["Botox", "Chemical Peel"]
@@ -0,0 +1,140 @@
+import datetime
+import io
+
+import pytest
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from moxie_medspa.models import Appointment, AppointmentArchive, DailyMedspaRollup
+from moxie_medspa.partitions import DEFAULT_PARTITION, LINK_TABLE, ensure_partitions, partition_months
+from moxie_medspa.reporting import rebuild_rollups
+from moxie_medspa.tests.test_helpers import create_appointment, create_medspa, create_service, execute_graphql_query
+
+pytestmark = pytest.mark.django_db
+
+JANUARY = datetime.date(2019, 1, 1)
+FEBRUARY = datetime.date(2019, 2, 1)
+MARCH = datetime.date(2019, 3, 1)
+
+APPOINTMENTS_BY_MEDSPA = '''
+    query($medspaId: UUID!, $date: Date, $start: DateTime, $end: DateTime) {
+        appointmentsByMedspa(medspaId: $medspaId, date: $date, start: $start, end: $end) {
+            edges {
+                node {
+                    id
+                }
+            }
+        }
+    }
+'''
+
+
+def at(month, day=1, hour=10):
+    return datetime.datetime(month.year, month.month, day, hour, tzinfo=datetime.timezone.utc)
+
+def count_rows(table):
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT count(*) FROM {table}')
+        return cursor.fetchone()[0]
+
+def table_exists(table):
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT to_regclass(%s)', [table])
+        return cursor.fetchone()[0] is not None
+
+def book_history():
+    medspa = create_medspa()
+    services = [create_service(medspa, price=100), create_service(medspa, price=50)]
+    january = [create_appointment(medspa, services, start_time=at(JANUARY, day), status='completed') for day in [3, 17]]
+    february = create_appointment(medspa, services[:1], start_time=at(FEBRUARY, 5), status='completed')
+    # Fire the deferred foreign key checks, as a commit would, before the partitions are altered.
+    connection.check_constraints()
+    return medspa, january, february
+
+def test_rows_outside_the_partitions_get_a_partition_of_their_own():
+    medspa = create_medspa()
+    appointment = create_appointment(medspa, [create_service(medspa)], start_time=at(MARCH, 14))
+    assert count_rows(DEFAULT_PARTITION) == 1
+    assert MARCH not in partition_months()
+
+    stdout = io.StringIO()
+    call_command('create_appointment_partitions', stdout=stdout)
+
+    assert 'Created 1 appointment partitions (2019-03)' in stdout.getvalue()
+    assert count_rows(DEFAULT_PARTITION) == 0
+    assert count_rows('moxie_medspa_appointment_p2019_03') == 1
+    assert Appointment.objects.get(id=appointment.id).start_time == at(MARCH, 14)
+    assert ensure_partitions() == []
+
+def test_date_range_queries_only_read_their_partitions(client):
+    ensure_partitions([JANUARY, FEBRUARY, MARCH])
+    medspa, _, february = book_history()
+
+    for variables in [
+        {'date': '2019-02-05'},
+        {'start': at(FEBRUARY).isoformat(), 'end': at(MARCH).isoformat()},
+    ]:
+        with CaptureQueriesContext(connection) as queries:
+            content = execute_graphql_query(client, APPOINTMENTS_BY_MEDSPA, {'medspaId': str(medspa.id), **variables})
+        assert [edge['node']['id'] for edge in content['data']['appointmentsByMedspa']['edges']] == [str(february.id)]
+
+        sql = next(query['sql'] for query in queries.captured_queries if 'FROM "moxie_medspa_appointment"' in query['sql'])
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN {sql}')
+            plan = '\n'.join(line for line, in cursor.fetchall())
+        assert 'moxie_medspa_appointment_p2019_02' in plan
+        assert 'moxie_medspa_appointment_p2019_01' not in plan
+        assert DEFAULT_PARTITION not in plan
+
+def test_archiving_detaches_old_months():
+    ensure_partitions([JANUARY, FEBRUARY])
+    medspa, january, february = book_history()
+    rebuild_rollups()
+
+    stdout = io.StringIO()
+    call_command('archive_appointments', '--before', '2019-02-01', '--dry-run', stdout=stdout)
+    assert 'Would archive 1 months: 2019-01' in stdout.getvalue()
+    call_command('archive_appointments', '--before', '2019-02-01', stdout=stdout)
+
+    assert 'Archived 2019-01: 2 appointments' in stdout.getvalue()
+    assert list(Appointment.objects.values_list('id', flat=True)) == [february.id]
+    assert JANUARY not in partition_months()
+    assert count_rows('moxie_medspa_appointment_p2019_01_archived') == 2
+    assert count_rows('moxie_medspa_appointment_p2019_01_archived_services') == 4
+    assert count_rows(LINK_TABLE) == 1
+    archive = AppointmentArchive.objects.get()
+    assert (archive.month, archive.appointment_count, archive.table_name) == (JANUARY, 2, 'moxie_medspa_appointment_p2019_01_archived')
+
+    # An archived month gets a partition again when appointments come back to it.
+    late = create_appointment(medspa, list(february.services.all()), start_time=at(JANUARY, 20))
+    connection.check_constraints()
+    assert JANUARY in ensure_partitions()
+    assert count_rows('moxie_medspa_appointment_p2019_01') == 1
+    assert list(Appointment.objects.filter(start_time__lt=at(FEBRUARY)).values_list('id', flat=True)) == [late.id]
+
+    # Reports over archived months still add up.
+    rebuild_rollups()
+    assert sorted(DailyMedspaRollup.objects.values_list('day', 'revenue')) == [
+        (datetime.date(2019, 1, 3), 150), (datetime.date(2019, 1, 17), 150), (datetime.date(2019, 2, 5), 100),
+    ]
+
+    with pytest.raises(CommandError):
+        call_command('archive_appointments', '--before', 'last year')
+
+def test_archiving_compresses_old_months():
+    ensure_partitions([JANUARY, FEBRUARY])
+    medspa, january, february = book_history()
+    service_ids = sorted(str(service.id) for service in january[0].services.all())
+
+    call_command('archive_appointments', '--before', '2019-03-01', '--compress', stdout=io.StringIO())
+
+    assert not Appointment.objects.exists()
+    assert count_rows(LINK_TABLE) == 0
+    assert not table_exists('moxie_medspa_appointment_p2019_01')
+    archives = list(AppointmentArchive.objects.order_by('month'))
+    assert [(archive.month, archive.appointment_count, archive.table_name) for archive in archives] == [(JANUARY, 2, ''), (FEBRUARY, 1, '')]
+    first = archives[0].appointments[0]
+    assert first['id'] == str(january[0].id)
+    assert first['status'] == 'completed'
+    assert first['service_ids'] == service_ids
@@ -0,0 +1,34 @@
+import threading
+
+import pytest
+from django.db import connection, connections
+from moxie_medspa.models import Medspa
+
+def query_in_thread():
+    def run():
+        try:
+            Medspa.objects.count()
+        finally:
+            connections.close_all()  # what request_finished does
+    thread = threading.Thread(target=run)
+    thread.start()
+    thread.join()
+
+@pytest.mark.django_db
+def test_metrics_report_pool_usage(client):
+    assert connection.pool is not None
+
+    stats = client.get('/graphql/metrics/').json()['database_pool']
+
+    assert stats['pool_max'] == 10
+    assert stats['connections_in_use'] >= 1  # this test's transaction
+
+@pytest.mark.django_db(transaction=True)
+def test_threads_reuse_pooled_connections():
+    query_in_thread()
+    opened = connection.pool.get_stats()['connections_num']
+
+    for _ in range(5):
+        query_in_thread()
+
+    assert connection.pool.get_stats()['connections_num'] == opened
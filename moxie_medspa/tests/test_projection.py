@@ -0,0 +1,112 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from moxie_medspa.tests.test_helpers import create_medspa, create_service, create_appointment, execute_graphql_query
+
+
+def run_query(client, query, variables=None):
+    with CaptureQueriesContext(connection) as queries:
+        content = execute_graphql_query(client, query, variables=variables)
+    assert 'errors' not in content, content['errors']
+    return [query['sql'] for query in queries], content['data']
+
+@pytest.mark.django_db
+def test_all_services_loads_only_selected_columns(client):
+    create_service(create_medspa(), name="Botox")
+
+    sql, data = run_query(client, 'query { allServices { edges { node { id name } } } }')
+
+    assert len(sql) == 1
+    assert '"description"' not in sql[0]
+    assert '"price"' not in sql[0]
+    assert "Botox" in [edge['node']['name'] for edge in data['allServices']['edges']]
+
+@pytest.mark.django_db
+def test_fragments_are_part_of_the_selection(client):
+    create_service(create_medspa())
+
+    sql, data = run_query(
+        client,
+        '''
+        query {
+            allServices {
+                edges {
+                    node {
+                        ...serviceFields
+                        ... on ServiceType {
+                            price
+                        }
+                    }
+                }
+            }
+        }
+        fragment serviceFields on ServiceType {
+            description
+        }
+        '''
+    )
+
+    assert '"description"' in sql[0]
+    assert '"price"' in sql[0]
+    assert '"duration"' not in sql[0]
+
+@pytest.mark.django_db
+def test_selected_foreign_keys_are_joined(client):
+    medspa = create_medspa(name="Elite MedSpa")
+    create_service(medspa)
+    create_service(medspa, name="Filler")
+
+    sql, data = run_query(
+        client,
+        '''
+        query($medspaId: UUID) {
+            allServices(medspaId: $medspaId) {
+                edges {
+                    node {
+                        name
+                        medspa {
+                            name
+                        }
+                    }
+                }
+            }
+        }
+        ''',
+        variables={'medspaId': str(medspa.id)},
+    )
+
+    assert len(sql) == 1
+    assert 'JOIN "moxie_medspa_medspa"' in sql[0]
+    assert '"address"' not in sql[0]
+    assert [edge['node']['medspa']['name'] for edge in data['allServices']['edges']] == ["Elite MedSpa", "Elite MedSpa"]
+
+@pytest.mark.django_db
+def test_selected_to_many_relations_are_prefetched_with_their_own_selection(client):
+    medspa = create_medspa()
+    service = create_service(medspa, name="Botox")
+    create_appointment(medspa, [service])
+
+    sql, data = run_query(
+        client,
+        '''
+        query($id: UUID) {
+            medspa(id: $id) {
+                name
+                services {
+                    name
+                }
+                appointments {
+                    status
+                }
+            }
+        }
+        ''',
+        variables={'id': str(medspa.id)},
+    )
+
+    # the medspa, whole from the identity map, its services, its appointments
+    assert len(sql) == 3
+    assert '"description"' not in sql[1]
+    assert '"total_price"' not in sql[2]
+    assert data['medspa']['services'] == [{'name': "Botox"}]
+    assert data['medspa']['appointments'] == [{'status': 'SCHEDULED'}]
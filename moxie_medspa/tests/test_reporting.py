@@ -0,0 +1,171 @@
+import datetime
+from decimal import Decimal
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from moxie_medspa.models import Appointment, DailyMedspaRollup, DailyServiceRollup
+from moxie_medspa.reporting import rebuild_rollups
+from moxie_medspa.tests.test_helpers import create_appointment, create_medspa, create_service, execute_async_query, execute_graphql_query
+
+DAY = datetime.datetime(2024, 3, 30, 9, tzinfo=datetime.timezone.utc)
+
+CREATE_APPOINTMENT = '''
+    mutation($medspaId: UUID!, $serviceIds: [UUID]!, $startTime: DateTime!) {
+        createAppointment(medspaId: $medspaId, serviceIds: $serviceIds, startTime: $startTime) {
+            appointment {
+                id
+            }
+        }
+    }
+'''
+CREATE_APPOINTMENTS = '''
+    mutation($input: [AppointmentInput!]!) {
+        createAppointments(input: $input) {
+            results {
+                error
+            }
+        }
+    }
+'''
+UPDATE_STATUS = '''
+    mutation($appointmentId: UUID!, $status: String!) {
+        updateAppointmentStatus(appointmentId: $appointmentId, status: $status) {
+            appointment {
+                id
+            }
+        }
+    }
+'''
+UPDATE_STATUSES = '''
+    mutation($ids: [UUID!]!, $status: String!) {
+        updateAppointmentStatuses(ids: $ids, status: $status) {
+            appointments {
+                id
+            }
+        }
+    }
+'''
+REPORTS = '''
+    query($start: Date!, $end: Date!, $medspaId: UUID, $period: ReportPeriod) {
+        revenueByMedspa(start: $start, end: $end, medspaId: $medspaId, period: $period) {
+            medspa {
+                name
+            }
+            period
+            appointmentCount
+            revenue
+        }
+        serviceUtilization(start: $start, end: $end, medspaId: $medspaId, period: $period) {
+            service {
+                name
+            }
+            period
+            bookingCount
+        }
+        statusBreakdown(start: $start, end: $end, medspaId: $medspaId, period: $period) {
+            status
+            period
+            appointmentCount
+            revenue
+        }
+    }
+'''
+
+def run(client, query, **variables):
+    content = execute_graphql_query(client, query, variables)
+    assert 'errors' not in content, content['errors']
+    return content['data']
+
+def rollup_rows():
+    return (
+        sorted(DailyMedspaRollup.objects.filter(appointment_count__gt=0).values_list('medspa_id', 'day', 'status', 'appointment_count', 'revenue')),
+        sorted(DailyServiceRollup.objects.filter(booking_count__gt=0).values_list('service_id', 'day', 'status', 'booking_count')),
+    )
+
+@pytest.fixture
+def bookings(client):
+    medspa = create_medspa(name='Lux')
+    botox = create_service(medspa, name='Botox', price=100, duration=30)
+    facial = create_service(medspa, name='Facial', price=50, duration=60)
+
+    first = run(client, CREATE_APPOINTMENT, medspaId=str(medspa.id), serviceIds=[str(botox.id), str(facial.id)], startTime=DAY.isoformat())
+    run(client, CREATE_APPOINTMENTS, input=[
+        {'medspaId': str(medspa.id), 'serviceIds': [str(botox.id)], 'startTime': (DAY + datetime.timedelta(hours=2)).isoformat()},
+        {'medspaId': str(medspa.id), 'serviceIds': [str(facial.id)], 'startTime': (DAY + datetime.timedelta(days=3)).isoformat()},
+    ])
+    appointment_id = first['createAppointment']['appointment']['id']
+    for status in ['completed', 'scheduled', 'canceled']:
+        run(client, UPDATE_STATUS, appointmentId=appointment_id, status=status)
+    return medspa
+
+@pytest.mark.django_db
+def test_mutations_keep_rollups_in_sync_with_appointments(client, bookings):
+    incremental = rollup_rows()
+    rebuild_rollups()
+
+    assert rollup_rows() == incremental
+    assert incremental[0] == [
+        (bookings.id, datetime.date(2024, 3, 30), 'canceled', 1, Decimal('150.00')),
+        (bookings.id, datetime.date(2024, 3, 30), 'scheduled', 1, Decimal('100.00')),
+        (bookings.id, datetime.date(2024, 4, 2), 'scheduled', 1, Decimal('50.00')),
+    ]
+
+@pytest.mark.django_db
+def test_bulk_status_changes_keep_rollups_in_sync(client, bookings):
+    appointments = Appointment.objects.filter(medspa=bookings)
+    run(client, UPDATE_STATUSES, ids=[str(appointment.id) for appointment in appointments], status='completed')
+    assert set(appointments.values_list('status', flat=True)) == {'canceled', 'completed'}
+
+    incremental = rollup_rows()
+    rebuild_rollups()
+
+    assert rollup_rows() == incremental
+
+@pytest.mark.django_db
+def test_reports_by_period(client, bookings):
+    data = run(client, REPORTS, start='2024-03-01', end='2024-05-01', period='MONTH')
+
+    assert data['revenueByMedspa'] == [
+        {'medspa': {'name': 'Lux'}, 'period': '2024-03-01', 'appointmentCount': 1, 'revenue': '100.00'},
+        {'medspa': {'name': 'Lux'}, 'period': '2024-04-01', 'appointmentCount': 1, 'revenue': '50.00'},
+    ]
+    assert data['serviceUtilization'] == [
+        {'service': {'name': 'Botox'}, 'period': '2024-03-01', 'bookingCount': 1},
+        {'service': {'name': 'Facial'}, 'period': '2024-04-01', 'bookingCount': 1},
+    ]
+    assert data['statusBreakdown'] == [
+        {'status': 'canceled', 'period': '2024-03-01', 'appointmentCount': 1, 'revenue': '150.00'},
+        {'status': 'scheduled', 'period': '2024-03-01', 'appointmentCount': 1, 'revenue': '100.00'},
+        {'status': 'scheduled', 'period': '2024-04-01', 'appointmentCount': 1, 'revenue': '50.00'},
+    ]
+
+@pytest.mark.django_db
+def test_report_totals_filter_by_medspa_and_range(client, bookings):
+    other = create_medspa(name='Other')
+    create_appointment(other, [create_service(other, price=500)], start_time=DAY)
+    rebuild_rollups(other.id)
+
+    data = run(client, REPORTS, start='2024-03-30', end='2024-03-31', medspaId=str(bookings.id))
+
+    assert data['revenueByMedspa'] == [{'medspa': {'name': 'Lux'}, 'period': None, 'appointmentCount': 1, 'revenue': '100.00'}]
+    assert data['statusBreakdown'] == [
+        {'status': 'canceled', 'period': None, 'appointmentCount': 1, 'revenue': '150.00'},
+        {'status': 'scheduled', 'period': None, 'appointmentCount': 1, 'revenue': '100.00'},
+    ]
+
+@pytest.mark.django_db
+def test_reports_read_only_the_rollups(client, bookings):
+    with CaptureQueriesContext(connection) as queries:
+        run(client, REPORTS, start='2020-01-01', end='2030-01-01', period='DAY')
+
+    assert not any('moxie_medspa_appointment' in query['sql'] for query in queries)
+
+@pytest.mark.django_db
+def test_async_view_serves_reports(client, bookings):
+    variables = {'start': '2024-03-01', 'end': '2024-05-01', 'period': 'WEEK'}
+
+    content = execute_async_query(REPORTS, variables)
+
+    assert 'errors' not in content, content['errors']
+    assert content['data'] == run(client, REPORTS, **variables)
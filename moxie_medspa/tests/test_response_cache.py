@@ -0,0 +1,165 @@
+import time
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from graphene_django.utils.testing import graphql_query
+from moxie_medspa.response_cache import LocalMemoryBackend, ResponseCache, response_cache
+from moxie_medspa.tests.test_helpers import create_medspa, create_service, create_appointment, execute_graphql_query
+
+SERVICES_QUERY = '''
+    query getServices($medspaId: UUID!) {
+        allServices(medspaId: $medspaId) {
+            edges {
+                node {
+                    name
+                    price
+                    medspa {
+                        name
+                    }
+                }
+            }
+        }
+    }
+'''
+
+def get_services(client, medspa):
+    with CaptureQueriesContext(connection) as queries:
+        content = execute_graphql_query(client, SERVICES_QUERY, variables={'medspaId': str(medspa.id)})
+    assert 'errors' not in content, content['errors']
+    return len(queries), [edge['node'] for edge in content['data']['allServices']['edges']]
+
+@pytest.mark.django_db
+def test_catalog_query_is_served_from_cache(client):
+    medspa = create_medspa()
+    create_service(medspa, name="Botox")
+
+    num_queries, services = get_services(client, medspa)
+    assert num_queries > 0
+    assert [service['name'] for service in services] == ["Botox"]
+
+    num_queries, services = get_services(client, medspa)
+    assert num_queries == 0
+    assert [service['name'] for service in services] == ["Botox"]
+    assert response_cache.stats()['hits'] == 1
+    assert response_cache.stats()['misses'] == 1
+
+@pytest.mark.django_db
+def test_formatting_does_not_change_the_cache_key(client):
+    medspa = create_medspa()
+    create_service(medspa)
+    get_services(client, medspa)
+
+    compact_query = 'query getServices($medspaId: UUID!) { allServices(medspaId: $medspaId) { edges { node { name price medspa { name } } } } }'
+    with CaptureQueriesContext(connection) as queries:
+        execute_graphql_query(client, compact_query, variables={'medspaId': str(medspa.id)})
+    assert len(queries) == 0
+
+@pytest.mark.django_db
+def test_create_service_mutation_invalidates_services_of_that_medspa(client):
+    medspa = create_medspa()
+    other_medspa = create_medspa(name="Other Medspa")
+    create_service(medspa, name="Botox")
+    create_service(other_medspa, name="Filler")
+    get_services(client, medspa)
+    get_services(client, other_medspa)
+
+    graphql_query(
+        '''
+        mutation createService($medspaId: UUID!) {
+            createService(name: "Peel", description: "Chemical peel", price: 90, duration: 30, medspaId: $medspaId) {
+                service {
+                    id
+                }
+            }
+        }
+        ''',
+        client=client,
+        graphql_url="/graphql/",
+        variables={'medspaId': str(medspa.id)}
+    )
+
+    num_queries, services = get_services(client, medspa)
+    assert num_queries > 0
+    assert [service['name'] for service in services] == ["Botox", "Peel"]
+
+    num_queries, _ = get_services(client, other_medspa)
+    assert num_queries == 0
+
+@pytest.mark.django_db
+def test_saving_a_nested_medspa_invalidates_the_result(client):
+    medspa = create_medspa()
+    create_service(medspa)
+    get_services(client, medspa)
+
+    medspa.name = "Renamed Medspa"
+    medspa.save()
+
+    num_queries, services = get_services(client, medspa)
+    assert num_queries > 0
+    assert services[0]['medspa']['name'] == "Renamed Medspa"
+
+@pytest.mark.django_db
+def test_results_cached_before_a_commit_are_invalidated_by_it(client, django_capture_on_commit_callbacks):
+    medspa = create_medspa()
+    create_service(medspa)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        medspa.name = "Renamed Medspa"
+        medspa.save()
+        # Another connection still reads the old row until the commit.
+        response_cache.set('key', {'value': 1}, {f'medspa:{medspa.id}'}, started=time.time_ns())
+        assert response_cache.get('key') == {'value': 1}
+
+    assert response_cache.get('key') is None
+
+@pytest.mark.django_db
+def test_queries_reading_appointments_are_not_cached(client):
+    medspa = create_medspa()
+    service = create_service(medspa)
+    create_appointment(medspa, [service])
+    query = '''
+        query getMedspa($id: UUID!) {
+            medspa(id: $id) {
+                appointments {
+                    id
+                }
+            }
+        }
+    '''
+
+    for _ in range(2):
+        content = execute_graphql_query(client, query, variables={'id': str(medspa.id)})
+        assert len(content['data']['medspa']['appointments']) == 1
+
+    assert response_cache.stats() == {'hits': 0, 'stale_hits': 0, 'misses': 0, 'hit_ratio': 0.0}
+
+def test_expired_entries_are_served_stale_while_one_request_refreshes():
+    cache = ResponseCache(LocalMemoryBackend(), ttl=0, stale_ttl=60)
+    cache.set('key', {'value': 1}, {'medspa:1'}, started=0)
+
+    assert cache.get('key') is None  # first reader refreshes
+    assert cache.get('key') == {'value': 1}  # others get the stale copy
+    assert cache.stats()['stale_hits'] == 1
+
+    cache.invalidate('medspa:1')
+    assert cache.get('key') is None  # invalidated entries are never served stale
+
+def test_results_invalidated_during_execution_are_not_stored():
+    cache = ResponseCache(LocalMemoryBackend())
+    cache.invalidate('medspa:1')
+
+    cache.set('key', {'value': 1}, {'medspa:1'}, started=0)
+
+    assert cache.get('key') is None
+
+@pytest.mark.django_db
+def test_metrics_endpoint_reports_cache_stats(client):
+    medspa = create_medspa()
+    get_services(client, medspa)
+    get_services(client, medspa)
+
+    metrics = client.get('/graphql/metrics/').json()
+
+    assert metrics['response_cache']['hit_ratio'] == 0.5
+    assert metrics['document_cache']['hits'] == 1
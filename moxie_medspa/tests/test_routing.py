@@ -0,0 +1,145 @@
+import pytest
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from moxie_medspa import routing
+from moxie_medspa.models import Medspa
+from moxie_medspa.response_cache import response_cache
+from moxie_medspa.tests.test_helpers import create_medspa, create_service, execute_async_query, execute_graphql_query
+
+# The replica alias mirrors the test database over its own connection, which
+# only sees committed rows, hence transaction=True.
+pytestmark = pytest.mark.django_db(transaction=True, databases=['default', 'replica'])
+
+QUERY = 'query { allMedspas { edges { node { name services { name } } } } }'
+MUTATION = '''
+    mutation($medspaId: UUID!, $serviceIds: [UUID]!, $startTime: DateTime!) {
+        createAppointment(medspaId: $medspaId, serviceIds: $serviceIds, startTime: $startTime) {
+            appointment {
+                id
+            }
+        }
+    }
+'''
+
+@pytest.fixture(autouse=True)
+def replicas(settings):
+    settings.DATABASE_REPLICAS = ['replica']
+    routing.lag_monitor.clear()
+    yield
+    routing.lag_monitor.clear()
+
+def run_counting_queries(client, query, variables=None):
+    with CaptureQueriesContext(connections['default']) as primary, CaptureQueriesContext(connections['replica']) as replica:
+        content = execute_graphql_query(client, query, variables)
+    assert 'errors' not in content, content['errors']
+    return len(primary), len(replica)
+
+def test_queries_read_from_replica(client):
+    create_service(create_medspa())
+
+    primary, replica = run_counting_queries(client, QUERY)
+
+    assert primary == 0
+    assert replica > 0
+    assert 'primary_pin' not in client.cookies
+
+def test_mutations_write_to_primary_and_pin_reads(client):
+    medspa = create_medspa()
+    service = create_service(medspa)
+
+    primary, replica = run_counting_queries(client, MUTATION, {
+        'medspaId': str(medspa.id), 'serviceIds': [str(service.id)], 'startTime': timezone.now().isoformat(),
+    })
+    assert primary > 0
+    assert replica == 0
+    assert client.cookies['primary_pin']['max-age'] == 5
+
+    # The client that just wrote keeps reading its writes from the primary...
+    primary, replica = run_counting_queries(client, QUERY)
+    assert (primary > 0, replica) == (True, 0)
+
+    # ...until the pin expires.
+    del client.cookies['primary_pin']
+    response_cache.clear()
+    primary, replica = run_counting_queries(client, QUERY)
+    assert (primary, replica > 0) == (0, True)
+
+def test_lagging_replica_falls_back_to_primary(client, monkeypatch):
+    monkeypatch.setattr(routing, 'measure_lag', lambda alias: 30.0)
+    create_medspa()
+
+    primary, replica = run_counting_queries(client, QUERY)
+
+    assert primary > 0
+    assert replica == 0
+    stats = routing.lag_monitor.stats()
+    assert stats['replica_reads'] == 0
+    assert stats['fallbacks'] > 0
+    assert stats['lag_seconds'] == {'replica': 30.0}
+
+def test_lag_is_measured_on_the_replica():
+    assert routing.measure_lag('replica') == 0.0
+
+def test_writes_pin_the_rest_of_the_request():
+    router = routing.ReplicaRouter()
+    token = routing.routing_state.set(routing.RoutingState())
+    try:
+        with routing.replica_reads():
+            assert router.db_for_read(Medspa) == 'replica'
+            assert router.db_for_write(Medspa) == 'default'
+            assert router.db_for_read(Medspa) is None
+    finally:
+        routing.routing_state.reset(token)
+
+    assert router.db_for_read(Medspa) is None
+
+def test_one_replica_is_chosen_per_request(monkeypatch):
+    choices = []
+    monkeypatch.setattr(routing.lag_monitor, 'choose_replica', lambda: choices.append('replica') or 'replica')
+    router = routing.ReplicaRouter()
+    token = routing.routing_state.set(routing.RoutingState())
+    try:
+        with routing.replica_reads():
+            assert [router.db_for_read(Medspa) for _ in range(3)] == ['replica'] * 3
+        assert routing.read_from_replica()
+    finally:
+        routing.routing_state.reset(token)
+
+    assert choices == ['replica']
+
+def test_replica_reads_soon_after_an_invalidation_are_not_cached(client, settings):
+    create_service(create_medspa())
+
+    # The replica could still be behind the commit that invalidated the result.
+    run_counting_queries(client, QUERY)
+    assert run_counting_queries(client, QUERY)[1] > 0
+
+    settings.REPLICA_MAX_LAG_SECONDS = settings.REPLICA_LAG_CHECK_INTERVAL = 0
+    run_counting_queries(client, QUERY)
+    assert run_counting_queries(client, QUERY) == (0, 0)
+
+def test_async_queries_read_from_replica():
+    create_service(create_medspa())
+
+    with CaptureQueriesContext(connections['default']) as primary, CaptureQueriesContext(connections['replica']) as replica:
+        content = execute_async_query(QUERY)
+
+    assert 'errors' not in content, content['errors']
+    assert len(primary) == 0
+    assert len(replica) > 0
+
+def test_async_lookups_by_id_read_from_replica():
+    medspa = create_medspa()
+    service = create_service(medspa)
+
+    with CaptureQueriesContext(connections['default']) as primary, CaptureQueriesContext(connections['replica']) as replica:
+        content = execute_async_query(
+            'query($medspaId: UUID, $serviceId: UUID) { medspa(id: $medspaId) { name } service(id: $serviceId) { medspa { name } } }',
+            {'medspaId': str(medspa.id), 'serviceId': str(service.id)},
+        )
+
+    assert 'errors' not in content, content['errors']
+    assert content['data']['service']['medspa']['name'] == medspa.name
+    assert len(primary) == 0
+    assert len(replica) > 0
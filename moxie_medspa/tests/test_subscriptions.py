@@ -0,0 +1,214 @@
+import asyncio
+import datetime
+import json
+
+import pytest
+from asgiref.sync import async_to_sync, sync_to_async
+from django.db import transaction
+from django.test import Client
+from moxie_medspa.pubsub import InProcessBroker, PostgresBroker, SubscriberOverflow
+from moxie_medspa.subscriptions import graphql_websocket
+from moxie_medspa.tests.test_helpers import create_appointment, create_medspa, create_service, execute_graphql_query
+
+pytestmark = pytest.mark.django_db(transaction=True)
+
+START_TIME = datetime.datetime(2031, 1, 6, 10, tzinfo=datetime.timezone.utc)
+
+APPOINTMENT_CREATED = '''
+    subscription($medspaId: UUID!) {
+        appointmentCreated(medspaId: $medspaId) {
+            id
+            status
+            totalPrice
+            medspa {
+                name
+            }
+        }
+    }
+'''
+APPOINTMENT_STATUS_CHANGED = '''
+    subscription($medspaId: UUID!) {
+        appointmentStatusChanged(medspaId: $medspaId) {
+            id
+            status
+        }
+    }
+'''
+CREATE_APPOINTMENT = '''
+    mutation($medspaId: UUID!, $serviceIds: [UUID]!, $startTime: DateTime!) {
+        createAppointment(medspaId: $medspaId, serviceIds: $serviceIds, startTime: $startTime) {
+            appointment {
+                id
+            }
+        }
+    }
+'''
+UPDATE_STATUS = '''
+    mutation($appointmentId: UUID!, $status: String!) {
+        updateAppointmentStatus(appointmentId: $appointmentId, status: $status) {
+            appointment {
+                id
+            }
+        }
+    }
+'''
+
+
+class WebSocket:
+    """Drives graphql_websocket in memory, the way an ASGI server would."""
+
+    def __init__(self, path='/graphql/', subprotocols=('graphql-transport-ws',)):
+        self.incoming = asyncio.Queue()
+        self.outgoing = asyncio.Queue()
+        scope = {'type': 'websocket', 'path': path, 'subprotocols': list(subprotocols), 'headers': [], 'query_string': b''}
+        self.task = asyncio.create_task(graphql_websocket(scope, self.incoming.get, self.outgoing.put))
+
+    async def connect(self):
+        await self.incoming.put({'type': 'websocket.connect'})
+        return await self.receive_event()
+
+    async def initialize(self):
+        await self.connect()
+        await self.send({'type': 'connection_init'})
+        assert await self.receive() == {'type': 'connection_ack'}
+
+    async def send(self, message):
+        await self.incoming.put({'type': 'websocket.receive', 'text': json.dumps(message)})
+
+    async def receive_event(self):
+        return await asyncio.wait_for(self.outgoing.get(), 5)
+
+    async def receive(self):
+        return json.loads((await self.receive_event())['text'])
+
+    async def subscribe(self, id, query, variables):
+        await self.send({'type': 'subscribe', 'id': id, 'payload': {'query': query, 'variables': variables}})
+        # Let the operation task reach the broker before anything is published.
+        await asyncio.sleep(0.05)
+
+    async def disconnect(self):
+        await self.incoming.put({'type': 'websocket.disconnect', 'code': 1000})
+        await asyncio.wait_for(self.task, 5)
+
+
+def run(coroutine_function):
+    return async_to_sync(coroutine_function)()
+
+def execute_mutation(query, variables):
+    return sync_to_async(execute_graphql_query)(Client(), query, variables)
+
+def test_appointment_created_is_pushed_to_the_medspas_subscribers():
+    medspa = create_medspa(name='Subscribed Medspa')
+    other_medspa = create_medspa(name='Other Medspa')
+    service = create_service(medspa, price=120)
+
+    async def scenario():
+        socket, other_socket = WebSocket(), WebSocket()
+        await socket.initialize()
+        await other_socket.initialize()
+        await socket.subscribe('1', APPOINTMENT_CREATED, {'medspaId': str(medspa.id)})
+        await other_socket.subscribe('1', APPOINTMENT_CREATED, {'medspaId': str(other_medspa.id)})
+
+        content = await execute_mutation(
+            CREATE_APPOINTMENT, {'medspaId': str(medspa.id), 'serviceIds': [str(service.id)], 'startTime': START_TIME.isoformat()},
+        )
+        message = await socket.receive()
+        assert message == {
+            'type': 'next',
+            'id': '1',
+            'payload': {'data': {'appointmentCreated': {
+                'id': content['data']['createAppointment']['appointment']['id'],
+                'status': 'SCHEDULED',
+                'totalPrice': '120.00',
+                'medspa': {'name': 'Subscribed Medspa'},
+            }}},
+        }
+        assert other_socket.outgoing.empty()
+
+        await socket.send({'type': 'complete', 'id': '1'})
+        await socket.disconnect()
+        await other_socket.disconnect()
+
+    run(scenario)
+
+def test_status_change_is_pushed_to_the_medspas_subscribers():
+    medspa = create_medspa()
+    appointment = create_appointment(medspa, [create_service(medspa)], start_time=START_TIME)
+
+    async def scenario():
+        socket = WebSocket()
+        await socket.initialize()
+        await socket.subscribe('status', APPOINTMENT_STATUS_CHANGED, {'medspaId': str(medspa.id)})
+
+        await execute_mutation(UPDATE_STATUS, {'appointmentId': str(appointment.id), 'status': 'completed'})
+        message = await socket.receive()
+        assert message['payload'] == {'data': {'appointmentStatusChanged': {'id': str(appointment.id), 'status': 'COMPLETED'}}}
+        await socket.disconnect()
+
+    run(scenario)
+
+def test_protocol_errors():
+    async def scenario():
+        socket = WebSocket(subprotocols=['graphql-ws'])
+        assert await socket.connect() == {'type': 'websocket.close', 'code': 1002}
+
+        socket = WebSocket()
+        assert await socket.connect() == {'type': 'websocket.accept', 'subprotocol': 'graphql-transport-ws'}
+        await socket.send({'type': 'subscribe', 'id': '1', 'payload': {'query': APPOINTMENT_CREATED}})
+        assert (await socket.receive_event())['code'] == 4401
+        await socket.disconnect()
+
+        socket = WebSocket()
+        await socket.initialize()
+        await socket.send({'type': 'subscribe', 'id': '1', 'payload': {'query': '{ allMedspas { totalCount } }'}})
+        message = await socket.receive()
+        assert message['type'] == 'error'
+        assert message['payload'][0]['message'].startswith('Only subscriptions are served over WebSockets')
+        await socket.send({'type': 'ping'})
+        assert await socket.receive() == {'type': 'pong'}
+        await socket.disconnect()
+
+    run(scenario)
+
+def test_subscriptions_are_rejected_over_http(client):
+    content = execute_graphql_query(client, APPOINTMENT_CREATED, {'medspaId': str(create_medspa().id)})
+
+    assert content['errors'][0]['message'].startswith('Subscriptions are served over WebSockets')
+
+def test_slow_subscribers_are_dropped():
+    broker = InProcessBroker(queue_size=2)
+
+    async def scenario():
+        messages = broker.subscribe('channel')
+        receiving = asyncio.ensure_future(messages.__anext__())
+        await asyncio.sleep(0)
+        broker.deliver('channel', 1)
+        assert await receiving == 1
+        for message in [2, 3, 4]:
+            broker.deliver('channel', message)
+        await asyncio.sleep(0)
+        with pytest.raises(SubscriberOverflow):
+            await messages.__anext__()
+        assert broker.subscriber_count() == 0
+
+    run(scenario)
+
+def test_postgres_broker_relays_committed_messages():
+    broker = PostgresBroker()
+
+    def publish(message, commit=True):
+        with transaction.atomic():
+            broker.publish('channel', message)
+            transaction.set_rollback(not commit)
+
+    async def scenario():
+        messages = broker.subscribe('channel')
+        receiving = asyncio.ensure_future(messages.__anext__())
+        await asyncio.sleep(0.2)
+        await sync_to_async(publish)({'n': 1}, commit=False)
+        await sync_to_async(publish)({'n': 2})
+        assert await asyncio.wait_for(receiving, 5) == {'n': 2}
+        await messages.aclose()
+        await broker.close()
+
+    run(scenario)
@@ -0,0 +1,85 @@
+import json
+import logging
+
+import pytest
+from django.test import override_settings
+from moxie_medspa.tracing import variables_shape
+from moxie_medspa.tests.test_helpers import create_medspa, create_service
+
+SERVICES_QUERY = '''
+    query getServices($medspaId: UUID!) {
+        allServices(medspaId: $medspaId) {
+            edges {
+                node {
+                    name
+                    medspa {
+                        name
+                    }
+                }
+            }
+        }
+    }
+'''
+
+def post_query(client, query, variables=None, extensions=None):
+    body = {'query': query, 'variables': variables}
+    if extensions is not None:
+        body['extensions'] = extensions
+    return client.post('/graphql/', body, content_type='application/json')
+
+@pytest.mark.django_db
+def test_server_timing_header(client):
+    medspa = create_medspa()
+    create_service(medspa)
+
+    response = post_query(client, SERVICES_QUERY, {'medspaId': str(medspa.id)})
+
+    metrics = [metric.strip().split(';')[0] for metric in response['Server-Timing'].split(',')]
+    assert metrics == ['total', 'db', 'resolvers']
+    assert 'queries"' in response['Server-Timing']
+    assert 'tracing' not in response.json()['extensions']
+
+@pytest.mark.django_db
+def test_tracing_extension_is_opt_in(client):
+    medspa = create_medspa()
+    create_service(medspa)
+    create_service(medspa, name="Filler")
+
+    content = post_query(client, SERVICES_QUERY, {'medspaId': str(medspa.id)}, extensions={'tracing': True}).json()
+
+    tracing = content['extensions']['tracing']
+    assert tracing['operationName'] == 'getServices'
+    assert tracing['sqlQueries'] == 1
+    assert tracing['resolvers']['Query.allServices']['count'] == 1
+    assert tracing['resolvers']['ServiceType.name']['count'] == 2
+    assert tracing['durationMs'] >= tracing['dbDurationMs']
+
+@pytest.mark.django_db
+def test_operations_are_logged(client, caplog):
+    medspa = create_medspa()
+
+    with caplog.at_level(logging.INFO, logger='moxie_medspa.tracing'):
+        post_query(client, SERVICES_QUERY, {'medspaId': str(medspa.id)})
+
+    [record] = [json.loads(record.message) for record in caplog.records]
+    assert record['event'] == 'graphql.operation'
+    assert record['operationName'] == 'getServices'
+
+@pytest.mark.django_db
+@override_settings(GRAPHQL_SLOW_OPERATION_MS=0)
+def test_slow_operations_log_variables_shape_and_top_sql(client, caplog):
+    medspa = create_medspa()
+
+    with caplog.at_level(logging.INFO, logger='moxie_medspa.tracing'):
+        post_query(client, SERVICES_QUERY, {'medspaId': str(medspa.id)})
+
+    [slow] = [json.loads(record.message) for record in caplog.records if record.levelno == logging.WARNING]
+    assert slow['event'] == 'graphql.slow_operation'
+    assert slow['variables'] == {'medspaId': 'str'}
+    assert str(medspa.id) not in json.dumps(slow)
+    assert slow['topSql'] and 'moxie_medspa_service' in slow['topSql'][0]['sql']
+
+def test_variables_shape():
+    assert variables_shape({'input': {'ids': ['a', 'b'], 'first': 10, 'after': None}}) == {
+        'input': {'ids': ['str'], 'first': 'int', 'after': 'NoneType'},
+    }
@@ -0,0 +1,172 @@
+import json
+import logging
+import time
+from collections import defaultdict
+from contextlib import ExitStack
+from inspect import isawaitable
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger('moxie_medspa.tracing')
+
+TOP_SQL_STATEMENTS = 5
+
+
+class OperationTrace:
+    """Wall time, SQL and resolver timings collected for one request."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.operation_name = None
+        self.variables = None
+        self.query_count = 0
+        self.db_time = 0.0
+        self.statements = defaultdict(lambda: [0, 0.0])
+        self.resolvers = defaultdict(lambda: [0, 0.0])
+
+    def record_query(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.query_count += 1
+            self.db_time += elapsed
+            statement = self.statements[sql]
+            statement[0] += 1
+            statement[1] += elapsed
+
+    def record_resolver(self, field, elapsed):
+        resolver = self.resolvers[field]
+        resolver[0] += 1
+        resolver[1] += elapsed
+
+    @property
+    def duration(self):
+        return time.perf_counter() - self.started
+
+    @property
+    def resolver_time(self):
+        return sum(elapsed for _, elapsed in self.resolvers.values())
+
+    def top_statements(self, limit=TOP_SQL_STATEMENTS):
+        statements = sorted(self.statements.items(), key=lambda item: item[1][1], reverse=True)
+        return [
+            {'sql': sql, 'count': count, 'durationMs': round(elapsed * 1000, 3)}
+            for sql, (count, elapsed) in statements[:limit]
+        ]
+
+    def as_dict(self):
+        return {
+            'operationName': self.operation_name,
+            'durationMs': round(self.duration * 1000, 3),
+            'sqlQueries': self.query_count,
+            'dbDurationMs': round(self.db_time * 1000, 3),
+            'resolvers': {
+                field: {'count': count, 'durationMs': round(elapsed * 1000, 3)}
+                for field, (count, elapsed) in sorted(self.resolvers.items(), key=lambda item: item[1][1], reverse=True)
+            },
+        }
+
+    def server_timing(self):
+        return ', '.join([
+            f'total;dur={self.duration * 1000:.3f}',
+            f'db;dur={self.db_time * 1000:.3f};desc="{self.query_count} queries"',
+            f'resolvers;dur={self.resolver_time * 1000:.3f}',
+        ])
+
+
+def variables_shape(value):
+    """Replace every leaf with its type name so logs never carry user data."""
+    if isinstance(value, dict):
+        return {key: variables_shape(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [variables_shape(value[0])] if value else []
+    return type(value).__name__
+
+
+class TracingMiddleware:
+    """Django middleware timing each request and every SQL query it runs.
+
+    Adds a Server-Timing header, logs one JSON line per GraphQL operation and
+    a warning with the slowest statements when an operation takes longer than
+    GRAPHQL_SLOW_OPERATION_MS.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        request.trace = trace = OperationTrace()
+        with self.wrap_connections(connections.all(), trace):
+            response = self.get_response(request)
+        return self.finish(trace, response)
+
+    async def __acall__(self, request):
+        # Connections are per thread and the async ORM runs its queries in
+        # the request's sync worker thread, so wrap that thread's connections.
+        request.trace = trace = OperationTrace()
+        thread_connections = await sync_to_async(connections.all)()
+        with self.wrap_connections(thread_connections, trace):
+            response = await self.get_response(request)
+        return self.finish(trace, response)
+
+    def wrap_connections(self, database_connections, trace):
+        # Every alias, so reads served by a replica are counted too.
+        stack = ExitStack()
+        for connection in database_connections:
+            stack.enter_context(connection.execute_wrapper(trace.record_query))
+        return stack
+
+    def finish(self, trace, response):
+        response['Server-Timing'] = trace.server_timing()
+        if trace.operation_name is not None:
+            self.log(trace)
+        return response
+
+    def log(self, trace):
+        record = trace.as_dict()
+        logger.info(json.dumps({'event': 'graphql.operation', **record}))
+        threshold = getattr(settings, 'GRAPHQL_SLOW_OPERATION_MS', 500)
+        if threshold is not None and record['durationMs'] >= threshold:
+            logger.warning(json.dumps({
+                'event': 'graphql.slow_operation',
+                'operationName': trace.operation_name,
+                'durationMs': record['durationMs'],
+                'sqlQueries': trace.query_count,
+                'dbDurationMs': record['dbDurationMs'],
+                'variables': variables_shape(trace.variables or {}),
+                'topSql': trace.top_statements(),
+            }))
+
+
+class ResolverTimingMiddleware:
+    """Graphene middleware adding each resolver's time to `request.trace`,
+    keyed by `ParentType.field`."""
+
+    def resolve(self, next, root, info, **args):
+        trace = getattr(info.context, 'trace', None)
+        if trace is None:
+            return next(root, info, **args)
+        field = f'{info.parent_type.name}.{info.field_name}'
+        started = time.perf_counter()
+        result = next(root, info, **args)
+        if isawaitable(result):
+            return self.resolve_async(result, trace, field, started)
+        trace.record_resolver(field, time.perf_counter() - started)
+        return result
+
+    async def resolve_async(self, result, trace, field, started):
+        try:
+            return await result
+        finally:
+            trace.record_resolver(field, time.perf_counter() - started)
@@ -16,12 +16,16 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path
-from graphene_django.views import GraphQLView
 from django.views.decorators.csrf import csrf_exempt
+from moxie_medspa.views import AsyncMedspaGraphQLView, MedspaGraphQLView, export_appointments, graphql_metrics
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path('graphql/', csrf_exempt(GraphQLView.as_view(graphiql=True))),
+    path('graphql/', csrf_exempt(MedspaGraphQLView.as_view(graphiql=True))),
+    # For ASGI servers: queries run on the event loop instead of a thread.
+    path('graphql/async/', csrf_exempt(AsyncMedspaGraphQLView.as_view(graphiql=True))),
+    path('graphql/metrics/', graphql_metrics),
+    path('export/appointments/', export_appointments),
 ]
 
 
@@ -0,0 +1,455 @@
+import csv
+import itertools
+import json
+import time
+import uuid
+from inspect import isawaitable
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import connection, connections, transaction
+from django.db.models import Prefetch
+from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseNotAllowed, JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.decorators import method_decorator
+from django.views.decorators.csrf import ensure_csrf_cookie
+from graphene_django.constants import MUTATION_ERRORS_FLAG
+from graphene_django.settings import graphene_settings
+from graphene_django.utils.utils import set_rollback
+from graphene_django.views import GraphQLView, HttpError
+from graphql import ExecutionResult, GraphQLError, OperationType, execute, get_operation_ast, validate_schema
+
+from moxie_medspa.cost import check_query_cost
+from moxie_medspa.documents import document_cache, resolve_persisted_query
+from moxie_medspa.identity import catalog_cache
+from moxie_medspa.loaders import DeferredExecutionContext, clear_loaders
+from moxie_medspa.models import Service, Appointment
+from moxie_medspa.response_cache import is_cacheable, response_cache
+from moxie_medspa.routing import lag_monitor, read_from_replica, replica_reads, replica_staleness
+
+
+class MedspaGraphQLView(GraphQLView):
+    execution_context_class = DeferredExecutionContext
+
+    def parse_body(self, request):
+        # A JSON array is a batch: its operations run in order on this
+        # request, sharing its DataLoaders, and the response is an array.
+        if self.get_content_type(request) == 'application/json' and request.body.lstrip()[:1] == b'[':
+            self.batch = True
+        data = super().parse_body(request)
+        max_batch_size = getattr(settings, 'GRAPHQL_MAX_BATCH_SIZE', 10)
+        if self.batch and len(data) > max_batch_size:
+            raise HttpError(HttpResponseBadRequest(f'Batches are limited to {max_batch_size} operations.'))
+        if self.batch and not all(isinstance(entry, dict) for entry in data):
+            raise HttpError(HttpResponseBadRequest('Batch entries must be objects.'))
+        return data
+
+    def get_extensions(self, request, data):
+        extensions = request.GET.get('extensions') or data.get('extensions')
+        if extensions and isinstance(extensions, str):
+            try:
+                extensions = json.loads(extensions)
+            except ValueError:
+                raise HttpError(HttpResponseBadRequest('Extensions are invalid JSON.'))
+        return extensions
+
+    def execute_graphql_request(self, request, data, query, variables, operation_name, show_graphiql=False):
+        # Same flow as GraphQLView.execute_graphql_request, with persisted
+        # query lookup, parse/validate served from the document cache, a cost
+        # check before execution and cached results for catalog queries.
+        result, operation = self.prepare_operation(request, data, query, variables, operation_name, show_graphiql)
+        if operation is None:
+            return result
+        schema, document, operation_ast, extensions = operation
+
+        if is_cacheable(schema, document, operation_ast):
+            result = self.execute_cached_document(request, schema, document, operation_ast, variables, operation_name)
+        else:
+            result = self.execute_document(request, schema, document, operation_ast, variables, operation_name)
+        return self.add_extensions(request, data, result, extensions)
+
+    def prepare_operation(self, request, data, query, variables, operation_name, show_graphiql):
+        """Everything before execution. Returns (result, None) when the request
+        ends here, or (None, (schema, document, operation_ast, extensions))."""
+        try:
+            query = resolve_persisted_query(query, self.get_extensions(request, data))
+        except GraphQLError as error:
+            return ExecutionResult(errors=[error]), None
+
+        if not query:
+            if show_graphiql:
+                return None, None
+            raise HttpError(HttpResponseBadRequest('Must provide query string.'))
+
+        schema = self.schema.graphql_schema
+
+        schema_validation_errors = validate_schema(schema)
+        if schema_validation_errors:
+            return ExecutionResult(data=None, errors=schema_validation_errors), None
+
+        document, errors = document_cache.get_document(schema, query, self.validation_rules)
+        if errors:
+            return ExecutionResult(data=None, errors=errors), None
+
+        operation_ast = get_operation_ast(document, operation_name)
+        trace = getattr(request, 'trace', None)
+        if trace is not None:
+            name = operation_name or (
+                operation_ast.name.value if operation_ast is not None and operation_ast.name else 'anonymous'
+            )
+            # A batch is traced as one request named after all its operations.
+            trace.operation_name = f'{trace.operation_name},{name}' if self.batch and trace.operation_name else name
+            trace.variables = variables
+
+        if operation_ast is not None and operation_ast.operation == OperationType.SUBSCRIPTION:
+            error = GraphQLError('Subscriptions are served over WebSockets (see moxie_medspa.subscriptions).')
+            return ExecutionResult(data=None, errors=[error]), None
+
+        if request.method.lower() == 'get' and operation_ast is not None and operation_ast.operation != OperationType.QUERY:
+            if show_graphiql:
+                return None, None
+            raise HttpError(
+                HttpResponseNotAllowed(
+                    ['POST'], f'Can only perform a {operation_ast.operation.value} operation from a POST request.'
+                )
+            )
+
+        extensions, cost_error = check_query_cost(schema, document, operation_name, variables)
+        if cost_error:
+            return ExecutionResult(data=None, errors=[cost_error], extensions=extensions), None
+        return None, (schema, document, operation_ast, extensions)
+
+    def add_extensions(self, request, data, result, extensions):
+        trace = getattr(request, 'trace', None)
+        if trace is not None and (self.get_extensions(request, data) or {}).get('tracing'):
+            extensions = {**(extensions or {}), 'tracing': trace.as_dict()}
+        if extensions:
+            result.extensions = {**(result.extensions or {}), **extensions}
+        return result
+
+    def execute_cached_document(self, request, schema, document, operation_ast, variables, operation_name):
+        key = response_cache.make_key(document, operation_ast, variables)
+        data = response_cache.get(key)
+        if data is not None:
+            return ExecutionResult(data=data)
+
+        # CacheTagMiddleware fills this in with every catalog row the result reads.
+        request.cache_tags = set()
+        started = time.time_ns()
+        try:
+            result = self.execute_document(request, schema, document, operation_ast, variables, operation_name)
+            if not result.errors:
+                response_cache.set(key, result.data, request.cache_tags, read_started(started))
+        finally:
+            request.cache_tags = None
+        return result
+
+    def execute_document(self, request, schema, document, operation_ast, variables, operation_name, execution_context_class=None):
+        try:
+            execute_options = {
+                'root_value': self.get_root_value(request),
+                'context_value': self.get_context(request),
+                'variable_values': variables,
+                'operation_name': operation_name,
+                'middleware': self.get_middleware(request),
+                'execution_context_class': execution_context_class or self.execution_context_class,
+            }
+
+            if operation_ast is not None and operation_ast.operation == OperationType.MUTATION:
+                return self.execute_mutation(request, schema, document, execute_options)
+
+            with replica_reads():
+                return execute(schema, document, **execute_options)
+        except Exception as e:
+            return ExecutionResult(errors=[e])
+
+    def execute_mutation(self, request, schema, document, execute_options):
+        try:
+            if (
+                graphene_settings.ATOMIC_MUTATIONS is True
+                or connection.settings_dict.get('ATOMIC_MUTATIONS', False) is True
+            ):
+                with transaction.atomic():
+                    result = execute(schema, document, **execute_options)
+                    if getattr(request, MUTATION_ERRORS_FLAG, False) is True:
+                        transaction.set_rollback(True)
+                return result
+            return execute(schema, document, **execute_options)
+        finally:
+            clear_loaders(request)
+
+    def get_response(self, request, data, show_graphiql=False):
+        query, variables, operation_name, id = self.get_graphql_params(request, data)
+
+        execution_result = self.execute_graphql_request(
+            request, data, query, variables, operation_name, show_graphiql
+        )
+        return self.format_response(request, execution_result, id, show_graphiql)
+
+    def format_response(self, request, execution_result, id, show_graphiql=False):
+        # GraphQLView.get_response, plus the result's `extensions` in the body.
+        if getattr(request, MUTATION_ERRORS_FLAG, False) is True:
+            set_rollback()
+
+        status_code = 200
+        if execution_result:
+            response = {}
+
+            if execution_result.errors:
+                set_rollback()
+                response['errors'] = [self.format_error(e) for e in execution_result.errors]
+
+            if execution_result.errors and any(not getattr(e, 'path', None) for e in execution_result.errors):
+                status_code = 400
+            else:
+                response['data'] = execution_result.data
+
+            if execution_result.extensions:
+                response['extensions'] = execution_result.extensions
+
+            if self.batch:
+                response['id'] = id
+                response['status'] = status_code
+
+            result = self.json_encode(request, response, pretty=show_graphiql)
+        else:
+            result = None
+
+        return result, status_code
+
+
+class AsyncMedspaGraphQLView(MedspaGraphQLView):
+    """MedspaGraphQLView for ASGI servers.
+
+    Queries execute on the event loop with the async ORM and asyncio
+    DataLoaders, so independent root fields resolve concurrently and a waiting
+    request does not hold a thread. Mutations run the synchronous path in a
+    worker thread, where transaction.atomic() and row locks work as usual.
+    """
+
+    view_is_async = True
+    execution_context_class = None
+
+    @method_decorator(ensure_csrf_cookie)
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            if request.method.lower() not in ('get', 'post'):
+                raise HttpError(HttpResponseNotAllowed(['GET', 'POST'], 'GraphQL only supports GET and POST requests.'))
+
+            data = self.parse_body(request)
+            if self.graphiql and self.can_display_graphiql(request, data):
+                return await sync_to_async(super().dispatch)(request, *args, **kwargs)
+
+            if self.batch:
+                responses = [await self.aget_response(request, entry) for entry in data]
+                result = '[{}]'.format(','.join([response[0] for response in responses]))
+                status_code = responses and max(responses, key=lambda response: response[1])[1] or 200
+            else:
+                result, status_code = await self.aget_response(request, data)
+
+            return HttpResponse(status=status_code, content=result, content_type='application/json')
+
+        except HttpError as e:
+            response = e.response
+            response['Content-Type'] = 'application/json'
+            response.content = self.json_encode(request, {'errors': [self.format_error(e)]})
+            return response
+
+    async def aget_response(self, request, data):
+        query, variables, operation_name, id = self.get_graphql_params(request, data)
+        execution_result = await self.aexecute_graphql_request(request, data, query, variables, operation_name)
+        return self.format_response(request, execution_result, id)
+
+    async def aexecute_graphql_request(self, request, data, query, variables, operation_name):
+        result, operation = self.prepare_operation(request, data, query, variables, operation_name, False)
+        if operation is None:
+            return result
+        schema, document, operation_ast, extensions = operation
+
+        if operation_ast is not None and operation_ast.operation == OperationType.MUTATION:
+            result = await sync_to_async(self.execute_document)(
+                request, schema, document, operation_ast, variables, operation_name, DeferredExecutionContext
+            )
+        elif is_cacheable(schema, document, operation_ast):
+            result = await self.aexecute_cached_document(request, schema, document, operation_ast, variables, operation_name)
+        else:
+            result = await self.aexecute_document(request, schema, document, operation_ast, variables, operation_name)
+        return self.add_extensions(request, data, result, extensions)
+
+    async def aexecute_cached_document(self, request, schema, document, operation_ast, variables, operation_name):
+        key = response_cache.make_key(document, operation_ast, variables)
+        data = response_cache.get(key)
+        if data is not None:
+            return ExecutionResult(data=data)
+
+        request.cache_tags = set()
+        started = time.time_ns()
+        try:
+            result = await self.aexecute_document(request, schema, document, operation_ast, variables, operation_name)
+            if not result.errors:
+                response_cache.set(key, result.data, request.cache_tags, read_started(started))
+        finally:
+            request.cache_tags = None
+        return result
+
+    async def aexecute_document(self, request, schema, document, operation_ast, variables, operation_name):
+        request.async_execution = True
+        try:
+            with replica_reads():
+                result = execute(
+                    schema,
+                    document,
+                    root_value=self.get_root_value(request),
+                    context_value=self.get_context(request),
+                    variable_values=variables,
+                    operation_name=operation_name,
+                    middleware=self.get_middleware(request),
+                )
+                if isawaitable(result):
+                    result = await result
+            return result
+        except Exception as e:
+            return ExecutionResult(errors=[e])
+        finally:
+            request.async_execution = False
+
+
+def database_pool_stats():
+    # psycopg_pool counters since the process started; None without a pool.
+    pool = connections['default'].pool
+    if pool is None:
+        return None
+    stats = pool.get_stats()
+    requests = stats.get('requests_num', 0)
+    return {
+        **stats,
+        'connections_in_use': stats['pool_size'] - stats['pool_available'],
+        'avg_wait_ms': stats.get('requests_wait_ms', 0) / requests if requests else 0.0,
+    }
+
+def read_started(started):
+    # A replica may still have served rows from before an invalidation that
+    # happened up to replica_staleness() before the request started.
+    if read_from_replica():
+        return started - int(replica_staleness() * 1e9)
+    return started
+
+def graphql_metrics(request):
+    return JsonResponse({
+        'document_cache': document_cache.stats(),
+        'response_cache': response_cache.stats(),
+        'catalog_cache': catalog_cache.stats(),
+        'replicas': lag_monitor.stats(),
+        'database_pool': database_pool_stats(),
+    })
+
+
+EXPORT_COLUMNS = [
+    'id', 'medspa_id', 'start_time', 'end_time', 'total_duration', 'total_price', 'status', 'service_ids', 'service_names',
+]
+
+
+class Echo:
+    # csv.writer needs a file; this one just hands each row back.
+    def write(self, value):
+        return value
+
+def serialize_appointment(appointment):
+    services = list(appointment.services.all())
+    return {
+        'id': str(appointment.id),
+        'medspa_id': str(appointment.medspa_id),
+        'start_time': appointment.start_time.isoformat(),
+        'end_time': appointment.end_time.isoformat(),
+        'total_duration': appointment.total_duration,
+        'total_price': str(appointment.total_price),
+        'status': appointment.status,
+        'service_ids': [str(service.id) for service in services],
+        'service_names': [service.name for service in services],
+    }
+
+def export_rows_as_ndjson(appointments):
+    for appointment in appointments:
+        yield json.dumps(serialize_appointment(appointment)) + '\n'
+
+def export_rows_as_csv(appointments):
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_COLUMNS)
+    for appointment in appointments:
+        row = serialize_appointment(appointment)
+        row['service_ids'] = '|'.join(row['service_ids'])
+        row['service_names'] = '|'.join(row['service_names'])
+        yield writer.writerow([row[column] for column in EXPORT_COLUMNS])
+
+def export_appointments(request):
+    """Stream appointments as NDJSON (default) or CSV.
+
+    Query parameters: format, medspa_id, status, start, end (ISO 8601, end
+    exclusive). Rows are read through a server-side cursor in chunks of
+    APPOINTMENT_EXPORT_CHUNK_SIZE with services prefetched per chunk, so
+    memory use does not depend on the number of rows exported, under WSGI
+    and ASGI alike.
+    """
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+
+    export_format = request.GET.get('format', 'ndjson')
+    if export_format not in ('ndjson', 'csv'):
+        return HttpResponseBadRequest('format must be "ndjson" or "csv".')
+
+    try:
+        start = parse_export_datetime(request.GET.get('start'))
+        end = parse_export_datetime(request.GET.get('end'))
+    except ValueError as error:
+        return HttpResponseBadRequest(str(error))
+
+    appointments = Appointment.objects.in_range(start, end)
+    medspa_id = request.GET.get('medspa_id')
+    if medspa_id:
+        try:
+            appointments = appointments.filter(medspa_id=uuid.UUID(medspa_id))
+        except ValueError:
+            return HttpResponseBadRequest('medspa_id must be a UUID.')
+    status = request.GET.get('status')
+    if status:
+        appointments = appointments.filter(status=status)
+
+    chunk_size = getattr(settings, 'APPOINTMENT_EXPORT_CHUNK_SIZE', 2000)
+    appointments = (
+        appointments
+        .order_by('start_time', 'id')
+        .prefetch_related(Prefetch('services', queryset=Service.objects.only('id', 'name')))
+        .iterator(chunk_size=chunk_size)
+    )
+
+    if export_format == 'csv':
+        response = StreamingHttpResponse(stream(request, export_rows_as_csv(appointments), chunk_size), content_type='text/csv')
+        response['Content-Disposition'] = 'attachment; filename="appointments.csv"'
+    else:
+        response = StreamingHttpResponse(stream(request, export_rows_as_ndjson(appointments), chunk_size), content_type='application/x-ndjson')
+    return response
+
+def stream(request, lines, chunk_size):
+    # Under ASGI, StreamingHttpResponse reads a sync iterator whole before
+    # sending any of it. Give it an async one that pulls a chunk at a time.
+    if isinstance(request, ASGIRequest):
+        return astream(lines, chunk_size)
+    return lines
+
+async def astream(lines, chunk_size):
+    # The sync thread keeps the server-side cursor on one connection.
+    next_chunk = sync_to_async(lambda: ''.join(itertools.islice(lines, chunk_size)))
+    while chunk := await next_chunk():
+        yield chunk
+
+def parse_export_datetime(value):
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise ValueError(f'Invalid datetime: {value}')
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed